@@ -0,0 +1,53 @@
+"""Helpers to import services' packages from benchmark scripts.
+
+Both services ship their code as a top level `app` package, so they are 
+loaded under distinct aliases to allow using them side by side in one process.
+Packages shared by services, e.g. `local_metrics`, are imported from the
+repository root.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_ENV = {
+    "LOGGING_LEVEL": "WARNING",
+    "PRICES_SOURCE_HOST": "localhost",
+    "PRICES_SOURCE_PORT": "8000",
+    "PRICES_REQUEST_INTERVAL_S": "0",
+}
+
+
+def load_service(service_dir: str, alias: str):
+    """Imports `<service_dir>/app` package under provided alias"""
+    for key, value in DEFAULT_ENV.items():
+        os.environ.setdefault(key, value)
+
+    if alias in sys.modules:
+        return sys.modules[alias]
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    package_dir = os.path.join(ROOT_DIR, service_dir, "app")
+    spec = importlib.util.spec_from_file_location(
+        alias, os.path.join(package_dir, "__init__.py"),
+        submodule_search_locations=[package_dir])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[alias] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_analyzer_module(name: str):
+    """E.g. `load_analyzer_module("utils.fetch_requests")`"""
+    load_service("prices_analyzer", "prices_analyzer_app")
+    return importlib.import_module(f"prices_analyzer_app.{name}")
+
+
+def load_generator_module(name: str):
+    """E.g. `load_generator_module("core.assets_manager")`"""
+    load_service("prices_generator", "prices_generator_app")
+    return importlib.import_module(f"prices_generator_app.{name}")
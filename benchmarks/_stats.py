@@ -0,0 +1,27 @@
+"""Measurement helpers shared by benchmark scripts."""
+import asyncio
+import resource
+import statistics
+import sys
+
+
+def percentile(values, q: int) -> float:
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def measure_loop_lag(lags, interval_s: float = 0.01):
+    """Appends event loop lag to `lags` every `interval_s` until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval_s)
+        lags.append(loop.time() - started - interval_s)
+
+
+def get_max_rss_mb() -> float:
+    """Peak resident memory of the process"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return max_rss / 1024 ** 2 if sys.platform == "darwin" else max_rss / 1024
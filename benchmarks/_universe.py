@@ -0,0 +1,40 @@
+"""Helpers to generate synthetic universes of assets and markets."""
+import os
+from typing import List
+
+import yaml
+
+
+def get_assets(count: int) -> List[str]:
+    return [f"Asset {i}" for i in range(count)]
+
+
+def get_markets(count: int) -> List[str]:
+    return [f"Market {i}" for i in range(count)]
+
+
+def write_price_config(config_dir: str, assets_count: int, markets_count: int,
+                       **price_config) -> str:
+    """Writes generator's price config for a synthetic universe into 
+    `config_dir`. Returns path of the main config file, to be passed with 
+    PRICE_CONFIG_FILE environment variable"""
+    with open(os.path.join(config_dir, "assets.yaml"), "w") as file:
+        yaml.safe_dump(get_assets(assets_count), file)
+    with open(os.path.join(config_dir, "markets.yaml"), "w") as file:
+        yaml.safe_dump(get_markets(markets_count), file)
+
+    config_filepath = os.path.join(config_dir, "price_config.yaml")
+    with open(config_filepath, "w") as file:
+        yaml.safe_dump({
+            "price_config": {
+                "price_min": 1,
+                "price_max": 10000,
+                "spread_min": 0.5,
+                "spread_max": 5,
+                "price_change_max": 0.001,
+                **price_config,
+            },
+            "assets_file": "assets.yaml",
+            "markets_file": "markets.yaml",
+        }, file)
+    return config_filepath
@@ -0,0 +1,93 @@
+"""Measures `ArbitrageDetector` throughput at a large universe.
+
+Quotes for all asset / market pairs are processed concurrently, one task per
+pair, the same way analyzer's fetch loops do it:
+
+    python -m benchmarks.bench_detector --assets 100 --markets 8 --rounds 50
+
+With `--batch` each round is processed as one prices snapshot instead.
+With `--index` detector maintains the live opportunity index, and the
+cost of a top 10 query is reported too.
+
+Detectors that predate `process_price` are driven through their
+`check_for_arbitrage` + `price_update` API, so the script can be run on older
+revisions to compare results.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from ._loader import load_analyzer_module
+
+
+detector_module = load_analyzer_module("core.detector")
+opportunities_module = load_analyzer_module("core.opportunities")
+schemas = load_analyzer_module("utils.schemas")
+
+
+def make_quotes(assets, markets, rounds: int, seed: int = 42):
+    rnd = random.Random(seed)
+    base_prices = {asset: rnd.uniform(1, 10000) for asset in assets}
+    return [
+        [schemas.AssetPriceFromApi(
+            name=asset, market=market,
+            price=base_prices[asset] * (1 + rnd.uniform(-0.03, 0.03)),
+            spread=rnd.uniform(0.5, 5))
+         for asset in assets for market in markets]
+        for _ in range(rounds)
+    ]
+
+
+async def process(detector, asset_price):
+    if hasattr(detector, "process_price"):
+        await detector.process_price(asset_price)
+    else:
+        await detector.check_for_arbitrage(asset_price)
+        await asyncio.create_task(detector.price_update(asset_price))
+
+
+async def main(args):
+    assets = [f"Asset {i}" for i in range(args.assets)]
+    markets = [f"Market {i}" for i in range(args.markets)]
+    quotes_rounds = make_quotes(assets, markets, args.rounds)
+
+    detector = detector_module.ArbitrageDetector()
+    # set universe directly, to support older constructors too
+    detector.assets_list, detector.markets_list = assets, markets
+    detector.prices_dict = {}
+    detector._initialize_prices()
+    if args.index:
+        detector.opportunity_index = opportunities_module.OpportunityIndex()
+
+    started = time.perf_counter()
+    for quotes in quotes_rounds:
+        if args.batch:
+            await detector.process_prices(quotes)
+        else:
+            await asyncio.gather(*(process(detector, quote) for quote in quotes))
+    elapsed = time.perf_counter() - started
+
+    quotes_count = len(assets) * len(markets) * args.rounds
+    print(f"universe    : {len(assets)} assets x {len(markets)} markets")
+    print(f"quotes      : {quotes_count}")
+    print(f"elapsed     : {elapsed:.3f} s")
+    print(f"throughput  : {quotes_count / elapsed:,.0f} quotes/s")
+    if args.index:
+        queries = 10000
+        started = time.perf_counter()
+        for _ in range(queries):
+            detector.opportunity_index.get_top(10)
+        query_us = (time.perf_counter() - started) / queries * 1e6
+        print(f"top 10      : {query_us:.1f} us of {len(detector.opportunity_index)} opportunities")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--batch", action="store_true")
+    parser.add_argument("--index", action="store_true")
+    asyncio.run(main(parser.parse_args()))
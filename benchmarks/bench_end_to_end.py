@@ -0,0 +1,270 @@
+"""End-to-end load and latency benchmark of both services.
+
+Generator app is run in-process and analyzer's `PriceFetcher` and
+`ArbitrageDetector` poll it through ASGI transport, so neither network nor
+Docker is needed:
+
+    python -m benchmarks.bench_end_to_end --assets 100 --markets 8 --interval 0.1
+
+Reported metrics:
+- quotes_per_s: quotes processed by detector
+- requests_per_s: requests served by generator
+- detection_latency_*: from generator's price update to detector having
+  processed that price version
+- versions_detected_ratio: share of price versions generated during the run
+  which were processed by detector
+- loop_lag_*: lag of the event loop shared by both services
+- max_rss_mb: peak memory of the process
+
+Results are compared against a scenario with the same parameters in the
+baseline file, if any. `--save-baseline` stores them there instead. With
+`--check` the script exits with code 1 if any metric regressed by more than
+`--tolerance`.
+
+Streaming mode is not supported: ASGI transport buffers whole responses.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+from ._loader import ROOT_DIR, load_analyzer_module, load_generator_module
+from ._stats import get_max_rss_mb, measure_loop_lag, percentile
+from ._universe import get_assets, get_markets, write_price_config
+
+
+DEFAULT_BASELINE_FILE = os.path.join(ROOT_DIR, "benchmarks", "baseline.json")
+# metrics which are better when lower, all others are better when higher
+LOWER_IS_BETTER = ("detection_latency_", "loop_lag_", "max_rss_mb")
+
+
+class LimitedTransport(httpx.AsyncBaseTransport):
+    """Limits number of concurrent requests, as a connection pool would,
+    and counts them"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, concurrency: int):
+        self.transport = transport
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests_count = 0
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async with self.semaphore:
+            self.requests_count += 1
+            response = await self.transport.handle_async_request(request)
+        # in-process requests may complete without suspending, give other
+        # tasks a chance to run as network I/O would
+        await asyncio.sleep(0)
+        return response
+
+
+class LatencyRecorder:
+    """Records generation time of each price version in generator and its
+    processing time in detector"""
+
+    def __init__(self, assets_manager):
+        self.assets_manager = assets_manager
+        self.generated = {}  # (pair id, version) -> generation time
+        self.generated_count = 0
+        self.latencies = []
+
+
+    def reset(self) -> None:
+        self.generated.clear()
+        self.generated_count = 0
+        self.latencies = []
+
+
+    def wrap_assets_manager(self) -> None:
+        assets_manager = self.assets_manager
+        update_prices = assets_manager.update_prices
+
+        def update_prices_recorded(pairs_ids):
+            update_prices(pairs_ids)
+            now = time.perf_counter()
+            versions = assets_manager.versions[pairs_ids].tolist()
+            for pair_id, version in zip(pairs_ids, versions):
+                self.generated[(int(pair_id), version)] = now
+            self.generated_count += len(versions)
+
+        assets_manager.update_prices = update_prices_recorded
+
+
+    def wrap_detector(self, detector) -> None:
+        process_price = detector.process_price
+        process_prices = detector.process_prices
+
+        async def process_price_recorded(asset_price):
+            result = await process_price(asset_price)
+            self.record([asset_price])
+            return result
+
+        async def process_prices_recorded(assets_prices):
+            result = await process_prices(assets_prices)
+            self.record(assets_prices)
+            return result
+
+        detector.process_price = process_price_recorded
+        detector.process_prices = process_prices_recorded
+
+
+    def record(self, assets_prices) -> None:
+        now = time.perf_counter()
+        for asset_price in assets_prices:
+            pair_id = self.assets_manager.get_pair_id(asset_price.name, asset_price.market)
+            generated_at = self.generated.pop((pair_id, asset_price.version), None)
+            if generated_at is not None:
+                self.latencies.append(now - generated_at)
+
+
+async def run(args) -> dict:
+    generator_app = load_generator_module("app")
+    analyzer_app = load_analyzer_module("app")
+    fetch_requests = load_analyzer_module("utils.fetch_requests")
+    detector_module = load_analyzer_module("core.detector")
+
+    app = generator_app.app
+    lags = []
+    async with app.router.lifespan_context(app):
+        recorder = LatencyRecorder(app.state.assets_manager)
+        recorder.wrap_assets_manager()
+
+        transport = LimitedTransport(httpx.ASGITransport(app=app), args.concurrency)
+        price_fetcher = fetch_requests.PriceFetcher(
+            host="generator", port="80", transport=transport)
+        detector = detector_module.ArbitrageDetector(
+            assets_list=get_assets(args.assets), markets_list=get_markets(args.markets))
+        recorder.wrap_detector(detector)
+
+        await price_fetcher.start()
+        analyzer_task = asyncio.create_task(analyzer_app.run(price_fetcher, detector))
+        lag_task = asyncio.create_task(measure_loop_lag(lags))
+
+        await asyncio.sleep(args.warmup)
+        recorder.reset()
+        lags.clear()
+        quotes_started = detector.quotes_processed
+        requests_started = transport.requests_count
+        started = time.perf_counter()
+
+        await asyncio.sleep(args.duration)
+
+        elapsed = time.perf_counter() - started
+        quotes = detector.quotes_processed - quotes_started
+        requests = transport.requests_count - requests_started
+        analyzer_task.cancel()
+        lag_task.cancel()
+        await asyncio.gather(analyzer_task, lag_task, return_exceptions=True)
+        await price_fetcher.close()
+
+    latencies = recorder.latencies
+    return {
+        "quotes_per_s": quotes / elapsed,
+        "requests_per_s": requests / elapsed,
+        "detection_latency_p50_ms": percentile(latencies, 50) * 1000,
+        "detection_latency_p99_ms": percentile(latencies, 99) * 1000,
+        "versions_detected_ratio": len(latencies) / max(recorder.generated_count, 1),
+        "loop_lag_p50_ms": percentile(lags, 50) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": max(lags, default=float("nan")) * 1000,
+        "max_rss_mb": get_max_rss_mb(),
+    }
+
+
+def get_scenario(args) -> str:
+    return (f"{args.mode}-{args.assets}x{args.markets}-interval_{args.interval}"
+            f"-concurrency_{args.concurrency}"
+            + ("-fixed_interval" if args.fixed_interval else ""))
+
+
+def load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, scenario: str, args, results: dict) -> None:
+    baseline = load_baseline(path)
+    baseline[scenario] = {
+        "params": {key: value for key, value in vars(args).items()
+                   if key not in ("baseline", "save_baseline", "check", "tolerance")},
+        "results": results,
+    }
+    with open(path, "w") as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def compare(results: dict, baseline_results: dict, tolerance: float) -> list:
+    """Prints results next to the baseline. Returns regressed metrics"""
+    regressions = []
+    print(f"{'':<28}{'current':>14}{'baseline':>14}{'change':>10}")
+    for metric, value in results.items():
+        baseline_value = baseline_results.get(metric)
+        if baseline_value is None or not baseline_value:
+            print(f"{metric:<28}{value:>14.3f}{'-':>14}")
+            continue
+        change = (value - baseline_value) / abs(baseline_value)
+        worse = change > tolerance if metric.startswith(LOWER_IS_BETTER) else change < -tolerance
+        if worse:
+            regressions.append(metric)
+        print(f"{metric:<28}{value:>14.3f}{baseline_value:>14.3f}{change:>+10.1%}"
+              + ("  REGRESSION" if worse else ""))
+    return regressions
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets,
+            price_update_interval_min=args.update_interval_min,
+            price_update_interval_max=args.update_interval_max)
+        # analyzer reads its settings on import
+        os.environ["ANALYZER_MODE"] = args.mode
+        os.environ["PRICES_REQUEST_INTERVAL_S"] = str(args.interval)
+        os.environ["ADAPTIVE_POLLING"] = str(not args.fixed_interval)
+        results = asyncio.run(run(args))
+
+    scenario = get_scenario(args)
+    print(f"scenario: {scenario}, {args.duration} s")
+    if args.save_baseline:
+        save_baseline(args.baseline, scenario, args, results)
+        for metric, value in results.items():
+            print(f"{metric:<28}{value:>14.3f}")
+        print(f"saved to {args.baseline}")
+        return
+
+    baseline_results = load_baseline(args.baseline).get(scenario, {}).get("results", {})
+    regressions = compare(results, baseline_results, args.tolerance)
+    if args.check and regressions:
+        print(f"regressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("pair", "snapshot"), default="pair")
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--interval", type=float, default=0.1,
+                        help="analyzer's PRICES_REQUEST_INTERVAL_S")
+    parser.add_argument("--fixed-interval", action="store_true",
+                        help="disable analyzer's adaptive polling")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="max concurrent requests to generator")
+    parser.add_argument("--update-interval-min", type=float, default=3)
+    parser.add_argument("--update-interval-max", type=float, default=6)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    main(parser.parse_args())
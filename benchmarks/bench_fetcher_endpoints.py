@@ -0,0 +1,133 @@
+"""Measures single price fetch latency over several generator replicas:
+
+    python -m benchmarks.bench_fetcher_endpoints --replicas 3 --duration 10
+
+Replicas are simulated in-process by an HTTP transport: each answers after
+a random delay, one of them is slow on `--slow-share` of requests, and
+another one is down for the middle third of the run. Compares:
+- proxy: a single endpoint in front of replicas, which picks them round
+  robin, adds `--proxy-ms` and retries a request on the next replica if one
+  is down, as the nginx upstream does
+- balanced: `PriceFetcher` with all replicas' endpoints, hedging disabled
+- hedged: the same with hedged requests
+Reports latency percentiles, failed fetches and requests sent per fetch.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+
+import httpx
+
+from ._loader import load_analyzer_module
+from ._stats import percentile
+
+
+# failed requests to the replica which is down are expected
+os.environ.setdefault("LOGGING_LEVEL", "CRITICAL")
+fetch_requests = load_analyzer_module("utils.fetch_requests")
+
+
+class ReplicasTransport(httpx.AsyncBaseTransport):
+    """Answers price requests of `replica_<i>` hosts, and of `proxy` host by
+    forwarding them to replicas round robin"""
+
+    def __init__(self, args, started: float):
+        self.args = args
+        self.started = started
+        self.replicas = [f"replica_{idx}" for idx in range(args.replicas)]
+        self.round_robin = itertools.cycle(self.replicas)
+        self.requests_count = 0
+
+
+    def is_down(self, replica: str) -> bool:
+        elapsed = (time.perf_counter() - self.started) / self.args.duration
+        return replica == self.replicas[-1] and 1 / 3 <= elapsed < 2 / 3
+
+
+    async def answer(self, replica: str, request: httpx.Request) -> httpx.Response:
+        self.requests_count += 1
+        if self.is_down(replica):
+            raise httpx.ConnectError("Connection refused", request=request)
+        delay_s = random.lognormvariate(0, 0.3) * self.args.latency_ms / 1000
+        if replica == self.replicas[0] and random.random() < self.args.slow_share:
+            delay_s += self.args.slow_ms / 1000
+        await asyncio.sleep(delay_s)
+        quote = {"name": request.url.params["asset_name"],
+                 "market": request.url.params["market"],
+                 "price": 100.0, "spread": 0.1, "version": 1,
+                 "generated_at": time.time()}
+        return httpx.Response(200, content=json.dumps(quote).encode(),
+                              headers={"Content-Type": "application/json"})
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host != "proxy":
+            return await self.answer(request.url.host, request)
+        await asyncio.sleep(self.args.proxy_ms / 1000)
+        for _ in self.replicas:
+            try:
+                return await self.answer(next(self.round_robin), request)
+            except httpx.ConnectError:
+                continue
+        return httpx.Response(502)
+
+
+async def measure(variant: str, args) -> dict:
+    transport = ReplicasTransport(args, time.perf_counter())
+    os.environ["FETCHER_HEDGING"] = str(variant == "hedged")
+    endpoints = (["proxy:80"] if variant == "proxy"
+                 else [f"{replica}:8000" for replica in transport.replicas])
+    price_fetcher = fetch_requests.PriceFetcher(
+        endpoints=endpoints, conditional_requests=False, transport=transport)
+    latencies, failed = [], 0
+    deadline = transport.started + args.duration
+
+    async def worker(worker_idx: int):
+        nonlocal failed
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            quote = await price_fetcher.fetch_price(f"Asset_{worker_idx}", "US")
+            if quote is None:
+                failed += 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+    async with price_fetcher:
+        await asyncio.gather(*(worker(idx) for idx in range(args.concurrency)))
+    fetches = len(latencies) + failed
+    return {
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "failed": failed,
+        "requests_per_fetch": transport.requests_count / max(fetches, 1),
+    }
+
+
+def main(args):
+    results = {variant: asyncio.run(measure(variant, args))
+               for variant in ("proxy", "balanced", "hedged")}
+    print(f"{args.replicas} replicas, {args.latency_ms} ms latency, {args.slow_share:.0%}"
+          f" requests of one replica +{args.slow_ms} ms, one replica down 1/3 of time")
+    metrics = list(next(iter(results.values())))
+    print(f"{'':<10}" + "".join(f"{metric:>20}" for metric in metrics))
+    for variant, result in results.items():
+        print(f"{variant:<10}" + "".join(f"{result[metric]:>20.2f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--slow-share", type=float, default=0.05)
+    parser.add_argument("--slow-ms", type=float, default=50.0)
+    parser.add_argument("--proxy-ms", type=float, default=0.5)
+    main(parser.parse_args())
@@ -0,0 +1,130 @@
+"""Measures load analyzer puts on a prices source which is down, and how
+fast it recovers once the source is back:
+
+    python -m benchmarks.bench_fetcher_outage --assets 100 --markets 8
+
+Runs analyzer's per pair polling loops against a simulated prices source,
+which refuses connections during the middle of the run. Compares current
+loops, which retry with jittered backoff through fetcher's circuit breaker,
+with the previous ones, which retried every 0.1 s. Reports requests/sec
+reaching the source before and during the outage, and time it took for all
+pairs to get a quote after the source came back.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from ._loader import load_analyzer_module
+from ._stats import percentile
+
+
+os.environ.setdefault("LOGGING_LEVEL", "CRITICAL")
+os.environ.setdefault("PRICES_REQUEST_INTERVAL_S", "0.5")
+os.environ.setdefault("ADAPTIVE_POLLING", "False")
+os.environ.setdefault("METRICS_ENABLED", "False")
+app = load_analyzer_module("app")
+fetch_requests = load_analyzer_module("utils.fetch_requests")
+quotes_queue = load_analyzer_module("core.quotes_queue")
+
+
+class OutageTransport(httpx.AsyncBaseTransport):
+    """Prices source answering after `latency_s`, which refuses
+    connections between `down_at` and `up_at`"""
+
+    def __init__(self, down_at: float, up_at: float, latency_s: float):
+        self.down_at = down_at
+        self.up_at = up_at
+        self.latency_s = latency_s
+        self.requests = {"before": 0, "during": 0, "after": 0}
+        # time of the first quote of each pair after the source came back
+        self.recovered_at = {}
+
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        now = time.perf_counter()
+        phase = "before" if now < self.down_at else "during" if now < self.up_at else "after"
+        self.requests[phase] += 1
+        if phase == "during":
+            raise httpx.ConnectError("Connection refused", request=request)
+        await asyncio.sleep(self.latency_s)
+        pair = (request.url.params["asset_name"], request.url.params["market"])
+        if phase == "after":
+            self.recovered_at.setdefault(pair, time.perf_counter())
+        quote = {"name": pair[0], "market": pair[1], "price": 100.0, "spread": 0.1,
+                 "version": 1, "generated_at": time.time()}
+        return httpx.Response(200, content=json.dumps(quote).encode(),
+                              headers={"Content-Type": "application/json"})
+
+
+async def fetch_and_queue_price_legacy(price_fetcher, queue, asset: str, market: str):
+    """Polling loop before backoff: a failed request is retried in 0.1 s"""
+    while True:
+        asset_data = await price_fetcher.fetch_price(asset=asset, market=market)
+        if asset_data:
+            queue.put(asset_data)
+            await asyncio.sleep(app.prices_request_interval_s)
+        else:
+            await asyncio.sleep(0.1)
+
+
+async def measure(variant: str, args) -> dict:
+    started = time.perf_counter()
+    down_at, up_at = started + args.healthy, started + args.healthy + args.outage
+    transport = OutageTransport(down_at, up_at, args.latency_ms / 1000)
+    if variant == "legacy":
+        # neither circuit breaker nor concurrency cap
+        os.environ["FETCHER_EJECT_AFTER_FAILURES"] = str(10 ** 9)
+        os.environ["FETCHER_MAX_CONCURRENCY"] = str(10 ** 6)
+        loop_function = fetch_and_queue_price_legacy
+    else:
+        os.environ.pop("FETCHER_EJECT_AFTER_FAILURES", None)
+        os.environ.pop("FETCHER_MAX_CONCURRENCY", None)
+        loop_function = app.fetch_and_queue_price
+    price_fetcher = fetch_requests.PriceFetcher(
+        host="generator", port="8000", conditional_requests=False, transport=transport)
+    queue = quotes_queue.CoalescingQueue(args.assets * args.markets)
+    pairs = [(f"Asset_{asset_idx}", f"Market_{market_idx}")
+             for asset_idx in range(args.assets) for market_idx in range(args.markets)]
+
+    async with price_fetcher:
+        tasks = [asyncio.ensure_future(loop_function(price_fetcher, queue, asset, market))
+                 for asset, market in pairs]
+        await asyncio.sleep(up_at + args.recovery - time.perf_counter())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    recovery_s = [transport.recovered_at[pair] - up_at if pair in transport.recovered_at
+                  else float("inf") for pair in pairs]
+    return {
+        "req/s healthy": transport.requests["before"] / args.healthy,
+        "req/s outage": transport.requests["during"] / args.outage,
+        "recovery p50 s": percentile(recovery_s, 50),
+        "recovery max s": max(recovery_s),
+    }
+
+
+def main(args):
+    results = {variant: asyncio.run(measure(variant, args))
+               for variant in ("legacy", "backoff")}
+    print(f"{args.assets * args.markets} pairs, {args.outage} s outage")
+    metrics = list(next(iter(results.values())))
+    print(f"{'':<10}" + "".join(f"{metric:>16}" for metric in metrics))
+    for variant, result in results.items():
+        print(f"{variant:<10}" + "".join(f"{result[metric]:>16.2f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--healthy", type=float, default=3.0)
+    parser.add_argument("--outage", type=float, default=6.0)
+    parser.add_argument("--recovery", type=float, default=8.0)
+    main(parser.parse_args())
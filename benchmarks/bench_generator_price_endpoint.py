@@ -0,0 +1,98 @@
+"""Compares requests/sec and latency of generator's `GET /price`, served from
+pre-encoded quotes cache, against the previous implementation: a dict lookup
+in a thread pool followed by `PriceQuoteOut` serialization per request.
+
+    python -m benchmarks.bench_generator_price_endpoint --concurrency 32
+
+Generator is run in-process and requested through ASGI transport, so the
+numbers include client overhead, but no network.
+"""
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from ._loader import load_generator_module
+from ._universe import get_assets, get_markets, write_price_config
+
+
+def add_legacy_price_route(generator_app):
+    """Registers previous `/price` implementation as `/price_legacy`"""
+    app = generator_app.app
+    schemas = load_generator_module("utils.schemas")
+    thread_pool = ThreadPoolExecutor(max_workers=10)
+
+    def get_curr_asset_price(asset):
+        assets_manager = app.state.assets_manager
+        pair_id = assets_manager.get_pair_id(asset.name, asset.market)
+        if pair_id is None:
+            return None
+        return assets_manager.get_asset_price(pair_id)
+
+    @app.get('/price_legacy')
+    async def get_price_legacy(asset_name, market) -> schemas.PriceQuoteOut:
+        asset = schemas.Asset(name=asset_name, market=market)
+        price_data = await asyncio.get_event_loop().run_in_executor(
+            thread_pool, get_curr_asset_price, asset)
+        return price_data
+
+
+async def run(client, path: str, assets, markets, args) -> dict:
+    latencies = []
+    deadline = time.perf_counter() + args.duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            params = {"asset_name": random.choice(assets), "market": random.choice(markets)}
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests_per_s": len(latencies) / args.duration,
+        "p50_ms": quantiles[49] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        generator_app = load_generator_module("app")
+        add_legacy_price_route(generator_app)
+        app = generator_app.app
+        assets, markets = get_assets(args.assets), get_markets(args.markets)
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://generator") as client:
+                results = {
+                    "executor + model": await run(client, "/price_legacy", assets, markets, args),
+                    "quotes cache": await run(client, "/price", assets, markets, args),
+                }
+
+    print(f"universe: {args.assets} assets x {args.markets} markets,"
+          f" concurrency {args.concurrency}")
+    print(f"{'':<16}" + "".join(f"{name:>18}" for name in results))
+    for metric in results["quotes cache"]:
+        print(f"{metric:<16}" + "".join(f"{result[metric]:>18.3f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
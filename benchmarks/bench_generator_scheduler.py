@@ -0,0 +1,107 @@
+"""Measures generator's event loop overhead and `/price` latency at a large
+universe, with prices updated by the single scheduler task against the
+previous approach of one infinite task per asset / market pair:
+
+    python -m benchmarks.bench_generator_scheduler --assets 1250 --markets 8
+
+Generator is run in-process and requested through ASGI transport, so no
+network is involved.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import httpx
+
+from ._loader import load_generator_module
+from ._stats import measure_loop_lag, percentile
+from ._universe import get_assets, get_markets, write_price_config
+
+
+def legacy_start_background_tasks(app):
+    """Previous implementation: a separate infinite task per pair"""
+    assets_manager = app.state.assets_manager
+
+    async def update_asset_price_loop(pair_id):
+        while True:
+            asset = assets_manager.update_asset_price(pair_id)
+            app.state.price_broadcaster.publish(asset)
+            await asyncio.sleep(round(random.uniform(3, 6), 1))
+
+    async def run_all():
+        await asyncio.gather(*(update_asset_price_loop(pair_id)
+                               for pair_id in range(assets_manager.pairs_count)))
+
+    app.state.price_scheduler_task = asyncio.create_task(run_all())
+
+
+async def run(generator_app, args) -> dict:
+    app = generator_app.app
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    lags, latencies = [], []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://generator") as client:
+            lag_task = asyncio.create_task(measure_loop_lag(lags))
+            cpu_started = time.process_time()
+            deadline = time.perf_counter() + args.duration
+
+            while time.perf_counter() < deadline:
+                params = {"asset_name": random.choice(assets), "market": random.choice(markets)}
+                started = time.perf_counter()
+                response = await client.get("/price", params=params)
+                latencies.append(time.perf_counter() - started)
+                response.raise_for_status()
+                # in-process requests may complete without suspending, give
+                # other tasks a chance to run as network I/O would
+                await asyncio.sleep(0)
+
+            cpu_used = time.process_time() - cpu_started
+            tasks_count = len(asyncio.all_tasks())
+            lag_task.cancel()
+
+    return {
+        "tasks": tasks_count,
+        "cpu_s_per_s": cpu_used / args.duration,
+        "loop_lag_p50_ms": percentile(lags, 50) * 1000,
+        "loop_lag_p99_ms": percentile(lags, 99) * 1000,
+        "loop_lag_max_ms": max(lags) * 1000,
+        "price_p50_ms": percentile(latencies, 50) * 1000,
+        "price_p99_ms": percentile(latencies, 99) * 1000,
+        "requests": len(latencies),
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        generator_app = load_generator_module("app")
+
+        results = {"scheduler": await run(generator_app, args)}
+
+        start_background_tasks = generator_app.start_background_tasks
+        generator_app.start_background_tasks = legacy_start_background_tasks
+        try:
+            results["task per pair"] = await run(generator_app, args)
+        finally:
+            generator_app.start_background_tasks = start_background_tasks
+
+    print(f"universe: {args.assets} assets x {args.markets} markets")
+    metrics = list(results["scheduler"].keys())
+    print(f"{'':<18}" + "".join(f"{name:>16}" for name in results))
+    for metric in metrics:
+        print(f"{metric:<18}" + "".join(f"{result[metric]:>16.3f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=1250)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,122 @@
+"""Measures generator's startup time and peak memory at a large universe:
+
+    python -m benchmarks.bench_generator_startup --assets 125000 --markets 8
+
+Compares current `AssetsManager` initialization, which generates prices of
+all pairs at once from counter-based random streams, with the previous one,
+which parsed config with the pure Python YAML loader and generated prices
+asset by asset with `random` in a thread pool. Each variant runs in a fresh
+process, so its peak memory is measured separately.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from ._loader import load_generator_module
+from ._stats import get_max_rss_mb
+from ._universe import write_price_config
+
+
+def create_legacy_class(assets_manager_module, utils):
+
+    class LegacyAssetsManager(assets_manager_module.AssetsManager):
+
+        def _get_price_config(self, config_file: str):
+            utils.YamlLoader = yaml.SafeLoader
+            return super()._get_price_config(config_file)
+
+
+        def _set_asset_initial_prices(self, asset_idx: int, max_diff=0.03) -> None:
+            price_config = self.price_config
+            base_price = round(price_config.price_min + (
+                price_config.price_max - price_config.price_min) * random.random(), 4)
+            markets_count = len(self.markets)
+            for market_idx in range(markets_count):
+                market_coef = random.uniform(-max_diff, max_diff)
+                pair_id = asset_idx * markets_count + market_idx
+                self.prices[pair_id] = base_price * (1 + market_coef)
+                self.spreads[pair_id] = round(
+                    random.uniform(price_config.spread_min, price_config.spread_max), 1)
+
+
+        def _construct_prices(self) -> None:
+            with ThreadPoolExecutor() as executor:
+                futures = [executor.submit(self._set_asset_initial_prices, asset_idx)
+                           for asset_idx in range(len(self.assets))]
+                for future in futures:
+                    future.result()
+
+    return LegacyAssetsManager
+
+
+def measure(variant: str, config_filepath: str) -> dict:
+    """Runs in a fresh process"""
+    assets_manager_module = load_generator_module("core.assets_manager")
+    utils = load_generator_module("utils.utils")
+    assets_manager_class = (create_legacy_class(assets_manager_module, utils)
+                            if variant == "legacy" else assets_manager_module.AssetsManager)
+
+    timings = {}
+    get_price_config = assets_manager_class._get_price_config
+    construct_prices = assets_manager_class._construct_prices
+
+    def timed(name, method):
+        def wrapper(self, *args):
+            started = time.perf_counter()
+            result = method(self, *args)
+            timings[name] = time.perf_counter() - started
+            return result
+        return wrapper
+
+    assets_manager_class._get_price_config = timed("config_s", get_price_config)
+    assets_manager_class._construct_prices = timed("prices_s", construct_prices)
+
+    rss_before = get_max_rss_mb()
+    started = time.perf_counter()
+    assets_manager = assets_manager_class(config_filepath)
+    timings["total_s"] = time.perf_counter() - started
+    timings["peak_rss_mb"] = get_max_rss_mb() - rss_before
+    timings["pairs"] = assets_manager.pairs_count
+    return timings
+
+
+def main(args):
+    if args.variant:
+        print(json.dumps(measure(args.variant, args.config)))
+        return
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        config_filepath = write_price_config(config_dir, args.assets, args.markets)
+        results = {}
+        for variant in ("legacy", "vectorized"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_generator_startup",
+                 "--variant", variant, "--config", config_filepath],
+                check=True, capture_output=True, text=True,
+                env={**os.environ, "LOGGING_LEVEL": "WARNING"}).stdout
+            results[variant] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"universe: {args.assets} assets x {args.markets} markets,"
+          f" {results['vectorized']['pairs']} pairs")
+    print(f"{'':<14}" + "".join(f"{variant:>14}" for variant in results))
+    for metric in ("config_s", "prices_s", "total_s", "peak_rss_mb"):
+        print(f"{metric:<14}" + "".join(f"{result[metric]:>14.3f}"
+                                        for result in results.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=125000)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--variant", choices=["legacy", "vectorized"], help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    main(parser.parse_args())
@@ -0,0 +1,87 @@
+"""Compares memory and update cost per pair of generator's compact prices
+store against the previous dict of pydantic models:
+
+    python -m benchmarks.bench_generator_store --assets 125000 --markets 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from ._loader import load_generator_module
+from ._universe import write_price_config
+
+
+def measure_legacy(assets_manager, updates: int) -> dict:
+    """Previous store: dict of (asset, market) -> AssetPrice model, each
+    update modifies one model"""
+    schemas = load_generator_module("utils.schemas")
+    tracemalloc.start()
+    prices_dict = {
+        (asset, market): schemas.AssetPrice(name=asset, market=market,
+                                            price=random.uniform(1, 10000),
+                                            spread=round(random.uniform(0.5, 5), 1))
+        for asset in assets_manager.assets for market in assets_manager.markets
+    }
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    keys = list(prices_dict.keys())
+    started = time.perf_counter()
+    for _ in range(updates):
+        asset = prices_dict[random.choice(keys)]
+        asset.price = round(asset.price * (1 + random.uniform(-0.001, 0.001)), 4)
+        asset.spread = round(random.uniform(0.5, 5), 1)
+        prices_dict[(asset.name, asset.market)] = asset
+    elapsed = time.perf_counter() - started
+
+    return {"bytes_per_pair": memory / len(prices_dict),
+            "update_us_per_pair": elapsed / updates * 1e6}
+
+
+def measure_compact(assets_manager, updates: int, batch_size: int) -> dict:
+    memory = assets_manager.prices.nbytes + assets_manager.spreads.nbytes
+    pairs_ids = np.random.default_rng(0).integers(
+        0, assets_manager.pairs_count, size=updates)
+
+    started = time.perf_counter()
+    for i in range(0, updates, batch_size):
+        assets_manager.update_prices(pairs_ids[i:i + batch_size])
+    elapsed = time.perf_counter() - started
+
+    return {"bytes_per_pair": memory / assets_manager.pairs_count,
+            "update_us_per_pair": elapsed / updates * 1e6}
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        assets_manager_module = load_generator_module("core.assets_manager")
+        utils = load_generator_module("utils.utils")
+        assets_manager = assets_manager_module.AssetsManager(utils.get_config_filepath())
+
+    results = {
+        "dict of models": measure_legacy(assets_manager, args.updates),
+        "compact store": measure_compact(assets_manager, args.updates, args.batch_size),
+    }
+
+    print(f"universe: {args.assets} assets x {args.markets} markets,"
+          f" {args.updates} updates, batch size {args.batch_size}")
+    print(f"{'':<20}" + "".join(f"{name:>18}" for name in results))
+    for metric in results["compact store"]:
+        print(f"{metric:<20}" + "".join(f"{result[metric]:>18.3f}" for result in results.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=125000)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--updates", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,118 @@
+"""Measures per quote overhead of logging on analyzer's hot path:
+
+    python -m benchmarks.bench_logging --quotes 20000
+
+Each quote is processed by the detector and logged at DEBUG, as fetcher
+does on receive. Compares the previous setup, a synchronous stream handler
+with eagerly formatted f-strings, with the queue handler, written by a
+background thread, and lazily formatted messages. Both write to a file, at
+INFO and DEBUG levels. `--write-ms` makes every write slower, e.g. as a
+blocked stdout.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import queue
+import tempfile
+import time
+
+from ._loader import load_analyzer_module
+from ._universe import get_assets, get_markets
+from .bench_detector import make_quotes
+
+
+detector_module = load_analyzer_module("core.detector")
+logger_module = load_analyzer_module("utils.logger")
+
+
+class SlowFileHandler(logging.FileHandler):
+
+    def __init__(self, path: str, write_s: float):
+        super().__init__(path)
+        self.write_s = write_s
+
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.write_s:
+            time.sleep(self.write_s)
+        super().emit(record)
+
+
+def create_logger(variant: str, level: str, path: str, write_s: float):
+    """Returns logger and a function to stop it, flushing queued records"""
+    logger = logging.getLogger(f"bench_logging.{variant}.{level}")
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = SlowFileHandler(path, write_s)
+    handler.setFormatter(logging.Formatter(logger_module.TEXT_FORMAT,
+                                           datefmt=logger_module.DATE_FORMAT))
+    if variant == "sync":
+        logger.addHandler(handler)
+
+        def stop():
+            logger.removeHandler(handler)
+            handler.close()
+        return logger, stop
+
+    queue_handler = logger_module.DroppingQueueHandler(queue.Queue(100000))
+    listener = logger_module.BlockingStopQueueListener(queue_handler.queue, handler)
+    listener.start()
+    logger.addHandler(queue_handler)
+
+    def stop():
+        listener.stop()
+        logger.removeHandler(queue_handler)
+        handler.close()
+    return logger, stop
+
+
+async def measure(variant: str, level: str, quotes, assets, markets, write_s: float) -> float:
+    """Returns microseconds per quote"""
+    detector = detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets)
+    with tempfile.TemporaryDirectory() as log_dir:
+        logger, stop = create_logger(variant, level, os.path.join(log_dir, "log"), write_s)
+        started = time.perf_counter()
+        if variant == "sync":
+            for quote in quotes:
+                logger.debug(f"Received asset data: {quote}")
+                await detector.process_price(quote)
+        else:
+            for quote in quotes:
+                logger.debug("Received asset data: %s", quote)
+                await detector.process_price(quote)
+        elapsed = time.perf_counter() - started
+        stop()
+    return elapsed / len(quotes) * 1e6
+
+
+def best_of(repeats: int, *args) -> float:
+    return min(asyncio.run(measure(*args)) for _ in range(repeats))
+
+
+def main(args):
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    rounds = max(args.quotes // (len(assets) * len(markets)), 1)
+    quotes = [quote for quotes in make_quotes(assets, markets, rounds) for quote in quotes]
+
+    baseline_us = best_of(args.repeats, "sync", "WARNING", quotes, assets, markets, 0)
+    print(f"{len(quotes)} quotes, detector alone: {baseline_us:.2f} us/quote")
+    print(f"{'level':>8}{'sync us':>10}{'queue us':>10}{'sync +us':>10}{'queue +us':>11}")
+    for level in ("INFO", "DEBUG"):
+        sync_us = best_of(args.repeats, "sync", level, quotes, assets, markets,
+                          args.write_ms / 1000)
+        queue_us = best_of(args.repeats, "queue", level, quotes, assets, markets,
+                           args.write_ms / 1000)
+        print(f"{level:>8}{sync_us:>10.2f}{queue_us:>10.2f}"
+              f"{sync_us - baseline_us:>10.2f}{queue_us - baseline_us:>11.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--quotes", type=int, default=20000)
+    parser.add_argument("--write-ms", type=float, default=0.0)
+    parser.add_argument("--repeats", type=int, default=3)
+    main(parser.parse_args())
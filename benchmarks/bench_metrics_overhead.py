@@ -0,0 +1,128 @@
+"""Measures overhead of metrics recording on hot paths of both services.
+
+The same workload is run in child processes, with `METRICS_ENABLED` on and
+off, since metrics are configured on import. Runs alternate and the best
+result of `--repeats` runs is reported, to filter out noise of the machine:
+
+    python -m benchmarks.bench_metrics_overhead --assets 200 --markets 8
+
+Workload:
+- detector_us_per_quote: `ArbitrageDetector.process_price`, one task per
+  pair per round, as analyzer's fetch loops do it
+- fetch_us_per_request: `PriceFetcher.fetch_price` against in-process
+  generator, including generator's request metrics middleware
+- observe_ns: a single histogram observation, with `prometheus_client`
+  histogram for reference
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from prometheus_client import CollectorRegistry, Histogram
+
+from ._loader import ROOT_DIR, load_analyzer_module, load_generator_module
+from ._universe import get_assets, get_markets, write_price_config
+
+
+async def measure_detector(args) -> float:
+    from .bench_detector import make_quotes
+    detector_module = load_analyzer_module("core.detector")
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    quotes_rounds = make_quotes(assets, markets, args.rounds)
+    detector = detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets)
+
+    started = time.perf_counter()
+    for quotes in quotes_rounds:
+        await asyncio.gather(*(detector.process_price(quote) for quote in quotes))
+    elapsed = time.perf_counter() - started
+    return elapsed / (len(assets) * len(markets) * args.rounds) * 1e6
+
+
+async def measure_fetch(args) -> float:
+    generator_app = load_generator_module("app")
+    fetch_requests = load_analyzer_module("utils.fetch_requests")
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    app = generator_app.app
+
+    async with app.router.lifespan_context(app):
+        price_fetcher = fetch_requests.PriceFetcher(
+            host="generator", port="80", conditional_requests=False,
+            transport=httpx.ASGITransport(app=app))
+        async with price_fetcher:
+            started = time.perf_counter()
+            for i in range(args.requests):
+                await price_fetcher.fetch_price(assets[i % len(assets)],
+                                                markets[i % len(markets)])
+            elapsed = time.perf_counter() - started
+    return elapsed / args.requests * 1e6
+
+
+def measure_observe(histogram, iterations: int = 200000) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        histogram.observe(0.000001)
+    return (time.perf_counter() - started) / iterations * 1e9
+
+
+def run_worker(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        results = {
+            "detector_us_per_quote": asyncio.run(measure_detector(args)),
+            "fetch_us_per_request": asyncio.run(measure_fetch(args)),
+            "observe_ns": measure_observe(
+                load_analyzer_module("utils.metrics").lock_wait_seconds),
+            "prometheus_client_observe_ns": measure_observe(
+                Histogram("observe", "observe", registry=CollectorRegistry())),
+        }
+    print(json.dumps(results))
+
+
+def run_child(args, metrics_enabled: bool) -> dict:
+    command = [sys.executable, "-m", "benchmarks.bench_metrics_overhead", "--worker",
+               "--assets", str(args.assets), "--markets", str(args.markets),
+               "--rounds", str(args.rounds), "--requests", str(args.requests)]
+    env = {**os.environ, "METRICS_ENABLED": str(metrics_enabled)}
+    output = subprocess.run(command, cwd=ROOT_DIR, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    runs = {"metrics off": [], "metrics on": []}
+    for _ in range(args.repeats):
+        runs["metrics off"].append(run_child(args, False))
+        runs["metrics on"].append(run_child(args, True))
+    results = {name: {metric: min(result[metric] for result in name_runs)
+                      for metric in name_runs[0]}
+               for name, name_runs in runs.items()}
+
+    print(f"universe: {args.assets} assets x {args.markets} markets")
+    print(f"{'':<30}" + "".join(f"{name:>14}" for name in results) + f"{'overhead':>12}")
+    for metric, value_on in results["metrics on"].items():
+        value_off = results["metrics off"][metric]
+        overhead = f"{(value_on - value_off) / value_off:+.1%}" if value_off > 1 else "-"
+        print(f"{metric:<30}{value_off:>14.3f}{value_on:>14.3f}{overhead:>12}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=200)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+    else:
+        main(args)
@@ -0,0 +1,118 @@
+"""Measures how a slow opportunities output affects detection.
+
+Compares writing each opportunity synchronously from detector's listener,
+the way a blocking log handler would, with `OpportunityPipeline`, which
+buffers opportunities and writes them in batches in the background:
+
+    python -m benchmarks.bench_opportunity_sink --assets 100 --markets 8 --write-ms 1
+
+Each write to the sink takes `--write-ms`, per opportunity when synchronous
+and per batch with the pipeline. Reports `process_price` latency
+percentiles, event loop lag and opportunities written and dropped.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from ._loader import load_analyzer_module
+from ._stats import measure_loop_lag, percentile
+from ._universe import get_assets, get_markets
+from .bench_detector import make_quotes
+
+
+detector_module = load_analyzer_module("core.detector")
+output_module = load_analyzer_module("core.output")
+
+
+class SlowSink(output_module.Sink):
+    """Sink whose every write blocks a thread for `write_s`"""
+
+    name = "slow"
+
+    def __init__(self, write_s: float):
+        self.write_s = write_s
+        self.written_bytes = 0
+
+
+    def write_sync(self, data: bytes) -> None:
+        time.sleep(self.write_s)
+        self.written_bytes += len(data)
+
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self.write_sync, data)
+
+
+async def run_scenario(assets, markets, quotes_rounds, sink: SlowSink, args,
+                       policy: str = None) -> dict:
+    detector = detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets)
+    pipeline = None
+    if policy is None:
+        detector.add_opportunity_listener(
+            lambda details: sink.write_sync((json.dumps(details) + "\n").encode()))
+    else:
+        pipeline = output_module.OpportunityPipeline(
+            [sink], capacity=args.capacity, batch_size=args.batch_size,
+            flush_interval_s=0.05, policy=policy)
+        detector.add_opportunity_listener(pipeline.submit)
+        if policy == "block":
+            detector.output_ready = pipeline.wait_ready
+
+    lags = []
+    background = [asyncio.create_task(measure_loop_lag(lags))]
+    if pipeline is not None:
+        background.append(asyncio.create_task(pipeline.run()))
+
+    latencies = []
+
+    async def process(quote):
+        started = time.perf_counter()
+        await detector.process_price(quote)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for quotes in quotes_rounds:
+        await asyncio.gather(*(process(quote) for quote in quotes))
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    if pipeline is not None:
+        await pipeline.close()
+    return {
+        "quotes_per_s": len(latencies) / elapsed,
+        "p50_us": percentile(latencies, 50) * 1e6,
+        "p99_us": percentile(latencies, 99) * 1e6,
+        "lag_p99_ms": percentile(lags, 99) * 1000,
+        "opportunities": detector.opportunities_found,
+        "dropped": pipeline.dropped_count if pipeline is not None else 0,
+    }
+
+
+def main(args):
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    quotes_rounds = make_quotes(assets, markets, args.rounds)
+    print(f"{'output':>12}{'quotes/s':>12}{'p50 us':>10}{'p99 us':>10}"
+          f"{'lag p99 ms':>12}{'opportunities':>15}{'dropped':>10}")
+    for policy in [None, "drop_newest", "drop_oldest", "block"]:
+        sink = SlowSink(args.write_ms / 1000)
+        result = asyncio.run(run_scenario(assets, markets, quotes_rounds, sink, args, policy))
+        print(f"{policy or 'sync':>12}{result['quotes_per_s']:>12,.0f}"
+              f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}"
+              f"{result['lag_p99_ms']:>12.2f}{result['opportunities']:>15}"
+              f"{result['dropped']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--write-ms", type=float, default=1.0)
+    parser.add_argument("--capacity", type=int, default=10000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,79 @@
+"""Compares quotes/sec of a client-per-request fetcher against the pooled
+`PriceFetcher` client.
+
+Requires a running generator, e.g. `make start_generator`, then:
+
+    python -m benchmarks.bench_price_fetcher --host localhost --port 8000
+"""
+import argparse
+import asyncio
+import itertools
+import time
+
+import httpx
+
+from ._loader import load_analyzer_module
+
+
+fetch_requests = load_analyzer_module("utils.fetch_requests")
+schemas = load_analyzer_module("utils.schemas")
+
+
+async def fetch_price_new_client(price_fetcher, asset: str, market: str):
+    """Previous implementation: a new client (and connection) per quote"""
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
+        response = await client.get(price_fetcher.get_api(asset=asset, market=market))
+        response.raise_for_status()
+        return schemas.AssetPriceFromApi(**response.json())
+
+
+async def fetch_price_pooled(price_fetcher, asset: str, market: str):
+    return await price_fetcher.fetch_price(asset=asset, market=market)
+
+
+async def run(fetch, price_fetcher, pairs, concurrency: int, duration_s: float) -> int:
+    """Runs `concurrency` workers fetching pairs round robin during
+    `duration_s`. Returns number of quotes received"""
+    received = 0
+    deadline = time.perf_counter() + duration_s
+    pairs_cycle = itertools.cycle(pairs)
+
+    async def worker():
+        nonlocal received
+        while time.perf_counter() < deadline:
+            asset, market = next(pairs_cycle)
+            if await fetch(price_fetcher, asset, market):
+                received += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return received
+
+
+async def main(args):
+    pairs = [(asset, market) for asset in args.assets for market in args.markets]
+    results = {}
+
+    async with fetch_requests.PriceFetcher(
+            host=args.host, port=args.port, http2=args.http2) as price_fetcher:
+        for name, fetch in (("client per request", fetch_price_new_client),
+                            ("pooled client", fetch_price_pooled)):
+            received = await run(fetch, price_fetcher, pairs,
+                                 args.concurrency, args.duration)
+            results[name] = received / args.duration
+
+    for name, quotes_per_s in results.items():
+        print(f"{name:<20}: {quotes_per_s:10.1f} quotes/s")
+    print(f"{'speedup':<20}: {results['pooled client'] / max(results['client per request'], 1e-9):10.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="8000")
+    parser.add_argument("--assets", nargs="+", default=["Copper", "Oil"])
+    parser.add_argument("--markets", nargs="+", default=["US", "UK"])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--http2", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""Compares size and decoding cost of price quotes in generator's JSON and
+compact binary encodings:
+
+    python -m benchmarks.bench_quotes_decode --assets 125 --markets 8
+
+Payloads of a single quote (`/price`) and of a snapshot of all pairs
+(`/prices`) are encoded by the generator. JSON is decoded as before, parsed
+with `json` and validated quote by quote, with validation skipped by
+`model_construct`, and in a single pydantic-core pass as the fetcher does
+now. Binary is decoded by analyzer's `utils/wire.py`.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ._loader import load_analyzer_module, load_generator_module
+from ._universe import write_price_config
+
+
+schemas = load_analyzer_module("utils.schemas")
+wire = load_analyzer_module("utils.wire")
+generator_wire = load_generator_module("utils.wire")
+
+def decode_json_legacy(content: bytes) -> list:
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = [data]
+    return [schemas.AssetPriceFromApi(**asset_data) for asset_data in data]
+
+
+def decode_json_unvalidated(content: bytes) -> list:
+    data = json.loads(content)
+    if isinstance(data, dict):
+        data = [data]
+    construct = schemas.AssetPriceFromApi.model_construct
+    return [construct(**asset_data) for asset_data in data]
+
+
+def decode_json(content: bytes) -> list:
+    """Current fetcher's decoding, see `PriceFetcher._decode_quotes`"""
+    if content.startswith(b"{"):
+        return [schemas.AssetPriceFromApi.model_validate_json(content)]
+    return wire.decode_json_quotes(content)
+
+
+def measure(decode, content: bytes, quotes_count: int, repeats: int) -> dict:
+    best_s = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        decode(content)
+        best_s = min(best_s, time.perf_counter() - started)
+    return {"bytes_per_quote": len(content) / quotes_count,
+            "decode_us_per_quote": best_s / quotes_count * 1e6}
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        assets_manager_module = load_generator_module("core.assets_manager")
+        utils = load_generator_module("utils.utils")
+        assets_manager = assets_manager_module.AssetsManager(utils.get_config_filepath())
+    quotes_cache = load_generator_module("core.quotes_cache").QuotesCache(assets_manager)
+
+    def encode_binary(pairs_ids):
+        return generator_wire.encode_quotes(
+            assets_manager.assets, assets_manager.markets, pairs_ids,
+            assets_manager.get_prices_records(pairs_ids))
+
+    all_pairs_ids = np.arange(assets_manager.pairs_count)
+    payloads = {
+        "single": ([0], quotes_cache.get(0), encode_binary([0])),
+        "snapshot": (all_pairs_ids, quotes_cache.get_many(all_pairs_ids),
+                     encode_binary(all_pairs_ids)),
+    }
+
+    print(f"universe: {args.assets} assets x {args.markets} markets, best of {args.repeats}")
+    for payload, (pairs_ids, json_content, binary_content) in payloads.items():
+        # the same quotes must come out of both encodings
+        assert ([quote.price for quote in decode_json(json_content)]
+                == [quote.price for quote in wire.decode_quotes(binary_content)])
+        results = {
+            "json before": measure(decode_json_legacy, json_content,
+                                   len(pairs_ids), args.repeats),
+            "json unvalidated": measure(decode_json_unvalidated, json_content,
+                                        len(pairs_ids), args.repeats),
+            "json": measure(decode_json, json_content, len(pairs_ids), args.repeats),
+            "binary": measure(wire.decode_quotes, binary_content,
+                              len(pairs_ids), args.repeats),
+        }
+        print(f"\n{payload} ({len(pairs_ids)} quotes)")
+        print(f"{'':<22}" + "".join(f"{name:>18}" for name in results))
+        for metric in results["json"]:
+            print(f"{metric:<22}" + "".join(f"{result[metric]:>18.3f}"
+                                            for result in results.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=125)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,101 @@
+"""Measures recording and replay of quotes.
+
+Writes a synthetic recording of a universe of pairs quoted `--rounds`
+times, then replays it through `ArbitrageDetector` in batches and quote by
+quote, as fast as possible:
+
+    python -m benchmarks.bench_replay --assets 1000 --markets 8 --rounds 50
+
+Reports recording cost per quote, size of the recording, time to open it,
+replay throughput and peak memory. The recording is memory mapped, so peak
+memory should not grow with its size.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from ._loader import load_analyzer_module
+from ._stats import get_max_rss_mb
+from ._universe import get_assets, get_markets
+
+
+detector_module = load_analyzer_module("core.detector")
+recording_module = load_analyzer_module("core.recording")
+schemas = load_analyzer_module("utils.schemas")
+
+
+def write_recording(path: str, assets, markets, rounds: int, seed: int = 42) -> float:
+    """Records quotes of all pairs per round. Returns recording time per quote"""
+    rnd = random.Random(seed)
+    base_prices = {asset: rnd.uniform(1, 10000) for asset in assets}
+    recorder = recording_module.QuotesRecorder(path)
+    started_at, elapsed = time.time(), 0.0
+    for round_idx in range(rounds):
+        generated_at = started_at + round_idx * 0.1
+        quotes = [schemas.AssetPriceFromApi.model_construct(
+                      name=asset, market=market,
+                      price=base_prices[asset] * (1 + rnd.uniform(-0.03, 0.03)),
+                      spread=rnd.uniform(0.5, 5),
+                      version=round_idx + 1, generated_at=generated_at)
+                  for asset in assets for market in markets]
+        recording_started = time.perf_counter()
+        recorder.record(quotes, received_at=generated_at + 0.001)
+        elapsed += time.perf_counter() - recording_started
+    recorder.close()
+    return elapsed / (rounds * len(assets) * len(markets))
+
+
+async def replay(path: str, per_quote: bool) -> dict:
+    with recording_module.QuotesRecording(path) as recording:
+        detector = detector_module.ArbitrageDetector(
+            assets_list=recording.get_assets(), markets_list=recording.get_markets())
+        stats = await recording_module.replay(recording, detector, per_quote=per_quote)
+    stats["opportunities"] = detector.opportunities_found
+    return stats
+
+
+def main(args):
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    quotes_count = args.assets * args.markets * args.rounds
+    with tempfile.TemporaryDirectory() as recording_dir:
+        path = os.path.join(recording_dir, "quotes.bin")
+        record_us = write_recording(path, assets, markets, args.rounds) * 1e6
+        size_mb = os.path.getsize(path) / 1024 ** 2
+        rss_before_mb = get_max_rss_mb()
+
+        opening_started = time.perf_counter()
+        with recording_module.QuotesRecording(path) as recording:
+            open_ms = (time.perf_counter() - opening_started) * 1000
+            assert len(recording) == quotes_count
+
+        batch_stats = asyncio.run(replay(path, per_quote=False))
+        per_quote_stats = (asyncio.run(replay(path, per_quote=True))
+                           if not args.skip_per_quote else None)
+        rss_after_mb = get_max_rss_mb()
+
+    print(f"universe: {args.assets} assets x {args.markets} markets, {quotes_count} quotes")
+    print(f"record:            {record_us:.2f} us/quote")
+    print(f"recording size:    {size_mb:.1f} MB, "
+          f"{size_mb * 1024 ** 2 / quotes_count:.1f} bytes/quote")
+    print(f"open:              {open_ms:.2f} ms")
+    print(f"replay, batches:   {batch_stats['quotes_per_s']:.0f} quotes/s, "
+          f"{batch_stats['opportunities']} opportunities")
+    if per_quote_stats is not None:
+        print(f"replay, per quote: {per_quote_stats['quotes_per_s']:.0f} quotes/s, "
+              f"{per_quote_stats['opportunities']} opportunities")
+    print(f"peak memory:       {rss_before_mb:.0f} MB before replay, "
+          f"{rss_after_mb:.0f} MB after")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=1000)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--skip-per-quote", action="store_true",
+                        help="skip slow per quote replay of large recordings")
+    main(parser.parse_args())
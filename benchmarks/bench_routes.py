@@ -0,0 +1,84 @@
+"""Measures per quote latency of route detection as markets grow.
+
+Compares the direct detector, the routes detector, which evaluates only
+routes starting or ending at the quoted market, and the routes detector
+re-evaluating all routes of the asset on each quote:
+
+    python -m benchmarks.bench_routes --assets 100 --markets 2 4 8 16 32 64
+
+All routes are possible, with random transfer costs, so cheapest paths
+often go over other markets.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+
+from ._loader import load_analyzer_module
+from ._universe import get_assets, get_markets
+from .bench_detector import make_quotes
+
+
+detector_module = load_analyzer_module("core.detector")
+routes_module = load_analyzer_module("core.routes")
+
+
+class FullRouteArbitrageDetector(routes_module.RouteArbitrageDetector):
+    """Re-evaluates all `markets x markets` routes on each quote"""
+
+    def _check_asset(self, asset_idx: int, market_idx: int) -> dict:
+        return self._check_asset_markets(asset_idx, np.arange(len(self.markets_list)))
+
+
+def make_transfer_costs(markets, seed: int = 42):
+    rnd = random.Random(seed)
+    routes = [{"from": market_from, "to": market_to, "cost": rnd.uniform(0, 2),
+               "both_ways": False}
+              for market_from in markets for market_to in markets if market_from != market_to]
+    return routes_module.TransferCosts(markets, default_cost=None, routes=routes)
+
+
+async def measure(detector, quotes_rounds) -> float:
+    """Returns microseconds per quote"""
+    started = time.perf_counter()
+    for quotes in quotes_rounds:
+        for quote in quotes:
+            await detector.process_price(quote)
+    elapsed = time.perf_counter() - started
+    return elapsed / sum(len(quotes) for quotes in quotes_rounds) * 1e6
+
+
+def main(args):
+    assets = get_assets(args.assets)
+    print(f"{'markets':>8}{'paths ms':>10}{'direct us':>12}{'routes us':>12}"
+          f"{'all routes us':>15}{'opportunities':>15}")
+    for markets_count in args.markets:
+        markets = get_markets(markets_count)
+        quotes_rounds = make_quotes(assets, markets, args.rounds)
+
+        started = time.perf_counter()
+        transfer_costs = make_transfer_costs(markets)
+        transfer_costs.get_paths(assets[0])
+        paths_ms = (time.perf_counter() - started) * 1000
+
+        direct = detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets)
+        routes = routes_module.RouteArbitrageDetector(
+            assets_list=assets, markets_list=markets, transfer_costs=transfer_costs)
+        full_routes = FullRouteArbitrageDetector(
+            assets_list=assets, markets_list=markets, transfer_costs=transfer_costs)
+        direct_us = asyncio.run(measure(direct, quotes_rounds))
+        routes_us = asyncio.run(measure(routes, quotes_rounds))
+        full_routes_us = asyncio.run(measure(full_routes, quotes_rounds))
+        print(f"{markets_count:>8}{paths_ms:>10.2f}{direct_us:>12.2f}{routes_us:>12.2f}"
+              f"{full_routes_us:>15.2f}{routes.opportunities_found:>15}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--markets", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64])
+    parser.add_argument("--rounds", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,119 @@
+"""Measures how reads of generator's shared prices scale with reader
+processes, while price engine keeps updating them:
+
+    python -m benchmarks.bench_shared_prices --assets 1250 --markets 8 --readers 1 2 4
+
+Each reader serves quotes the way `/price` does in shared prices mode: from
+a version checked quotes cache over `SharedAssetsReader`. Reports reads per
+second in total and per reader, and reads per second of a single process
+owning its prices and updating them at the same rate, for comparison.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ._loader import load_generator_module
+from ._universe import write_price_config
+
+
+assets_manager_module = load_generator_module("core.assets_manager")
+shared_prices_module = load_generator_module("core.shared_prices")
+quotes_cache_module = load_generator_module("core.quotes_cache")
+
+
+def get_updated_pairs(rng, pairs_count: int, updates_per_s: int) -> np.ndarray:
+    """Pairs updated every 0.1 s"""
+    return np.unique(rng.integers(0, pairs_count, size=max(updates_per_s // 10, 1)))
+
+
+def read_quotes(quotes_cache, pairs_count: int, duration_s: float,
+                update_prices=None, updates_per_s: int = 0) -> int:
+    """Reads quotes for `duration_s`. If `update_prices` is provided, it is
+    called every 0.1 s, as the price engine does in its own process"""
+    rng = np.random.default_rng(os.getpid())
+    pairs_ids = rng.integers(0, pairs_count, size=100000).tolist()
+    reads = 0
+    next_update = time.perf_counter()
+    deadline = time.perf_counter() + duration_s
+    while time.perf_counter() < deadline:
+        if update_prices is not None and time.perf_counter() >= next_update:
+            update_prices(get_updated_pairs(rng, pairs_count, updates_per_s))
+            next_update += 0.1
+        for pair_id in pairs_ids[:1000]:
+            quotes_cache.get(pair_id)
+        pairs_ids = pairs_ids[1000:] + pairs_ids[:1000]
+        reads += 1000
+    return reads
+
+
+def run_reader(name: str, duration_s: float, results: multiprocessing.Queue):
+    reader = assets_manager_module.SharedAssetsReader(
+        shared_prices_module.SharedPrices.attach(name))
+    quotes_cache = quotes_cache_module.QuotesCache(reader, check_versions=True)
+    results.put(read_quotes(quotes_cache, reader.pairs_count, duration_s))
+
+
+def run_writer(assets_manager, updates_per_s: int, stop):
+    rng = np.random.default_rng(0)
+    while not stop.is_set():
+        assets_manager.update_prices(
+            get_updated_pairs(rng, assets_manager.pairs_count, updates_per_s))
+        time.sleep(0.1)
+
+
+def main(args):
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory() as config_dir:
+        config_filepath = write_price_config(config_dir, args.assets, args.markets)
+        name = f"bench_prices_{os.getpid()}"
+        writer = assets_manager_module.AssetsManager(config_filepath, shared_prices_name=name)
+        stop = context.Event()
+        writer_process = context.Process(
+            target=run_writer, args=(writer, args.updates_per_s, stop))
+        writer_process.start()
+        try:
+            own = assets_manager_module.AssetsManager(config_filepath)
+            own_cache = quotes_cache_module.QuotesCache(own)
+
+            def update_own(pairs_ids):
+                own.update_prices(pairs_ids)
+                own_cache.invalidate(pairs_ids)
+
+            own_reads = read_quotes(own_cache, own.pairs_count, args.duration,
+                                    update_own, args.updates_per_s)
+            print(f"universe: {args.assets} assets x {args.markets} markets,"
+                  f" {args.updates_per_s} updates/s")
+            print(f"{'readers':>8}{'reads/s':>14}{'per reader':>14}")
+            print(f"{'own':>8}{own_reads / args.duration:>14,.0f}"
+                  f"{own_reads / args.duration:>14,.0f}")
+            for readers_count in args.readers:
+                results = context.Queue()
+                readers = [context.Process(target=run_reader,
+                                           args=(name, args.duration, results))
+                           for _ in range(readers_count)]
+                for reader in readers:
+                    reader.start()
+                reads = sum(results.get() for _ in readers)
+                for reader in readers:
+                    reader.join()
+                print(f"{readers_count:>8}{reads / args.duration:>14,.0f}"
+                      f"{reads / args.duration / readers_count:>14,.0f}")
+        finally:
+            stop.set()
+            writer_process.join()
+            writer.shared_prices.unlink()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=1250)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--readers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates-per-s", type=int, default=10000)
+    parser.add_argument("--duration", type=float, default=3.0)
+    main(parser.parse_args())
@@ -0,0 +1,95 @@
+"""Measures cost of changing the universe of assets at runtime, compared with
+restarting generator and analyzer's detector with the changed universe:
+
+    python -m benchmarks.bench_universe_change --assets 12500 --markets 8 --add 100
+
+Generator's `AssetsManager.change_universe` adds `--add` assets and removes as
+many, keeping prices and versions of other pairs, against constructing a new
+`AssetsManager`. Analyzer's `ArbitrageDetector.set_universe` relayouts a book
+full of quotes, against a new detector, which has to fetch prices of all
+pairs again before it detects anything.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ._loader import load_analyzer_module, load_generator_module
+from ._universe import get_assets, get_markets, write_price_config
+
+
+detector_module = load_analyzer_module("core.detector")
+schemas = load_analyzer_module("utils.schemas")
+
+
+def measure(change, repeats: int) -> float:
+    best_s = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        change()
+        best_s = min(best_s, time.perf_counter() - started)
+    return best_s
+
+
+def fill_detector(detector, rnd: np.random.Generator) -> None:
+    quotes = [schemas.AssetPriceFromApi(name=asset, market=market,
+                                        price=rnd.uniform(1, 10000), spread=1.0)
+              for asset in detector.assets_list for market in detector.markets_list]
+    asyncio.run(detector.process_prices(quotes))
+
+
+def main(args):
+    assets, markets = get_assets(args.assets), get_markets(args.markets)
+    added = [f"New asset {i}" for i in range(args.add)]
+    changes = [(added, assets[:args.add]), (assets[:args.add], added)]
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        os.environ["PRICE_CONFIG_FILE"] = write_price_config(
+            config_dir, args.assets, args.markets)
+        assets_manager_module = load_generator_module("core.assets_manager")
+        config_filepath = load_generator_module("utils.utils").get_config_filepath()
+        assets_manager = assets_manager_module.AssetsManager(config_filepath)
+
+        def change_generator():
+            add_assets, remove_assets = changes[0]
+            assets_manager.change_universe(add_assets=add_assets, remove_assets=remove_assets)
+            changes.reverse()
+
+        restart_generator_s = measure(
+            lambda: assets_manager_module.AssetsManager(config_filepath), args.repeats)
+        change_generator_s = measure(change_generator, args.repeats)
+
+    detector = detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets)
+    fill_detector(detector, np.random.default_rng(42))
+    universes = [added + assets[args.add:], assets]
+
+    def change_detector():
+        detector.set_universe(universes[0], markets)
+        universes.reverse()
+
+    change_detector_s = measure(change_detector, args.repeats)
+    restart_detector_s = measure(
+        lambda: detector_module.ArbitrageDetector(assets_list=assets, markets_list=markets),
+        args.repeats)
+    refill_detector_s = measure(
+        lambda: fill_detector(detector, np.random.default_rng(42)), 1)
+
+    print(f"universe: {args.assets} assets x {args.markets} markets,"
+          f" {args.add} assets added and removed, best of {args.repeats}")
+    print(f"{'':<12}{'change ms':>14}{'restart ms':>14}")
+    print(f"{'generator':<12}{change_generator_s * 1000:>14.3f}{restart_generator_s * 1000:>14.3f}")
+    print(f"{'detector':<12}{change_detector_s * 1000:>14.3f}{restart_detector_s * 1000:>14.3f}"
+          f"  + {refill_detector_s * 1000:.3f} ms to process quotes of all pairs again")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=12500)
+    parser.add_argument("--markets", type=int, default=8)
+    parser.add_argument("--add", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=10)
+    main(parser.parse_args())
@@ -0,0 +1,166 @@
+"""Prometheus metrics recorded from a single thread, shared by both services.
+
+Recording is cheap enough for hot paths:
+- metrics of a process are recorded from its event loop only, so histograms
+  and counters are plain in-memory updates without locks, converted to
+  Prometheus format on scrape. `prometheus_client` metrics take a lock on
+  each update, which costs several times more.
+- counters and gauges which already exist as plain attributes of services'
+  objects are collected on scrape, see `AttributesCollector`.
+
+Each service keeps its metrics in its own registry, see their
+`utils/metrics.py`. Both images copy this package next to their `app`.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Sequence, Tuple
+
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+
+
+class NoopMetric:
+    """Stands in for any metric when metrics are disabled"""
+
+    def labels(self, *args) -> "NoopMetric":
+        return self
+
+    def observe(self, amount: float) -> None:
+        pass
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+
+class HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last one is +Inf bucket
+        self.sum = 0.0
+
+
+    def observe(self, amount: float) -> None:
+        self.counts[bisect_left(self.bounds, amount)] += 1
+        self.sum += amount
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class LocalMetric:
+    """
+    Base of metrics recorded from a single thread. Labelled children are
+    created on first use and cached. Unlabelled metric records to its only
+    child directly.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self.labels()
+
+
+    def _create_child(self):
+        raise NotImplementedError
+
+
+    def labels(self, *values: str):
+        child = self.children.get(values, None)
+        if child is None:
+            child = self._create_child()
+            self.children[values] = child
+        return child
+
+
+class LocalHistogram(LocalMetric):
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = ()):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.observe = self.children[()].observe
+
+
+    def _create_child(self) -> HistogramChild:
+        return HistogramChild(self.bounds)
+
+
+    def collect(self):
+        family = HistogramMetricFamily(self.name, self.documentation,
+                                       labels=self.labelnames)
+        for values, child in list(self.children.items()):
+            buckets, total = [], 0
+            for bound, count in zip(self.bounds + (float("inf"),), child.counts):
+                total += count
+                buckets.append((str(bound) if bound != float("inf") else "+Inf", total))
+            family.add_metric([str(value) for value in values], buckets,
+                              sum_value=child.sum)
+        yield family
+
+
+class LocalCounter(LocalMetric):
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self.inc = self.children[()].inc
+
+
+    def _create_child(self) -> CounterChild:
+        return CounterChild()
+
+
+    def collect(self):
+        family = CounterMetricFamily(self.name, self.documentation,
+                                     labels=self.labelnames)
+        for values, child in list(self.children.items()):
+            family.add_metric([str(value) for value in values], child.value)
+        yield family
+
+
+class AttributesCollector:
+    """Collects counters and gauges kept as plain attributes of service's
+    objects, by functions called on scrape"""
+
+    def __init__(self):
+        self.counters: Dict[str, Tuple[str, Callable, Tuple[str, ...]]] = {}
+        self.gauges: Dict[str, Tuple[str, Callable, Tuple[str, ...]]] = {}
+
+
+    def add_counter(self, name: str, documentation: str, get_value: Callable,
+                    labelnames: Sequence[str] = ()) -> None:
+        """With `labelnames`, `get_value` returns values by tuples of labels'
+        values"""
+        self.counters[name] = (documentation, get_value, tuple(labelnames))
+
+
+    def add_gauge(self, name: str, documentation: str, get_value: Callable,
+                  labelnames: Sequence[str] = ()) -> None:
+        """With `labelnames`, `get_value` returns values by tuples of labels'
+        values"""
+        self.gauges[name] = (documentation, get_value, tuple(labelnames))
+
+
+    def collect(self):
+        for metrics, family_class in ((self.counters, CounterMetricFamily),
+                                      (self.gauges, GaugeMetricFamily)):
+            for name, (documentation, get_value, labelnames) in metrics.items():
+                if not labelnames:
+                    yield family_class(name, documentation, value=get_value())
+                    continue
+                family = family_class(name, documentation, labels=labelnames)
+                for values, value in get_value().items():
+                    family.add_metric([str(label) for label in values], value)
+                yield family
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+from fastapi import FastAPI, HTTPException, Query, Response, status
+from typing import Optional
+import uvicorn
+
+from .core.opportunities import OpportunityIndex
+from .utils import metrics
+from .utils.fetch_requests import PriceFetcher
+from .utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+api = FastAPI()
+
+
+@api.get('/metrics')
+async def get_metrics() -> Response:
+    """
+    API to provide analyzer metrics in Prometheus text format
+    """
+    return Response(content=metrics.get_metrics(), media_type=metrics.content_type)
+
+
+@api.get('/opportunities')
+async def get_opportunities(k: int = Query(default=10, ge=1, le=1000)) -> dict:
+    """
+    API to provide top `k` current arbitrage opportunities by margin
+    """
+    opportunity_index: Optional[OpportunityIndex] = getattr(
+        api.state, "opportunity_index", None)
+    if opportunity_index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Opportunity index is disabled")
+    opportunities = opportunity_index.get_top(k)
+    return {"total": len(opportunity_index), "opportunities": opportunities}
+
+
+@api.get('/fetcher')
+async def get_fetcher_state() -> dict:
+    """
+    API to provide state of price fetcher's limits and circuit breakers of
+    prices source endpoints
+    """
+    price_fetcher: Optional[PriceFetcher] = getattr(api.state, "price_fetcher", None)
+    if price_fetcher is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail="Price fetcher is not running")
+    return price_fetcher.get_limits_state()
+
+
+class EmbeddedServer(uvicorn.Server):
+    """Uvicorn server run as a task of analyzer's event loop. Leaves signals
+    handling to the analyzer, so Ctrl+C stops the whole process as before"""
+
+    @contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def serve_api(host: str, port: int,
+                    opportunity_index: OpportunityIndex = None,
+                    price_fetcher: PriceFetcher = None) -> None:
+    """Serves analyzer's API until cancelled. If it can not be served, e.g.
+    the port is taken, analyzer keeps running without it"""
+    api.state.opportunity_index = opportunity_index
+    api.state.price_fetcher = price_fetcher
+    server = EmbeddedServer(uvicorn.Config(api, host=host, port=port,
+                                           lifespan="off", log_level="warning",
+                                           access_log=False))
+    logger.info("Analyzer API is served at http://%s:%d", host, port)
+    try:
+        await server.serve()
+    except (SystemExit, OSError) as e:
+        # uvicorn exits the process if it fails to bind the socket
+        logger.error("Analyzer API can not be served at http://%s:%d, continuing"
+                     " without it: %r", host, port, e)
@@ -1,50 +1,557 @@
 import asyncio
 from decouple import config
+import httpx
+import multiprocessing
+import os
+from typing import Dict, Hashable, List, Optional, Tuple
 
+from .api import serve_api
+from .utils import metrics, schemas
+from .utils.endpoints import CircuitOpenError
 from .utils.fetch_requests import PriceFetcher 
-from .utils.logger import get_logger
-from .core.detector import ArbitrageDetector
+from .utils.logger import get_logger, get_records_dropped
+from .core.detector import DEFAULT_ASSETS, DEFAULT_MARKETS, ArbitrageDetector
+from .core.opportunities import OpportunityIndex
+from .core.output import OpportunityPipeline, create_sinks
+from .core.polling import AdaptivePollInterval, RetryBackoff
+from .core.quotes_queue import CoalescingQueue, run_detector_worker
+from .core.recording import QuotesRecorder
+from .core.routes import RouteArbitrageDetector
+from .core.sharding import ShardReporter, ShardsSupervisor, get_shard_id
 
 
 logger = get_logger(__name__)
-semaphore = asyncio.Semaphore(200)
 prices_request_interval_s = float(config('PRICES_REQUEST_INTERVAL_S'))
+# in "pair" mode each pair is polled more rarely if its price changes rarely
+adaptive_polling = config('ADAPTIVE_POLLING', default=True, cast=bool)
+prices_request_interval_max_s = config('PRICES_REQUEST_INTERVAL_MAX_S', default=5.0, cast=float)
+polls_per_price_update = config('POLLS_PER_PRICE_UPDATE', default=2.0, cast=float)
+# "pair" - request price of each asset / market pair separately
+# "snapshot" - request prices of all pairs with a single request
+# "stream" - subscribe to prices updates pushed by prices source
+analyzer_mode = config('ANALYZER_MODE', default="pair")
+stream_reconnect_delay_max_s = config('STREAM_RECONNECT_DELAY_MAX_S', default=10.0, cast=float)
+# failed requests are retried with exponential backoff and jitter
+fetcher_retry_delay_s = config('FETCHER_RETRY_DELAY_S', default=0.1, cast=float)
+fetcher_retry_delay_max_s = config('FETCHER_RETRY_DELAY_MAX_S', default=1.0, cast=float)
+# track assets and markets of prices source, discovered from its /universe,
+# instead of the built-in lists, and follow their changes, checked every
+# UNIVERSE_POLL_INTERVAL_S (0 to only discover them on start). Startup then
+# waits until prices source serves its universe
+universe_discovery = config('UNIVERSE_DISCOVERY', default=False, cast=bool)
+universe_poll_interval_s = config('UNIVERSE_POLL_INTERVAL_S', default=10.0, cast=float)
+# assets are split between this number of worker processes, if greater than 1
+analyzer_workers = config('ANALYZER_WORKERS', default=1, cast=int)
+health_report_interval_s = config('HEALTH_REPORT_INTERVAL_S', default=5.0, cast=float)
+# API with analyzer's metrics. Shard workers serve it only if
+# ANALYZER_SHARD_API_ENABLED, on following ports, one per shard
+analyzer_api_enabled = config('ANALYZER_API_ENABLED', default=True, cast=bool)
+analyzer_shard_api_enabled = config('ANALYZER_SHARD_API_ENABLED', default=False, cast=bool)
+analyzer_api_host = config('ANALYZER_API_HOST', default="127.0.0.1")
+analyzer_api_port = config('ANALYZER_API_PORT', default=8001, cast=int)
+# "direct" - buy on one market, sell on another one, moving goods is free
+# "routes" - account for costs of moving goods, over several markets if it is
+#   cheaper. Costs are configured in TRANSFER_COSTS_FILE
+detection_engine = config('DETECTION_ENGINE', default="direct")
+# fetched quotes wait for a fixed pool of detector workers in a queue, which
+# keeps only the latest quote of each pair and holds up to QUOTES_QUEUE_SIZE
+# pairs, dropping the oldest ones when full
+quotes_queue_size = config('QUOTES_QUEUE_SIZE', default=10000, cast=int)
+# detection does not await while it holds an asset's lock, so workers on the
+# single event loop never run in parallel. More than one only matters if they
+# await room in opportunity output, with "block" overflow policy
+detector_workers = config('DETECTOR_WORKERS', default=1, cast=int)
+# max quotes a worker processes in one batch in "snapshot" and "stream" modes
+detector_batch_size = config('DETECTOR_BATCH_SIZE', default=1000, cast=int)
+# current opportunities are ranked for analyzer's API, and drop out if not
+# detected again within OPPORTUNITY_TTL_S (0 to keep them until re-evaluated)
+opportunity_index_enabled = config('OPPORTUNITY_INDEX_ENABLED', default=True, cast=bool)
+opportunity_ttl_s = config('OPPORTUNITY_TTL_S', default=15.0, cast=float)
+# where detected opportunities are written to, comma separated, e.g.
+# "stdout,jsonl:opportunities.jsonl,unix:/tmp/opportunities.sock". Empty to
+# disable. Shard workers write to JSONL files suffixed with shard id
+opportunity_sinks = config('OPPORTUNITY_SINKS', default="")
+opportunity_buffer_size = config('OPPORTUNITY_BUFFER_SIZE', default=10000, cast=int)
+opportunity_batch_size = config('OPPORTUNITY_BATCH_SIZE', default=500, cast=int)
+opportunity_flush_interval_s = config('OPPORTUNITY_FLUSH_INTERVAL_S', default=0.5, cast=float)
+# if buffer is full: "drop_newest", "drop_oldest" or "block" prices processing
+opportunity_overflow_policy = config('OPPORTUNITY_OVERFLOW_POLICY', default="drop_oldest")
+# file to record all received quotes to, for replay. Empty to disable.
+# Shard workers record to their own files, suffixed with shard id
+record_quotes_file = config('RECORD_QUOTES_FILE', default="")
 
 
-async def fetch_and_process_price(
-        price_fetcher: PriceFetcher, 
-        detector: ArbitrageDetector, asset: str, market: str):
+def create_detector(assets_list: List[str] = None,
+                    markets_list: List[str] = None) -> ArbitrageDetector:
+    """Creates detector of configured engine, with opportunity index if
+    enabled"""
+    if detection_engine == "routes":
+        detector = RouteArbitrageDetector(assets_list=assets_list, markets_list=markets_list)
+    else:
+        detector = ArbitrageDetector(assets_list=assets_list, markets_list=markets_list)
+    if opportunity_index_enabled:
+        detector.opportunity_index = OpportunityIndex(ttl_s=opportunity_ttl_s)
+    return detector
+
+
+async def fetch_and_queue_price(
+        price_fetcher: PriceFetcher, queue: CoalescingQueue, asset: str, market: str):
     """High-level function that runs infinite loop to track price of an asset
-    on specific market"""
+    on specific market. Changed prices are queued for detection, and polling
+    interval follows observed rate of price changes, if enabled. Failed
+    requests are retried with backoff"""
+    loop = asyncio.get_running_loop()
+    retry_backoff = RetryBackoff(fetcher_retry_delay_s, fetcher_retry_delay_max_s)
+    poll_interval = AdaptivePollInterval(
+        interval_min_s=prices_request_interval_s,
+        interval_max_s=(prices_request_interval_max_s if adaptive_polling
+                        else prices_request_interval_s),
+        polls_per_update=polls_per_price_update)
     while True:
         asset_data = await price_fetcher.fetch_price(asset=asset, market=market)
         if asset_data:
-            await detector.check_for_arbitrage(asset_data)
-            async with semaphore:
-                asyncio.create_task(detector.price_update(asset_data))
-                await asyncio.sleep(delay=prices_request_interval_s) # not to ping same asset too often
+            retry_backoff.reset()
+            if poll_interval.observe(asset_data.version, loop.time()):
+                queue.put(asset_data)
+            # not to ping same asset too often
+            await asyncio.sleep(delay=poll_interval.get_interval())
+        else:
+            await asyncio.sleep(delay=retry_backoff.get_delay())
+
+
+def get_prices_filter(detector: ArbitrageDetector, watch: bool,
+                      shard_id: Optional[int] = None) -> dict:
+    """Filter of snapshot and stream requests. Built-in lists of assets and
+    markets are requested by names. A process following the whole universe
+    of prices source requests all prices, and a shard worker selects its
+    shard by hash, so requests stay small with any number of assets"""
+    if not watch:
+        return {"assets": detector.assets_list, "markets": detector.markets_list}
+    if shard_id is None:
+        return {}
+    return {"shard": shard_id, "shards": analyzer_workers}
+
+
+async def fetch_and_queue_prices_snapshot(
+        price_fetcher: PriceFetcher, queue: CoalescingQueue, prices_filter: dict):
+    """High-level function that runs infinite loop to track prices of all 
+    assets on all markets, requesting a single prices snapshot per iteration.
+    Only quotes which changed since previous snapshot are queued. Failed
+    requests are retried with backoff"""
+    versions = {}
+    retry_backoff = RetryBackoff(fetcher_retry_delay_s, fetcher_retry_delay_max_s)
+    while True:
+        assets_data = await price_fetcher.fetch_prices(**prices_filter)
+        if assets_data:
+            changed = [asset_data for asset_data in assets_data
+                       if asset_data.version is None 
+                       or versions.get((asset_data.name, asset_data.market)) != asset_data.version]
+            for asset_data in changed:
+                versions[(asset_data.name, asset_data.market)] = asset_data.version
+            queue.put_many(changed)
+            retry_backoff.reset()
+            await asyncio.sleep(delay=prices_request_interval_s)
+        else:
+            await asyncio.sleep(delay=retry_backoff.get_delay())
+
+
+async def stream_and_queue_prices(
+        price_fetcher: PriceFetcher, queue: CoalescingQueue, prices_filter: dict):
+    """High-level function that subscribes to prices stream and queues 
+    prices as they are pushed. Reconnects with exponential backoff and jitter
+    if stream is interrupted. Each connection starts with a prices snapshot,
+    so detector state is resynced after reconnect."""
+    reconnect_backoff = RetryBackoff(0.1, stream_reconnect_delay_max_s)
+    while True:
+        try:
+            async for assets_data in price_fetcher.stream_prices(**prices_filter):
+                queue.put_many(assets_data)
+                reconnect_backoff.reset()
+            logger.warning("Prices stream closed by server")
+        except (httpx.HTTPError, ValueError, CircuitOpenError) as e:
+            logger.error("Prices stream error: %r", e)
+
+        reconnect_delay_s = reconnect_backoff.get_delay()
+        logger.info("Reconnecting to prices stream in %.2f s", reconnect_delay_s)
+        metrics.stream_reconnects_total.inc()
+        await asyncio.sleep(reconnect_delay_s)
+
+
+def get_shard_universe(universe: schemas.Universe,
+                       shard_id: Optional[int] = None) -> Tuple[List[str], List[str]]:
+    """Assets and markets of the universe tracked by a shard worker, or by
+    the only analyzer process if `shard_id` is None"""
+    assets = universe.assets
+    if shard_id is not None:
+        assets = [asset for asset in assets if get_shard_id(asset, analyzer_workers) == shard_id]
+    return assets, universe.markets
+
+
+async def discover_universe(price_fetcher: PriceFetcher,
+                            shard_id: Optional[int] = None) -> Tuple[List[str], List[str]]:
+    """Fetches universe of prices source, retrying with backoff until it is
+    available, e.g. while prices source is starting"""
+    retry_backoff = RetryBackoff(fetcher_retry_delay_s, stream_reconnect_delay_max_s)
+    while True:
+        universe = await price_fetcher.fetch_universe(conditional=False)
+        if universe is not None:
+            return get_shard_universe(universe, shard_id)
+        retry_delay_s = retry_backoff.get_delay()
+        logger.warning("Universe of prices source is not available, retrying in %.2f s",
+                       retry_delay_s)
+        await asyncio.sleep(retry_delay_s)
+
+
+def sync_fetch_tasks(fetch_tasks: Dict[Hashable, asyncio.Task], price_fetcher: PriceFetcher,
+                     detector: ArbitrageDetector, queue: CoalescingQueue,
+                     prices_filter: dict) -> None:
+    """Starts tasks fetching prices of tracked pairs and cancels ones of pairs
+    which are no longer tracked. In "pair" mode each pair has its own task.
+    Otherwise a single task fetches all pairs: in "snapshot" mode it follows
+    the universe by itself, in "stream" mode it is restarted, so that
+    detector gets a snapshot of pairs which it did not track before. While
+    no asset is tracked, e.g. by a shard which owns none, nothing is
+    fetched"""
+    if analyzer_mode in ("snapshot", "stream"):
+        task = fetch_tasks.pop(analyzer_mode, None)
+        if task is not None and (analyzer_mode == "stream" or not detector.assets_list):
+            task.cancel()
+            task = None
+        if not detector.assets_list:
+            return
+        if task is None:
+            fetch_loop = (fetch_and_queue_prices_snapshot if analyzer_mode == "snapshot"
+                          else stream_and_queue_prices)
+            task = asyncio.ensure_future(fetch_loop(price_fetcher, queue, prices_filter))
+        fetch_tasks[analyzer_mode] = task
+        return
+
+    pairs = [(asset, market) for asset in detector.assets_list
+             for market in detector.markets_list]
+    tracked = set(pairs)
+    for pair in [pair for pair in fetch_tasks if pair not in tracked]:
+        fetch_tasks.pop(pair).cancel()
+    for pair in pairs:
+        if pair not in fetch_tasks:
+            fetch_tasks[pair] = asyncio.ensure_future(
+                fetch_and_queue_price(price_fetcher, queue, *pair))
+
+
+def apply_universe(assets: List[str], markets: List[str],
+                   fetch_tasks: Dict[Hashable, asyncio.Task], price_fetcher: PriceFetcher,
+                   detector: ArbitrageDetector, queue: CoalescingQueue,
+                   prices_filter: dict) -> None:
+    """Switches detector and fetching to a changed universe. State of pairs
+    which stay tracked is kept"""
+    if assets == detector.assets_list and markets == detector.markets_list:
+        return
+    removed_assets = set(detector.assets_list).difference(assets)
+    removed_markets = set(detector.markets_list).difference(markets)
+    removed_pairs = [(asset, market) for asset in detector.assets_list
+                     for market in detector.markets_list
+                     if asset in removed_assets or market in removed_markets]
+    detector.set_universe(assets, markets)
+    queue.discard(assets=removed_assets, markets=removed_markets)
+    price_fetcher.forget_pairs(removed_pairs)
+    sync_fetch_tasks(fetch_tasks, price_fetcher, detector, queue, prices_filter)
+    metrics.universe_changes_total.inc()
+
+
+async def watch_universe(fetch_tasks: Dict[Hashable, asyncio.Task], price_fetcher: PriceFetcher,
+                         detector: ArbitrageDetector, queue: CoalescingQueue,
+                         prices_filter: dict, shard_id: Optional[int] = None):
+    """Checks universe of prices source for changes and applies them, until
+    cancelled. Checks are conditional requests, cheap while it is the same"""
+    while True:
+        await asyncio.sleep(universe_poll_interval_s)
+        universe = await price_fetcher.fetch_universe()
+        if universe is not None:
+            apply_universe(*get_shard_universe(universe, shard_id),
+                           fetch_tasks, price_fetcher, detector, queue, prices_filter)
+
+
+def create_detector_workers(detector: ArbitrageDetector, queue: CoalescingQueue):
+    """Coroutines of the pool of workers processing queued quotes. In "pair"
+    mode quotes are processed one by one, otherwise in batches"""
+    if analyzer_mode in ("snapshot", "stream"):
+        async def process(quotes):
+            await detector.process_prices(quotes)
+        batch_size = detector_batch_size
+    else:
+        async def process(quotes):
+            await detector.process_price(quotes[0])
+        batch_size = 1
+    return [run_detector_worker(queue, process, batch_size)
+            for _ in range(max(detector_workers, 1))]
+
+
+async def run(price_fetcher: PriceFetcher, detector: ArbitrageDetector,
+              queue: CoalescingQueue = None, watch: bool = False,
+              shard_id: Optional[int] = None):
+    """Tracks prices in configured mode until cancelled. Fetched quotes are
+    processed by detector workers through the queue. If `watch`, tracked
+    pairs follow changes of prices source's universe"""
+    queue = queue or CoalescingQueue(quotes_queue_size)
+    detector.follows_universe = watch
+    prices_filter = get_prices_filter(detector, watch, shard_id)
+    fetch_tasks: Dict[Hashable, asyncio.Task] = {}
+    sync_fetch_tasks(fetch_tasks, price_fetcher, detector, queue, prices_filter)
+    tasks = create_detector_workers(detector, queue)
+    if watch and universe_poll_interval_s > 0:
+        tasks.append(watch_universe(fetch_tasks, price_fetcher, detector, queue,
+                                    prices_filter, shard_id))
+
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in fetch_tasks.values():
+            task.cancel()
+
+
+def register_metrics(price_fetcher: PriceFetcher, detector: ArbitrageDetector,
+                     queue: CoalescingQueue, pipeline: Optional[OpportunityPipeline] = None):
+    """Exposes counters kept by fetcher, quotes queue, detector and
+    opportunities output, collected on scrape"""
+    collector = metrics.attributes_collector
+    collector.add_gauge("analyzer_queue_depth", "Pairs with a quote waiting for detection",
+                        lambda: len(queue))
+    collector.add_counter("analyzer_queue_quotes", "Quotes queued for detection",
+                          lambda: queue.queued_count)
+    collector.add_counter("analyzer_queue_coalesced",
+                          "Queued quotes replaced by a newer quote of the same pair",
+                          lambda: queue.coalesced_count)
+    collector.add_counter("analyzer_queue_dropped",
+                          "Queued quotes dropped as queue was full",
+                          lambda: queue.dropped_count)
+    if pipeline is not None:
+        collector.add_counter("analyzer_output_opportunities_submitted",
+                              "Opportunities submitted to output",
+                              lambda: pipeline.submitted_count)
+        collector.add_counter("analyzer_output_opportunities_dropped",
+                              "Opportunities dropped or overwritten as output buffer was full",
+                              lambda: pipeline.dropped_count)
+        collector.add_counter("analyzer_output_opportunities_written",
+                              "Opportunities written to at least one output sink",
+                              lambda: pipeline.written_count)
+        collector.add_counter("analyzer_output_sink_opportunities_written",
+                              "Opportunities written by output sink",
+                              lambda: {(name,): count for name, count
+                                       in pipeline.sink_written_counts.items()},
+                              labelnames=("sink",))
+        collector.add_counter("analyzer_output_sink_errors",
+                              "Failed writes of a batch by output sink",
+                              lambda: {(name,): count for name, count
+                                       in pipeline.sink_errors_counts.items()},
+                              labelnames=("sink",))
+        collector.add_counter("analyzer_output_blocked",
+                              "Waits of prices processing for a full output buffer",
+                              lambda: pipeline.blocked_count)
+    collector.add_counter("analyzer_quotes_processed", "Quotes processed by detector",
+                          lambda: detector.quotes_processed)
+    collector.add_counter("analyzer_quotes_dropped_out_of_order",
+                          "Quotes older than already processed quote of the pair",
+                          lambda: detector.quotes_dropped_out_of_order)
+    collector.add_counter("analyzer_quotes_dropped_stale",
+                          "Quotes older than MAX_QUOTE_AGE_S",
+                          lambda: detector.quotes_dropped_stale)
+    collector.add_counter("analyzer_quotes_dropped_untracked",
+                          "Quotes of pairs not tracked, e.g. just added to or removed from universe",
+                          lambda: detector.quotes_dropped_untracked)
+    if detector.opportunity_index is not None:
+        collector.add_counter("analyzer_opportunities_expired",
+                              "Opportunities dropped from index after OPPORTUNITY_TTL_S",
+                              lambda: detector.opportunity_index.opportunities_expired)
+    collector.add_counter("analyzer_log_records_dropped",
+                          "Log records dropped because the log writer thread fell behind",
+                          get_records_dropped)
+    collector.add_counter("analyzer_fetch_not_modified",
+                          "Price requests answered with 304 Not Modified",
+                          lambda: price_fetcher.not_modified_count)
+    collector.add_gauge("analyzer_fetch_requests_active", "Price requests in flight",
+                        lambda: price_fetcher.requests_active)
+    collector.add_gauge("analyzer_fetch_requests_waiting",
+                        "Price requests waiting for a slot under FETCHER_MAX_CONCURRENCY",
+                        lambda: price_fetcher.requests_waiting)
+    collector.add_gauge("analyzer_endpoint_circuit_state",
+                        "Circuit breaker of prices source endpoint: 0 closed, 1 half-open, 2 open",
+                        price_fetcher.balancer.get_circuit_states, labelnames=("endpoint",))
+    collector.add_gauge("analyzer_endpoint_in_flight",
+                        "Requests in flight by prices source endpoint",
+                        price_fetcher.balancer.get_in_flight, labelnames=("endpoint",))
+    collector.add_gauge("analyzer_endpoint_rate_limit_tokens",
+                        "Rate limit tokens available by prices source endpoint",
+                        price_fetcher.balancer.get_rate_limit_tokens, labelnames=("endpoint",))
+    collector.add_counter("analyzer_fetch_hedged",
+                          "Single price requests sent to a second endpoint as the first was slow",
+                          lambda: price_fetcher.balancer.hedged_count)
+    collector.add_counter("analyzer_fetch_hedge_wins",
+                          "Hedged requests answered by the second endpoint first",
+                          lambda: price_fetcher.balancer.hedge_wins_count)
+
+
+def create_recorder(price_fetcher: PriceFetcher, path: str) -> Optional[QuotesRecorder]:
+    """Records all quotes received by fetcher, if recording is enabled"""
+    if not path:
+        return None
+    recorder = QuotesRecorder(path)
+    price_fetcher.add_quotes_listener(recorder.record)
+    return recorder
+
+
+def create_pipeline(detector: ArbitrageDetector,
+                    file_suffix: str = "") -> Optional[OpportunityPipeline]:
+    """Outputs detector's opportunities to configured sinks, if any"""
+    sinks = create_sinks(opportunity_sinks, file_suffix)
+    if not sinks:
+        return None
+    pipeline = OpportunityPipeline(
+        sinks, capacity=opportunity_buffer_size, batch_size=opportunity_batch_size,
+        flush_interval_s=opportunity_flush_interval_s, policy=opportunity_overflow_policy)
+    detector.add_opportunity_listener(pipeline.submit)
+    if pipeline.policy == "block":
+        detector.output_ready = pipeline.wait_ready
+    logger.info("Writing opportunities to %s", ", ".join(sink.name for sink in sinks))
+    return pipeline
 
 
 async def main():
-    detector = ArbitrageDetector()
     price_fetcher = PriceFetcher()
+    await price_fetcher.start()
+    try:
+        universe = (await discover_universe(price_fetcher) if universe_discovery
+                    else (None, None))
+    except BaseException:
+        await price_fetcher.close()
+        raise
+    detector = create_detector(*universe)
+    queue = CoalescingQueue(quotes_queue_size)
+    pipeline = create_pipeline(detector)
+    register_metrics(price_fetcher, detector, queue, pipeline)
+    recorder = create_recorder(price_fetcher, record_quotes_file)
 
-    # initialize task for each asset / market pair
-    tasks = []
-    for asset in detector.assets_list:
-        for market in detector.markets_list:
-            tasks.append(fetch_and_process_price(price_fetcher, detector, asset, market))
+    tasks = [run(price_fetcher, detector, queue, watch=universe_discovery)]
+    if analyzer_api_enabled:
+        tasks.append(serve_api(analyzer_api_host, analyzer_api_port,
+                               detector.opportunity_index, price_fetcher))
+    if pipeline is not None:
+        tasks.append(pipeline.run())
+    if recorder is not None:
+        tasks.append(recorder.run())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await price_fetcher.close()
+        if recorder is not None:
+            recorder.close()
+        if pipeline is not None:
+            await pipeline.close()
 
-    await asyncio.gather(*tasks)
 
+async def report_health_loop(reporter: ShardReporter, detector: ArbitrageDetector,
+                            price_fetcher: PriceFetcher, queue: CoalescingQueue):
+    """Periodically sends shard's health to supervisor"""
+    while True:
+        await asyncio.sleep(health_report_interval_s)
+        reporter.report_health({
+            "pid": os.getpid(),
+            "assets": len(detector.assets_list),
+            "quotes_processed": detector.quotes_processed,
+            "quotes_not_modified": price_fetcher.not_modified_count,
+            "queue_depth": len(queue),
+            "quotes_coalesced": queue.coalesced_count,
+            "quotes_dropped_queue_full": queue.dropped_count,
+            "quotes_dropped_out_of_order": detector.quotes_dropped_out_of_order,
+            "quotes_dropped_stale": detector.quotes_dropped_stale,
+            "quotes_dropped_untracked": detector.quotes_dropped_untracked,
+            "opportunities_found": detector.opportunities_found,
+            "fetcher": price_fetcher.get_limits_state(),
+        })
 
-if __name__ == "__main__":
-    asyncio.run(main())
+
+async def report_discovery_loop(reporter: ShardReporter):
+    """Periodically tells supervisor that the shard is alive while it waits
+    for prices source's universe, so that it is not restarted meanwhile"""
+    while True:
+        await asyncio.sleep(health_report_interval_s)
+        reporter.report_health({"pid": os.getpid(), "discovering_universe": True})
 
 
+async def shard_main(shard_id: int, assets: Optional[List[str]],
+                     markets: Optional[List[str]], reports_queue: multiprocessing.Queue):
+    """Tracks prices of a shard of assets with its own fetcher and detector.
+    Without provided assets and markets, the shard's part of prices source's
+    universe is discovered and followed. Detected opportunities and health
+    are reported to supervisor"""
+    price_fetcher = PriceFetcher()
+    await price_fetcher.start()
+    reporter = ShardReporter(shard_id, reports_queue)
+    watch = assets is None
+    try:
+        if watch:
+            discovery_reporting = asyncio.create_task(report_discovery_loop(reporter))
+            try:
+                assets, markets = await discover_universe(price_fetcher, shard_id)
+            finally:
+                discovery_reporting.cancel()
+    except BaseException:
+        await price_fetcher.close()
+        raise
+    detector = create_detector(assets_list=assets, markets_list=markets)
+    detector.add_opportunity_listener(reporter.report_opportunity)
+    queue = CoalescingQueue(quotes_queue_size)
+    pipeline = create_pipeline(detector, file_suffix=f".{shard_id}")
+    register_metrics(price_fetcher, detector, queue, pipeline)
+    recorder = create_recorder(
+        price_fetcher, record_quotes_file and f"{record_quotes_file}.{shard_id}")
 
+    tasks = [run(price_fetcher, detector, queue, watch=watch, shard_id=shard_id),
+             report_health_loop(reporter, detector, price_fetcher, queue)]
+    if analyzer_api_enabled and analyzer_shard_api_enabled:
+        tasks.append(serve_api(analyzer_api_host, analyzer_api_port + 1 + shard_id,
+                               detector.opportunity_index, price_fetcher))
+    if pipeline is not None:
+        tasks.append(pipeline.run())
+    if recorder is not None:
+        tasks.append(recorder.run())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await price_fetcher.close()
+        if recorder is not None:
+            recorder.close()
+        if pipeline is not None:
+            await pipeline.close()
 
 
+def run_shard_worker(shard_id: int, assets: Optional[List[str]],
+                     markets: Optional[List[str]], reports_queue: multiprocessing.Queue):
+    """Entry point of a shard worker process"""
+    try:
+        asyncio.run(shard_main(shard_id, assets, markets, reports_queue))
+    except KeyboardInterrupt:
+        pass
 
 
+def run_sharded(workers_count: int):
+    """Splits assets between worker processes and supervises them. With
+    universe discovery, each worker discovers its own shard of assets"""
+    assets = markets = None
+    if not universe_discovery:
+        assets, markets = DEFAULT_ASSETS, DEFAULT_MARKETS
+    supervisor = ShardsSupervisor(
+        worker_target=run_shard_worker,
+        assets=assets,
+        markets=markets,
+        workers_count=workers_count,
+        health_timeout_s=health_report_interval_s * 6)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
 
+
+if __name__ == "__main__":
+    if analyzer_workers > 1:
+        run_sharded(analyzer_workers)
+    else:
+        asyncio.run(main())
@@ -1,67 +1,427 @@
 import asyncio
-from typing import Dict, List
+from decouple import config
+import numpy as np
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
 
-from ..utils import schemas
+from .opportunities import OpportunityIndex
+from ..utils import metrics, schemas
 from ..utils.logger import get_logger
 
 
 logger = get_logger(__name__)
 
+# assets and markets tracked unless provided or discovered from prices source
+DEFAULT_ASSETS = ["Copper", "Oil"]
+# 100+ for high load testing 
+# DEFAULT_ASSETS = ["Copper", "Oil", "Gold", "Silver", "Corn", "Coffe", "Sugar", "Wheat", "Rice", "Cotton", "Natural Gas", "Platinum", "Palladium", "Aluminum", "Zinc", "Nickel", "Lead", "Tin", "Iron Ore", "Cobalt", "Lithium", "Uranium", "Ethanol", "Diesel", "Jet Fuel", "Heating Oil"] #, "Gasoline", "Bitumen", "Asphalt", "Steel", "Rubber", "Lumber", "Paper", "Wool", "Silk", "Leather", "Copper Scrap", "Aluminum Scrap", "Gold Scrap", "Platinum Scrap", "Solar Panels", "Wind Turbines", "Batteries", "Electric Vehicles", "Biofuels", "Hydrogen", "LNG (Liquefied Natural Gas)", "LPG (Liquefied Petroleum Gas)", "Coal", "Peat", "Firewood", "Charcoal", "Animal Feed", "Fertilizers", "Pesticides", "Herbicides", "Potash", "Phosphate", "Ammonia", "Urea", "Nitrogen", "Phosphorus", "Sulfur", "Magnesium", "Calcium", "Sodium", "Potassium", "Bauxite", "Boron", "Silicon", "Titanium", "Chromium", "Manganese", "Molybdenum", "Tungsten", "Vanadium", "Bismuth", "Germanium", "Gallium", "Indium", "Tellurium", "Selenium", "Tantalum", "Hafnium", "Zirconium", "Niobium", "Antimony", "Arsenic", "Cadmium", "Cesium", "Thallium", "Yttrium", "Samarium", "Gadolinium", "Terbium", "Dysprosium", "Holmium", "Erbium", "Thulium", "Ytterbium", "Lutetium", "Scandium", "Lanthanum", "Cerium", "Praseodymium", "Neodymium", "Promethium", "Europium", "Osmium", "Rhenium", "Ruthenium", "Rhodium", "Iridium", "Fluorspar", "Gypsum", "Salt", "Limestone", "Granite", "Marble", "Sand", "Gravel", "Clay", "Feldspar", "Phosphate Rock", "Potash Rock", "Bentonite", "Kaolin", "Talc", "Quartz", "Asbestos", "Barite", "Bentonite Clay", "Feldspar", "Graphite", "Talc", "Zeolites", "Borates", "Chromium Ore", "Nickel Ore", "Cobalt Ore", "Zinc Ore", "Lead Ore", "Tin Ore", "Bauxite Ore", "Manganese Ore", "Titanium Ore", "Uranium Ore", "Phosphate Ore", "Iron Ore Pellets", "Copper Ore", "Gold Ore", "Silver Ore", "Platinum Ore", "Palladium Ore", "Saltwater", "Freshwater", "Seawater", "Groundwater", "Deionized Water", "Distilled Water", "River Water", "Lake Water", "Glacier Water", "Bottled Water", "Tap Water", "Drinking Water", "Industrial Water", "Wastewater", "Reclaimed Water", "Rainwater", "Stormwater", "Snow", "Ice", "Brine", "Brackish Water", "Soft Water", "Hard Water", "Ultra-pure Water", "Process Water", "Cooling Water", "Boiling Water", "Hot Water", "Steam", "Wet Steam", "Dry Steam", "Superheated Steam", "Saturated Steam", "Low-Pressure Steam", "High-Pressure Steam", "Hydrogen Gas", "Oxygen Gas", "Nitrogen Gas", "Carbon Dioxide", "Argon Gas", "Helium Gas", "Methane Gas", "Propane Gas", "Butane Gas", "Ethane Gas", "Ammonia Gas", "Chlorine Gas", "Sulfur Dioxide Gas", "Hydrogen Sulfide Gas", "Acetylene Gas", "Carbon Monoxide Gas", "Nitrous Oxide Gas", "Ozone"]
+DEFAULT_MARKETS = ["US", "UK"]
+# 8 markets for high load testing
+# DEFAULT_MARKETS = ["US", "UK" , "Europe", "Asia", "Africa", "North America", "Eastern Europe", "Australia"]
+
 
 class ArbitrageDetector:
     """
     Implements arbitrage detector. 
     
     Functionality:
-    - Tracks lowest buying and highest selling prices detected, including 
-      market where price was detected.
+    - Tracks buying and selling prices of each asset on each market.
     - Provided a new price for an asset, detect arbitrage opportunity 
+
+    Prices are stored in `assets x markets` matrices, so best buying (lowest
+    ask) and best selling (highest bid) prices of an asset are always 
+    recomputed from the latest quote of every market. 
+    State is partitioned by asset: each asset has its own lock, so prices of
+    different assets are processed independently.
+
+    If prices source stamps quotes with sequence number (`version`) and 
+    generation time, quotes older than the one already applied for the pair 
+    (e.g. delayed by a slow or retried request) and quotes older than 
+    `max_quote_age_s` are dropped, so they can not produce phantom 
+    opportunities. Quotes without stamps are always applied.
+
+    Tracked assets and markets can be changed at runtime with
+    `set_universe`, keeping the book of pairs which stay tracked.
     """
 
-    def __init__(self):
-        self.prices_dict: Dict[str, schemas.AssetData] = {}
-        self.assets_list: List[str] = None
-        self.markets_list: List[str] = None
-        self.lock = asyncio.Lock()
-        self._set_assets_list()
-        self._set_markets_list()
+    # a check of an asset evaluates all its markets, not only the quoted one
+    checks_all_routes = True
+
+    def __init__(self, assets_list: List[str] = None, markets_list: List[str] = None,
+                 max_quote_age_s: float = None, clock: Callable[[], float] = None):
+        self.prices_buy: np.ndarray = None
+        self.prices_sell: np.ndarray = None
+        # sequence number and generation time of applied quotes
+        self.versions: np.ndarray = None
+        self.generated_at: np.ndarray = None
+        # 0 disables staleness check
+        self.max_quote_age_s = (max_quote_age_s if max_quote_age_s is not None
+                                else config('MAX_QUOTE_AGE_S', default=15.0, cast=float))
+        # unix time source, replaced by recorded time on replay
+        self.clock: Callable[[], float] = clock or time.time
+        self.assets_index: Dict[str, int] = {}
+        self.markets_index: Dict[str, int] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        # incremented on each change of tracked assets and markets, which
+        # invalidates book indices
+        self.universe_version = 0
+        # set if tracked assets and markets follow changes of prices source's
+        # ones. Quotes of pairs just added or removed there are expected then,
+        # otherwise a quote of an untracked pair means misconfiguration
+        self.follows_universe = False
+        # called with details of each detected opportunity
+        self.opportunity_listeners: List[Callable[[dict], None]] = []
+        # awaited before processing quotes if set, so that a full output of
+        # opportunities slows prices processing down instead of losing them
+        self.output_ready: Optional[Callable[[], Awaitable[None]]] = None
+        # live ranking of current opportunities, updated on each check if set
+        self.opportunity_index: Optional[OpportunityIndex] = None
+        self.quotes_processed = 0
+        self.quotes_dropped_out_of_order = 0
+        self.quotes_dropped_stale = 0
+        self.quotes_dropped_untracked = 0
+        self.opportunities_found = 0
+        self.assets_list: List[str] = assets_list
+        self.markets_list: List[str] = markets_list
+        if self.assets_list is None:
+            self._set_assets_list()
+        if self.markets_list is None:
+            self._set_markets_list()
         self._initialize_prices()
 
 
     def _set_assets_list(self) -> None:
         """Mocks getting and storing a list of assets to track"""
-        self.assets_list = ["Copper", "Oil"]
-
-        # 100+ for high load testing 
-        # self.assets_list = ["Copper", "Oil", "Gold", "Silver", "Corn", "Coffe", "Sugar", "Wheat", "Rice", "Cotton", "Natural Gas", "Platinum", "Palladium", "Aluminum", "Zinc", "Nickel", "Lead", "Tin", "Iron Ore", "Cobalt", "Lithium", "Uranium", "Ethanol", "Diesel", "Jet Fuel", "Heating Oil"] #, "Gasoline", "Bitumen", "Asphalt", "Steel", "Rubber", "Lumber", "Paper", "Wool", "Silk", "Leather", "Copper Scrap", "Aluminum Scrap", "Gold Scrap", "Platinum Scrap", "Solar Panels", "Wind Turbines", "Batteries", "Electric Vehicles", "Biofuels", "Hydrogen", "LNG (Liquefied Natural Gas)", "LPG (Liquefied Petroleum Gas)", "Coal", "Peat", "Firewood", "Charcoal", "Animal Feed", "Fertilizers", "Pesticides", "Herbicides", "Potash", "Phosphate", "Ammonia", "Urea", "Nitrogen", "Phosphorus", "Sulfur", "Magnesium", "Calcium", "Sodium", "Potassium", "Bauxite", "Boron", "Silicon", "Titanium", "Chromium", "Manganese", "Molybdenum", "Tungsten", "Vanadium", "Bismuth", "Germanium", "Gallium", "Indium", "Tellurium", "Selenium", "Tantalum", "Hafnium", "Zirconium", "Niobium", "Antimony", "Arsenic", "Cadmium", "Cesium", "Thallium", "Yttrium", "Samarium", "Gadolinium", "Terbium", "Dysprosium", "Holmium", "Erbium", "Thulium", "Ytterbium", "Lutetium", "Scandium", "Lanthanum", "Cerium", "Praseodymium", "Neodymium", "Promethium", "Europium", "Osmium", "Rhenium", "Ruthenium", "Rhodium", "Iridium", "Fluorspar", "Gypsum", "Salt", "Limestone", "Granite", "Marble", "Sand", "Gravel", "Clay", "Feldspar", "Phosphate Rock", "Potash Rock", "Bentonite", "Kaolin", "Talc", "Quartz", "Asbestos", "Barite", "Bentonite Clay", "Feldspar", "Graphite", "Talc", "Zeolites", "Borates", "Chromium Ore", "Nickel Ore", "Cobalt Ore", "Zinc Ore", "Lead Ore", "Tin Ore", "Bauxite Ore", "Manganese Ore", "Titanium Ore", "Uranium Ore", "Phosphate Ore", "Iron Ore Pellets", "Copper Ore", "Gold Ore", "Silver Ore", "Platinum Ore", "Palladium Ore", "Saltwater", "Freshwater", "Seawater", "Groundwater", "Deionized Water", "Distilled Water", "River Water", "Lake Water", "Glacier Water", "Bottled Water", "Tap Water", "Drinking Water", "Industrial Water", "Wastewater", "Reclaimed Water", "Rainwater", "Stormwater", "Snow", "Ice", "Brine", "Brackish Water", "Soft Water", "Hard Water", "Ultra-pure Water", "Process Water", "Cooling Water", "Boiling Water", "Hot Water", "Steam", "Wet Steam", "Dry Steam", "Superheated Steam", "Saturated Steam", "Low-Pressure Steam", "High-Pressure Steam", "Hydrogen Gas", "Oxygen Gas", "Nitrogen Gas", "Carbon Dioxide", "Argon Gas", "Helium Gas", "Methane Gas", "Propane Gas", "Butane Gas", "Ethane Gas", "Ammonia Gas", "Chlorine Gas", "Sulfur Dioxide Gas", "Hydrogen Sulfide Gas", "Acetylene Gas", "Carbon Monoxide Gas", "Nitrous Oxide Gas", "Ozone"]
+        self.assets_list = list(DEFAULT_ASSETS)
         return
 
 
     def _set_markets_list(self) -> None:
         """Mocks getting and storing a list of markets to track"""
-        self.markets_list = ["US", "UK"]
-
-        # 8 markets for high load testing
-        # self.market_list = ["US", "UK" , "Europe", "Asia", "Africa", "North America", "Eastern Europe", "Australia"] 
+        self.markets_list = list(DEFAULT_MARKETS)
         return 
 
 
     def _initialize_prices(self) -> None:
-        """Mocks getting initial prices for each asset"""
-        for asset in self.assets_list:
-            self.prices_dict[asset] = schemas.AssetData(
-                price_buy = float('inf'),
-                price_sell = 0.0,
-                location_buy = "US",
-                location_sell = "US"
-            )
+        """Initializes empty book: no market has a quote for any asset yet"""
+        self.assets_index = {asset: i for i, asset in enumerate(self.assets_list)}
+        self.markets_index = {market: i for i, market in enumerate(self.markets_list)}
+        shape = (len(self.assets_list), len(self.markets_list))
+        self.prices_buy = np.full(shape, np.inf)
+        self.prices_sell = np.zeros(shape)
+        self.versions = np.zeros(shape, dtype=np.int64)
+        self.generated_at = np.zeros(shape)
+        self.locks = {asset: asyncio.Lock() for asset in self.assets_list}
         return
 
 
-    async def check_for_arbitrage(self, 
-                                  asset_price: schemas.AssetPriceFromApi) -> dict:
-        """Compares provided asset price with current stored price and 
-        provides a response indicating if an arbitrage opportunity is detected 
+    def set_universe(self, assets_list: List[str], markets_list: List[str]) -> None:
+        """Starts tracking provided assets and markets instead of current
+        ones. Quotes of pairs tracked before and after are kept, new pairs
+        have no quotes yet. Opportunities of assets and markets which are no
+        longer tracked are removed from the index"""
+        previous_assets_idx = np.array(
+            [self.assets_index.get(asset, -1) for asset in assets_list], dtype=np.intp)
+        previous_markets_idx = np.array(
+            [self.markets_index.get(market, -1) for market in markets_list], dtype=np.intp)
+        removed_assets = set(self.assets_list).difference(assets_list)
+        removed_markets = set(self.markets_list).difference(markets_list)
+        previous_books = (self.prices_buy, self.prices_sell, self.versions, self.generated_at)
+        previous_locks = self.locks
+
+        self.assets_list, self.markets_list = list(assets_list), list(markets_list)
+        self._initialize_prices()
+        # a lock may be held by a check in progress
+        for asset, lock in previous_locks.items():
+            if asset in self.locks:
+                self.locks[asset] = lock
+        assets_idx = np.flatnonzero(previous_assets_idx >= 0)
+        markets_idx = np.flatnonzero(previous_markets_idx >= 0)
+        kept = np.ix_(assets_idx, markets_idx)
+        previous_kept = np.ix_(previous_assets_idx[assets_idx], previous_markets_idx[markets_idx])
+        for book, previous_book in zip(
+                (self.prices_buy, self.prices_sell, self.versions, self.generated_at),
+                previous_books):
+            book[kept] = previous_book[previous_kept]
+        self.universe_version += 1
+
+        if self.opportunity_index is not None:
+            self.opportunity_index.discard(assets=removed_assets, markets=removed_markets)
+        logger.info("Tracking %d assets on %d markets",
+                    len(self.assets_list), len(self.markets_list))
+
+
+    def _get_indices(self, asset_price: schemas.AssetPriceFromApi):
+        asset_idx = self.assets_index.get(asset_price.name, None)
+        market_idx = self.markets_index.get(asset_price.market, None)
+        if asset_idx is None or market_idx is None:
+            self.quotes_dropped_untracked += 1
+            log = logger.debug if self.follows_universe else logger.error
+            log("Asset %s in %s is not tracked.", asset_price.name, asset_price.market)
+        return asset_idx, market_idx
+
+
+    def _is_stale(self, generated_at: Optional[float], now: float) -> bool:
+        if (generated_at is None or not self.max_quote_age_s
+                or now - generated_at <= self.max_quote_age_s):
+            return False
+        self.quotes_dropped_stale += 1
+        return True
+
+
+    def _is_out_of_order(self, asset_idx: int, market_idx: int,
+                         version: Optional[int], generated_at: Optional[float]) -> bool:
+        """Quote is out of order if it is not newer than already applied 
+        quote of the pair. A lower sequence number with a later generation
+        time means prices source was restarted, such quote is accepted"""
+        if version is None or version > self.versions[asset_idx, market_idx]:
+            return False
+        if generated_at is not None and generated_at > self.generated_at[asset_idx, market_idx]:
+            return False
+        self.quotes_dropped_out_of_order += 1
+        return True
+
+
+    async def process_price(self, asset_price: schemas.AssetPriceFromApi) -> dict:
+        """Applies provided asset price to the book and checks the asset for 
+        arbitrage opportunity. Both steps are done as one atomic step under 
+        the asset's lock, so a check always sees all previously received 
+        prices applied.
+        """
+        if self.output_ready is not None:
+            await self.output_ready()
+        asset_idx, market_idx = self._get_indices(asset_price)
+        if asset_idx is None or market_idx is None:
+            return {"arbitrage_found": False, "details": []}
+
+        version, generated_at = asset_price.version, asset_price.generated_at
+        if self._is_stale(generated_at, self.clock()):
+            return {"arbitrage_found": False, "details": []}
+
+        price_buy = round(asset_price.price * (1 + asset_price.spread / 100), 4)
+        price_sell = round(asset_price.price * (1 - asset_price.spread / 100), 4)
+
+        universe_version = self.universe_version
+        lock_requested = time.perf_counter()
+        async with self.locks[asset_price.name]:
+            metrics.lock_wait_seconds.observe(time.perf_counter() - lock_requested)
+            if universe_version != self.universe_version:
+                # tracked assets or markets changed while waiting for the lock
+                asset_idx, market_idx = self._get_indices(asset_price)
+                if asset_idx is None or market_idx is None:
+                    return {"arbitrage_found": False, "details": []}
+            if self._is_out_of_order(asset_idx, market_idx, version, generated_at):
+                return {"arbitrage_found": False, "details": []}
+            self.prices_buy[asset_idx, market_idx] = price_buy
+            self.prices_sell[asset_idx, market_idx] = price_sell
+            if version is not None:
+                self.versions[asset_idx, market_idx] = version
+            if generated_at is not None:
+                self.generated_at[asset_idx, market_idx] = generated_at
+
+            response = self._check_asset(asset_idx, market_idx)
+
+        self.quotes_processed += 1
+        self._update_index(asset_idx, [market_idx], response)
+        self._notify_listeners(response)
+        return response
+
+
+    async def process_prices(self, 
+                             assets_prices: List[schemas.AssetPriceFromApi]
+                             ) -> List[dict]:
+        """Applies a batch of prices (e.g. a whole prices snapshot) to the book
+        and checks each affected asset once, in a single vectorized pass. 
+        Returns a response per affected asset. 
+        Runs without yielding to the event loop, so it is atomic with respect 
+        to `process_price` calls.
+        """
+        if self.output_ready is not None:
+            await self.output_ready()
+        indices = [self._get_indices(asset_price) for asset_price in assets_prices]
+        tracked = [i for i, (asset_idx, market_idx) in enumerate(indices)
+                   if asset_idx is not None and market_idx is not None]
+        if not tracked:
+            return []
+
+        # missing stamps are -1 and NaN, which never cause a quote to be dropped
+        return self.process_prices_arrays(
+            assets_idx=np.fromiter((indices[i][0] for i in tracked), 
+                                   dtype=np.intp, count=len(tracked)),
+            markets_idx=np.fromiter((indices[i][1] for i in tracked), 
+                                    dtype=np.intp, count=len(tracked)),
+            prices=np.fromiter((assets_prices[i].price for i in tracked), 
+                               dtype=float, count=len(tracked)),
+            spreads=np.fromiter((assets_prices[i].spread for i in tracked), 
+                                dtype=float, count=len(tracked)),
+            versions=np.fromiter((-1 if assets_prices[i].version is None 
+                                  else assets_prices[i].version for i in tracked),
+                                 dtype=np.int64, count=len(tracked)),
+            generated_at=np.fromiter((np.nan if assets_prices[i].generated_at is None
+                                      else assets_prices[i].generated_at for i in tracked),
+                                     dtype=float, count=len(tracked)))
+
+
+    def process_prices_arrays(self, assets_idx: np.ndarray, markets_idx: np.ndarray,
+                              prices: np.ndarray, spreads: np.ndarray,
+                              versions: np.ndarray, generated_at: np.ndarray
+                              ) -> List[dict]:
+        """Array based implementation of `process_prices`: quotes are 
+        provided as arrays of book indices, prices, spreads, sequence numbers 
+        (-1 if missing) and generation times (NaN if missing), e.g. read from
+        a quotes recording without building a model per quote"""
+        if not len(assets_idx):
+            return []
+
+        accepted = self._get_accepted_quotes(assets_idx, markets_idx, versions, generated_at)
+        if not accepted.all():
+            assets_idx, markets_idx = assets_idx[accepted], markets_idx[accepted]
+            prices, spreads = prices[accepted], spreads[accepted]
+            versions, generated_at = versions[accepted], generated_at[accepted]
+            if not len(assets_idx):
+                return []
+
+        quotes_count = len(assets_idx)
+        newest = self._get_newest_quotes(assets_idx, markets_idx, versions, generated_at)
+        if newest is not None:
+            assets_idx, markets_idx = assets_idx[newest], markets_idx[newest]
+            prices, spreads = prices[newest], spreads[newest]
+            versions, generated_at = versions[newest], generated_at[newest]
+
+        self.prices_buy[assets_idx, markets_idx] = np.round(prices * (1 + spreads / 100), 4)
+        self.prices_sell[assets_idx, markets_idx] = np.round(prices * (1 - spreads / 100), 4)
+        self.versions[assets_idx, markets_idx] = np.where(
+            versions >= 0, versions, self.versions[assets_idx, markets_idx])
+        self.generated_at[assets_idx, markets_idx] = np.where(
+            np.isnan(generated_at), self.generated_at[assets_idx, markets_idx], generated_at)
+
+        responses = self._check_assets(assets_idx, markets_idx)
+
+        self.quotes_processed += quotes_count
+        if self.opportunity_index is not None:
+            self._update_index_batch(assets_idx, markets_idx, responses)
+        for response in responses:
+            self._notify_listeners(response)
+        return responses
+
+
+    def _get_accepted_quotes(self, assets_idx: np.ndarray, markets_idx: np.ndarray,
+                             versions: np.ndarray, generated_at: np.ndarray
+                             ) -> np.ndarray:
+        """Vectorized `_is_stale` and `_is_out_of_order` checks of a batch. 
+        Returns mask of quotes to apply"""
+        # comparisons with NaN are always false
+        stale = np.zeros(len(versions), dtype=bool)
+        if self.max_quote_age_s:
+            stale = self.clock() - generated_at > self.max_quote_age_s
+        newer = ((versions < 0)
+                 | (versions > self.versions[assets_idx, markets_idx])
+                 | (generated_at > self.generated_at[assets_idx, markets_idx]))
+        accepted = ~stale & newer
+
+        self.quotes_dropped_stale += int(stale.sum())
+        self.quotes_dropped_out_of_order += int((~stale & ~newer).sum())
+        return accepted
+
+
+    def _get_newest_quotes(self, assets_idx: np.ndarray, markets_idx: np.ndarray,
+                           versions: np.ndarray, generated_at: np.ndarray
+                           ) -> Optional[np.ndarray]:
+        """If a pair is quoted multiple times in a batch (e.g. a batch of
+        consecutive snapshots), returns indices of the newest quote of each
+        pair: by generation time, then sequence number, then position in the
+        batch. Returns None if all pairs are quoted once"""
+        pairs = assets_idx * len(self.markets_list) + markets_idx
+        order = np.lexsort((np.arange(len(pairs)), versions,
+                            np.nan_to_num(generated_at, nan=-np.inf), pairs))
+        sorted_pairs = pairs[order]
+        is_last = np.empty(len(order), dtype=bool)
+        is_last[:-1] = sorted_pairs[1:] != sorted_pairs[:-1]
+        is_last[-1] = True
+        if is_last.all():
+            return None
+        return np.sort(order[is_last])
+
+
+    def _update_index(self, asset_idx: int, markets_idx: Iterable[int],
+                      response: dict) -> None:
+        """Replaces opportunities of the asset re-evaluated by its check with
+        the found one. A check of this engine re-evaluates all markets of the
+        asset, regardless of quoted `markets_idx`"""
+        if self.opportunity_index is None:
+            return
+        details = response["details"][0] if response["arbitrage_found"] else None
+        markets = (None if self.checks_all_routes
+                   else [self.markets_list[market_idx] for market_idx in markets_idx])
+        self.opportunity_index.update(self.assets_list[asset_idx], details, markets,
+                                      now=self.clock())
+
+
+    def _update_index_batch(self, assets_idx: np.ndarray, markets_idx: np.ndarray,
+                            responses: List[dict]) -> None:
+        """`_update_index` of a batch, with a response per affected asset"""
+        if self.checks_all_routes:
+            for asset_idx, response in zip(np.unique(assets_idx), responses):
+                self._update_index(int(asset_idx), (), response)
+            return
+        pairs = np.unique(assets_idx * len(self.markets_list) + markets_idx)
+        pairs_assets_idx, pairs_markets_idx = np.divmod(pairs, len(self.markets_list))
+        affected_assets_idx, starts = np.unique(pairs_assets_idx, return_index=True)
+        for asset_idx, asset_markets_idx, response in zip(
+                affected_assets_idx, np.split(pairs_markets_idx, starts[1:]), responses):
+            self._update_index(int(asset_idx), asset_markets_idx.tolist(), response)
+
+
+    def add_opportunity_listener(self, listener: Callable[[dict], None]) -> None:
+        """Registers a callback to be called with details of each detected
+        opportunity. Callbacks are called after the asset's lock is released"""
+        self.opportunity_listeners.append(listener)
+
+
+    def _notify_listeners(self, response: dict) -> None:
+        if not response["arbitrage_found"]:
+            return
+        for details in response["details"]:
+            logger.debug(details["message"])
+            self.opportunities_found += 1
+            metrics.opportunities_total.labels(details["asset"]).inc()
+            if details["detection_latency_s"] is not None:
+                metrics.detection_latency_seconds.observe(details["detection_latency_s"])
+            for listener in self.opportunity_listeners:
+                try:
+                    listener(details)
+                except Exception as e:
+                    logger.error("Opportunity listener %s failed: %r", listener, e)
+
+
+    def _check_asset(self, asset_idx: int, market_idx: int) -> dict:
+        """Checks an asset for arbitrage after a quote of the market was
+        applied. Best buying and selling prices are taken over all markets"""
+        best_buy_idx = int(self.prices_buy[asset_idx].argmin())
+        best_sell_idx = int(self.prices_sell[asset_idx].argmax())
+        return self._check_for_arbitrage(asset_idx, best_buy_idx, best_sell_idx)
+
+
+    def _check_assets(self, assets_idx: np.ndarray, markets_idx: np.ndarray
+                      ) -> List[dict]:
+        """Vectorized `_check_asset` of a batch of applied quotes. Returns a
+        response per affected asset"""
+        affected_assets_idx = np.unique(assets_idx)
+        best_buy_idx = self.prices_buy[affected_assets_idx].argmin(axis=1)
+        best_sell_idx = self.prices_sell[affected_assets_idx].argmax(axis=1)
+
+        return [self._check_for_arbitrage(int(asset_idx), int(buy_idx), int(sell_idx))
+                for asset_idx, buy_idx, sell_idx 
+                in zip(affected_assets_idx, best_buy_idx, best_sell_idx)]
+
+
+    def _check_for_arbitrage(self, asset_idx: int, 
+                             best_buy_idx: int, best_sell_idx: int) -> dict:
+        """Provides a response indicating if an arbitrage opportunity is 
+        detected: the asset can be bought on one market cheaper than sold
+        on another one.
+        Opportunity's latency is measured from generation of its newest 
+        quote, which triggered it, if quotes are stamped.
         """
 
         response = {
@@ -69,82 +429,56 @@ class ArbitrageDetector:
             , "details": []           # Placeholder
         }
 
-        async with self.lock:
-            asset_data = self.prices_dict.get(asset_price.name, None)
-            if not asset_data:
-                return response
-
-            curr_price_buy = asset_data.price_buy
-            curr_price_sell = asset_data.price_sell
-
-            new_price_buy = asset_price.price * (1 + asset_price.spread / 100)
-            new_price_sell = asset_price.price * (1 - asset_price.spread / 100)
+        price_buy = float(self.prices_buy[asset_idx, best_buy_idx])
+        price_sell = float(self.prices_sell[asset_idx, best_sell_idx])
 
-            if new_price_buy < curr_price_sell:
-                message = ("Arbitrage possibility detected:"
-                            + f" Buy from new location, sell at : {asset_data.location_sell}")
-                response["details"].append({"message": message})
-                logger.debug(message)
-                response["arbitrage_found"] = True
-
-            if new_price_sell > curr_price_buy:
-                message = ("Arbitrage possibility detected."
-                            + f" Buy from {asset_data.location_buy}, sell at new location")
-                logger.debug(message)
-                response["details"].append(message)
-                response["arbitrage_found"] = True
+        if best_buy_idx != best_sell_idx and price_buy < price_sell:
+            response["details"].append(self._get_opportunity_details(
+                asset_idx, best_buy_idx, best_sell_idx, 
+                margin=round(price_sell - price_buy, 4)))
+            response["arbitrage_found"] = True
 
         return response
 
 
-    async def price_update(self, asset_data: schemas.AssetPriceFromApi) -> None:
-        """Asyncroneous wrapper over function implementation. Adds timeout functionality 
-        to drop execution if takes much longer than expected"""
-        try:
-            # timeout to avoid hanging
-            await asyncio.wait_for(self._price_update_internal(asset_data), timeout=2.0)
-        except asyncio.TimeoutError:
-            logger.error(f"Timeout during price update for {asset_data.name} in {asset_data.market}")
+    def _get_opportunity_details(self, asset_idx: int, buy_idx: int, sell_idx: int,
+                                 margin: float, message_suffix: str = "") -> dict:
+        asset = self.assets_list[asset_idx]
+        market_buy = self.markets_list[buy_idx]
+        market_sell = self.markets_list[sell_idx]
+        price_buy = float(self.prices_buy[asset_idx, buy_idx])
+        price_sell = float(self.prices_sell[asset_idx, sell_idx])
+        message = (f"Arbitrage possibility detected for {asset}:"
+                   + f" buy at {market_buy} for {price_buy},"
+                   + f" sell at {market_sell} for {price_sell}"
+                   + message_suffix)
+        generated_at = float(max(self.generated_at[asset_idx, buy_idx],
+                                 self.generated_at[asset_idx, sell_idx]))
+        detected_at = self.clock()
+        return {
+            "message": message,
+            "asset": asset,
+            "market_buy": market_buy,
+            "market_sell": market_sell,
+            "price_buy": price_buy,
+            "price_sell": price_sell,
+            "margin": margin,
+            "generated_at": generated_at or None,
+            "detected_at": detected_at,
+            "detection_latency_s": detected_at - generated_at if generated_at else None,
+        }
 
-        return
 
+    def get_best_prices(self, asset: str) -> schemas.AssetData:
+        """Returns current lowest buying and highest selling prices of an 
+        asset, including markets where they are available"""
+        asset_idx = self.assets_index[asset]
+        best_buy_idx = int(self.prices_buy[asset_idx].argmin())
+        best_sell_idx = int(self.prices_sell[asset_idx].argmax())
 
-    async def _price_update_internal(self, asset_data: schemas.AssetPriceFromApi) -> None:
-        """Implementation of price update.
-        A price is updated in any of these cases:
-        1) the new price comes from the same market as currently stored value
-        2) the new buying price is lower than the stored one
-        3) the new selling price is lower than the stored one
-        """
-        async with self.lock:
-            curr_entry = self.prices_dict.get(asset_data.name, None)
-
-            if not curr_entry:
-                logger.error(f"Asset {asset_data.name} not found in prices_dict.")
-                return
-
-            new_price_buy = round(asset_data.price * (1 + asset_data.spread / 100), 4)
-            new_price_sell = round(asset_data.price * (1 - asset_data.spread / 100), 4)
-            new_location = asset_data.market
-
-            logger.debug((f"Asset: {asset_data.name}, market: {asset_data.market}"
-                            + f" curr_price_buy: {curr_entry.price_buy}"
-                            + f" new_price_buy: {new_price_buy}")
-                            + f" curr_price_sell: {curr_entry.price_sell}"
-                            + f" new_price_sell: {new_price_sell}")
-
-            if (new_price_buy < curr_entry.price_buy 
-                or new_location == curr_entry.location_buy):
-                logger.info(f"Updating buying price")
-                curr_entry.price_buy = new_price_buy
-                curr_entry.location_buy = new_location
-
-            if (new_price_sell > curr_entry.price_sell
-                or new_location == curr_entry.location_sell):
-                logger.debug(f"Updating selling price")
-                curr_entry.price_sell = new_price_sell
-                curr_entry.location_sell = new_location
-
-            self.prices_dict[asset_data.name] = curr_entry
-
-        return
\ No newline at end of file
+        return schemas.AssetData(
+            price_buy=float(self.prices_buy[asset_idx, best_buy_idx]),
+            price_sell=float(self.prices_sell[asset_idx, best_sell_idx]),
+            location_buy=self.markets_list[best_buy_idx],
+            location_sell=self.markets_list[best_sell_idx]
+        )
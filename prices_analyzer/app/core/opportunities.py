@@ -0,0 +1,232 @@
+import heapq
+import itertools
+import time
+from typing import Callable, Dict, Generic, Hashable, Iterable, List, Optional, Tuple, TypeVar
+
+
+Key = TypeVar("Key", bound=Hashable)
+
+
+class IndexedHeap(Generic[Key]):
+    """
+    Binary min-heap of keys by priority, which tracks position of each key,
+    so priority of any key can be updated or the key removed in O(log n).
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[float, Key]] = []
+        self.positions: Dict[Key, int] = {}
+
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+    def __contains__(self, key: Key) -> bool:
+        return key in self.positions
+
+
+    def peek(self) -> Tuple[float, Key]:
+        return self.entries[0]
+
+
+    def set(self, key: Key, priority: float) -> None:
+        """Adds the key or updates its priority"""
+        position = self.positions.get(key, None)
+        if position is None:
+            self.entries.append((priority, key))
+            self._sift_up(len(self.entries) - 1, (priority, key))
+            return
+        previous = self.entries[position][0]
+        if priority < previous:
+            self._sift_up(position, (priority, key))
+        else:
+            self._sift_down(position, (priority, key))
+
+
+    def remove(self, key: Key) -> None:
+        position = self.positions.pop(key)
+        last = self.entries.pop()
+        if position == len(self.entries):
+            return
+        # move the last entry to the freed position and restore heap order
+        if position > 0 and last[0] < self.entries[(position - 1) // 2][0]:
+            self._sift_up(position, last)
+        else:
+            self._sift_down(position, last)
+
+
+    def pop(self) -> Tuple[float, Key]:
+        entry = self.peek()
+        self.remove(entry[1])
+        return entry
+
+
+    def get_smallest(self, count: int) -> List[Tuple[float, Key]]:
+        """Returns `count` entries with the smallest priorities in O(count log
+        count), walking the heap from its root with a frontier heap"""
+        entries = self.entries
+        result: List[Tuple[float, Key]] = []
+        # (priority, position) of candidates: children of already taken entries
+        frontier = [(entries[0][0], 0)] if entries else []
+        while frontier and len(result) < count:
+            _, position = heapq.heappop(frontier)
+            result.append(entries[position])
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(entries):
+                    heapq.heappush(frontier, (entries[child][0], child))
+        return result
+
+
+    def _sift_up(self, position: int, entry: Tuple[float, Key]) -> None:
+        """Places entry at the position or above it, moving parents down"""
+        entries, positions = self.entries, self.positions
+        while position > 0:
+            parent = (position - 1) // 2
+            if entries[parent][0] <= entry[0]:
+                break
+            entries[position] = entries[parent]
+            positions[entries[position][1]] = position
+            position = parent
+        entries[position] = entry
+        positions[entry[1]] = position
+
+
+    def _sift_down(self, position: int, entry: Tuple[float, Key]) -> None:
+        """Places entry at the position or below it, moving children up"""
+        entries, positions = self.entries, self.positions
+        size = len(entries)
+        while True:
+            child = 2 * position + 1
+            if child >= size:
+                break
+            if child + 1 < size and entries[child + 1][0] < entries[child][0]:
+                child += 1
+            if entry[0] <= entries[child][0]:
+                break
+            entries[position] = entries[child]
+            positions[entries[position][1]] = position
+            position = child
+        entries[position] = entry
+        positions[entry[1]] = position
+
+
+# asset, buying market, selling market
+OpportunityKey = Tuple[str, str, str]
+
+
+class OpportunityIndex:
+    """
+    Live ranking of current arbitrage opportunities by margin.
+
+    Detector updates the index on every check of an asset: opportunities of
+    the asset which the check re-evaluated are replaced with the one it
+    found, if any. Opportunities expire `ttl_s` after their last detection,
+    unless detected again, so ones built on quotes which stopped updating
+    drop out. All updates are O(log n), the top K are returned in
+    O(K log K).
+    """
+
+    def __init__(self, ttl_s: float = 15.0, clock: Callable[[], float] = None):
+        # 0 disables expiry
+        self.ttl_s = ttl_s
+        self.clock: Callable[[], float] = clock or time.time
+        self.opportunities: Dict[OpportunityKey, dict] = {}
+        self.keys_by_asset: Dict[str, set] = {}
+        # negated margin, so the smallest priority is the best opportunity
+        self.by_margin: IndexedHeap[OpportunityKey] = IndexedHeap()
+        # expiry time by key, in order of expiry: detection time only grows
+        # and TTL is the same for all, so a refreshed key moves to the end
+        self.expiries: Dict[OpportunityKey, float] = {}
+        self.opportunities_expired = 0
+
+
+    def __len__(self) -> int:
+        return len(self.opportunities)
+
+
+    def update(self, asset: str, details: Optional[dict],
+               markets: Optional[Iterable[str]] = None, now: float = None) -> None:
+        """Applies a check of an asset, which found opportunity `details` or
+        None. The check re-evaluated either all routes of the asset, or only
+        routes starting or ending at one of `markets`"""
+        found_key = (None if details is None
+                     else (details["asset"], details["market_buy"], details["market_sell"]))
+        asset_keys = self.keys_by_asset.get(asset, None)
+        if asset_keys:
+            markets = None if markets is None else set(markets)
+            for key in list(asset_keys):
+                if key == found_key:
+                    continue  # updated in place, keeping its first detection time
+                if markets is None or key[1] in markets or key[2] in markets:
+                    self._remove(key)
+        if details is not None:
+            self._add(found_key, details)
+        self.expire(now)
+
+
+    def _add(self, key: OpportunityKey, details: dict) -> None:
+        previous = self.opportunities.get(key, None)
+        opportunity = {
+            "asset": details["asset"],
+            "market_buy": details["market_buy"],
+            "market_sell": details["market_sell"],
+            "price_buy": details["price_buy"],
+            "price_sell": details["price_sell"],
+            "margin": details["margin"],
+            "margin_pct": round(details["margin"] / details["price_buy"] * 100, 4),
+            "first_detected_at": (previous["first_detected_at"] if previous is not None
+                                  else details["detected_at"]),
+            "detected_at": details["detected_at"],
+        }
+        if "route" in details:
+            opportunity["route"] = details["route"]
+        self.opportunities[key] = opportunity
+        self.keys_by_asset.setdefault(key[0], set()).add(key)
+        self.by_margin.set(key, -details["margin"])
+        if self.ttl_s:
+            self.expiries.pop(key, None)
+            self.expiries[key] = details["detected_at"] + self.ttl_s
+
+
+    def _remove(self, key: OpportunityKey) -> None:
+        del self.opportunities[key]
+        asset_keys = self.keys_by_asset[key[0]]
+        asset_keys.discard(key)
+        if not asset_keys:
+            del self.keys_by_asset[key[0]]
+        self.by_margin.remove(key)
+        self.expiries.pop(key, None)
+
+
+    def discard(self, assets: Iterable[str] = (), markets: Iterable[str] = ()) -> None:
+        """Removes opportunities of provided assets, and ones buying or
+        selling on provided markets, e.g. when they are no longer tracked"""
+        assets, markets = set(assets), set(markets)
+        if not assets and not markets:
+            return
+        for key in [key for key in self.opportunities
+                    if key[0] in assets or key[1] in markets or key[2] in markets]:
+            self._remove(key)
+
+
+    def expire(self, now: float = None) -> int:
+        """Removes expired opportunities. Returns their number"""
+        now = self.clock() if now is None else now
+        expired = 0
+        for key, expires_at in self.expiries.items():
+            if expires_at > now:
+                break
+            expired += 1
+        if expired:
+            for key in list(itertools.islice(self.expiries, expired)):
+                self._remove(key)
+        self.opportunities_expired += expired
+        return expired
+
+
+    def get_top(self, count: int) -> List[dict]:
+        """Returns up to `count` current opportunities with the largest
+        margins, best first"""
+        self.expire()
+        return [self.opportunities[key] for _, key in self.by_margin.get_smallest(count)]
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class RingBuffer:
+    """Fixed capacity FIFO buffer over a preallocated list"""
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive, got {capacity}")
+        self.items: List[Any] = [None] * capacity
+        self.capacity = capacity
+        self.head = 0  # position of the oldest item
+        self.size = 0
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    def is_full(self) -> bool:
+        return self.size == self.capacity
+
+
+    def push(self, item: Any) -> None:
+        """Appends an item. If buffer is full, the oldest item is overwritten"""
+        self.items[(self.head + self.size) % self.capacity] = item
+        if self.size == self.capacity:
+            self.head = (self.head + 1) % self.capacity
+        else:
+            self.size += 1
+
+
+    def pop_many(self, count: int) -> List[Any]:
+        """Removes and returns up to `count` oldest items"""
+        count = min(count, self.size)
+        end = self.head + count
+        if end <= self.capacity:
+            items = self.items[self.head:end]
+            self.items[self.head:end] = [None] * count
+        else:
+            items = self.items[self.head:] + self.items[:end - self.capacity]
+            self.items[self.head:] = [None] * (self.capacity - self.head)
+            self.items[:end - self.capacity] = [None] * (end - self.capacity)
+        self.head = end % self.capacity
+        self.size -= count
+        return items
+
+
+class Sink:
+    """Destination of opportunities, written as batches of JSON lines"""
+
+    name = "sink"
+
+    async def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+
+    async def close(self) -> None:
+        pass
+
+
+class JsonlFileSink(Sink):
+    """Appends batches to a file. Writes run in a thread, so a slow disk
+    does not block the event loop"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = f"jsonl:{path}"
+        self.file = None
+
+
+    def _write(self, data: bytes) -> None:
+        if self.file is None:
+            self.file = open(self.path, "ab")
+        self.file.write(data)
+        self.file.flush()
+
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self._write, data)
+
+
+    async def close(self) -> None:
+        if self.file is not None:
+            await asyncio.to_thread(self.file.close)
+            self.file = None
+
+
+class StdoutSink(Sink):
+    """Writes batches to stdout in a thread, so a slow consumer of stdout
+    does not block the event loop"""
+
+    name = "stdout"
+
+    def _write(self, data: bytes) -> None:
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+
+
+    async def write(self, data: bytes) -> None:
+        await asyncio.to_thread(self._write, data)
+
+
+class UnixSocketSink(Sink):
+    """Streams batches to a local Unix socket server. Connects on first
+    write and reconnects on the next write after an error"""
+
+    def __init__(self, path: str, timeout_s: float = 5.0):
+        self.path = path
+        self.name = f"unix:{path}"
+        self.timeout_s = timeout_s
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+
+    async def write(self, data: bytes) -> None:
+        try:
+            if self.writer is None:
+                _, self.writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(self.path), self.timeout_s)
+            self.writer.write(data)
+            await asyncio.wait_for(self.writer.drain(), self.timeout_s)
+        except (OSError, asyncio.TimeoutError):
+            await self.close()
+            raise
+
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def create_sinks(spec: str, suffix: str = "") -> List[Sink]:
+    """Creates sinks from comma separated spec, e.g.
+    `stdout,jsonl:opportunities.jsonl,unix:/tmp/opportunities.sock`.
+    `suffix` is appended to file names, e.g. to separate worker processes"""
+    sinks = []
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        kind, _, target = item.partition(":")
+        if kind == "stdout":
+            sinks.append(StdoutSink())
+        elif kind == "jsonl" and target:
+            sinks.append(JsonlFileSink(target + suffix))
+        elif kind == "unix" and target:
+            sinks.append(UnixSocketSink(target))
+        else:
+            raise ValueError(f"Unknown opportunity sink: {item}")
+    return sinks
+
+
+class OpportunityPipeline:
+    """
+    Delivers detected opportunities to sinks without blocking detection.
+
+    Detector's listener only puts opportunity details into a bounded ring
+    buffer. A background writer takes them in batches of up to
+    `batch_size`, at least every `flush_interval_s`, encodes a batch once
+    as JSON lines and writes it to all sinks. A failing sink loses its
+    batch, other sinks are not affected. Opportunities count as written if
+    at least one sink wrote them, and are counted per sink too.
+
+    When the buffer is full:
+    - `drop_newest`: new opportunities are dropped
+    - `drop_oldest`: the oldest buffered opportunities are overwritten
+    - `block`: prices processing waits for the writer, via detector's
+      `output_ready`. Opportunities detected by quotes already in
+      processing are still accepted over capacity up to `capacity` more,
+      then dropped
+    """
+
+    POLICIES = ("drop_newest", "drop_oldest", "block")
+
+    def __init__(self, sinks: List[Sink], capacity: int = 10000, batch_size: int = 500,
+                 flush_interval_s: float = 0.5, policy: str = "drop_oldest"):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy {policy}, expected one of {self.POLICIES}")
+        self.sinks = sinks
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.policy = policy
+        # room for opportunities of quotes in processing when producers block
+        self.buffer = RingBuffer(capacity * 2 if policy == "block" else capacity)
+        self.batch_ready = asyncio.Event()
+        self.space_available = asyncio.Event()
+        self.space_available.set()
+        self.submitted_count = 0
+        self.dropped_count = 0
+        self.written_count = 0
+        self.batches_count = 0
+        self.sink_errors_count = 0
+        # by sink name
+        self.sink_written_counts: Dict[str, int] = {sink.name: 0 for sink in sinks}
+        self.sink_errors_counts: Dict[str, int] = {sink.name: 0 for sink in sinks}
+        self.blocked_count = 0
+
+
+    def submit(self, details: dict) -> None:
+        """Buffers opportunity details. Fits detector's opportunity listener
+        signature. Never blocks"""
+        self.submitted_count += 1
+        if self.buffer.is_full():
+            self.dropped_count += 1
+            if self.policy != "drop_oldest":
+                return
+        self.buffer.push(details)  # overwrites the oldest one if full
+        if len(self.buffer) >= self.batch_size:
+            self.batch_ready.set()
+        if self.policy == "block" and len(self.buffer) >= self.capacity:
+            self.space_available.clear()
+
+
+    async def wait_ready(self) -> None:
+        """Waits until buffer is below capacity, with `block` policy"""
+        if not self.space_available.is_set():
+            self.blocked_count += 1
+            await self.space_available.wait()
+
+
+    async def run(self) -> None:
+        """Writes buffered opportunities to sinks until cancelled"""
+        while True:
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), self.flush_interval_s)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+
+    async def flush(self) -> None:
+        """Writes all buffered opportunities, batch by batch"""
+        while len(self.buffer):
+            batch = self.buffer.pop_many(self.batch_size)
+            if len(self.buffer) < self.batch_size:
+                self.batch_ready.clear()
+            if len(self.buffer) < self.capacity:
+                self.space_available.set()
+            await self._write(batch)
+
+
+    async def _write(self, batch: List[dict]) -> None:
+        data = "".join(json.dumps(details) + "\n" for details in batch).encode()
+        written = False
+        for sink in self.sinks:
+            try:
+                await sink.write(data)
+            except Exception as e:
+                self.sink_errors_count += 1
+                self.sink_errors_counts[sink.name] += 1
+                logger.error("Opportunity sink %s failed, %d opportunities lost: %r",
+                             sink.name, len(batch), e)
+                continue
+            self.sink_written_counts[sink.name] += len(batch)
+            written = True
+        if written:
+            self.written_count += len(batch)
+            self.batches_count += 1
+
+
+    async def close(self) -> None:
+        """Writes remaining opportunities and closes sinks"""
+        await self.flush()
+        for sink in self.sinks:
+            await sink.close()
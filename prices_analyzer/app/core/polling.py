@@ -0,0 +1,80 @@
+import random
+from typing import Optional
+
+
+class AdaptivePollInterval:
+    """
+    Polling interval of a single asset / market pair, adapted to how often
+    its price is observed to change.
+
+    Update period of the pair is estimated from price versions: time between
+    two observed changes divided by number of versions that passed, so
+    updates missed between polls are accounted for. Pair is polled
+    `polls_per_update` times per estimated update period, within configured
+    bounds. Until the period is known, or if prices source does not provide
+    versions, minimum interval is used.
+    """
+
+    def __init__(self,
+                 interval_min_s: float,
+                 interval_max_s: float,
+                 polls_per_update: float = 2,
+                 smoothing: float = 0.3):
+        self.interval_min_s = interval_min_s
+        self.interval_max_s = max(interval_max_s, interval_min_s)
+        self.polls_per_update = polls_per_update
+        self.smoothing = smoothing
+        self.update_period_s: Optional[float] = None
+        self.last_version: Optional[int] = None
+        self.last_change_time: Optional[float] = None
+
+
+    def get_interval(self) -> float:
+        if self.update_period_s is None:
+            return self.interval_min_s
+        interval = self.update_period_s / self.polls_per_update
+        return min(max(interval, self.interval_min_s), self.interval_max_s)
+
+
+    def observe(self, version: Optional[int], now: float) -> bool:
+        """Registers version of a received quote. Returns True if the price
+        has changed since previous observation"""
+        if version is None:
+            return True
+        if version == self.last_version:
+            return False
+
+        if self.last_version is not None and version > self.last_version:
+            updates = version - self.last_version
+            period_s = (now - self.last_change_time) / updates
+            self.update_period_s = (
+                period_s if self.update_period_s is None
+                else self.update_period_s + self.smoothing * (period_s - self.update_period_s))
+        # lower version means prices source was restarted, start over
+        self.last_version = version
+        self.last_change_time = now
+        return True
+
+
+class RetryBackoff:
+    """
+    Delay before the next retry after consecutive failures: exponential from
+    `delay_s` up to `delay_max_s`, with random jitter of up to half of it, so
+    that loops which failed at the same time do not retry at the same time.
+    """
+
+    def __init__(self, delay_s: float, delay_max_s: float):
+        self.delay_s = delay_s
+        self.delay_max_s = max(delay_max_s, delay_s)
+        self.failures = 0
+
+
+    def reset(self) -> None:
+        self.failures = 0
+
+
+    def get_delay(self) -> float:
+        """Registers a failure and returns delay before the next attempt"""
+        delay_s = min(self.delay_s * 2 ** min(self.failures, 32), self.delay_max_s)
+        self.failures += 1
+        return delay_s * random.uniform(0.5, 1.0)
@@ -0,0 +1,96 @@
+import asyncio
+import itertools
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from ..utils import metrics, schemas
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class CoalescingQueue:
+    """
+    Bounded FIFO queue of quotes waiting for detection, which keeps only the
+    latest unprocessed quote of each asset / market pair.
+
+    A quote of a pair which is already queued replaces the queued one in
+    place, so the pair keeps its turn and a quickly updating pair can not
+    push others out. When the queue holds `capacity` pairs, a quote of a new
+    pair drops the oldest queued quote. Putting never blocks, so fetching
+    is never slowed down by detection.
+    """
+
+    def __init__(self, capacity: int = 10000):
+        if capacity < 1:
+            raise ValueError(f"Capacity must be positive, got {capacity}")
+        self.capacity = capacity
+        # (quote, time the pair was queued) by pair, in order of queueing
+        self.pending: Dict[Tuple[str, str], Tuple[schemas.AssetPriceFromApi, float]] = {}
+        self.not_empty = asyncio.Event()
+        self.queued_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+
+    def put(self, quote: schemas.AssetPriceFromApi) -> None:
+        self.queued_count += 1
+        key = (quote.name, quote.market)
+        queued = self.pending.get(key, None)
+        if queued is not None:
+            self.coalesced_count += 1
+            self.pending[key] = (quote, queued[1])
+            return
+        if len(self.pending) >= self.capacity:
+            del self.pending[next(iter(self.pending))]
+            self.dropped_count += 1
+        self.pending[key] = (quote, time.perf_counter())
+        self.not_empty.set()
+
+
+    def put_many(self, quotes: Iterable[schemas.AssetPriceFromApi]) -> None:
+        for quote in quotes:
+            self.put(quote)
+
+
+    def discard(self, assets: Iterable[str] = (), markets: Iterable[str] = ()) -> None:
+        """Drops queued quotes of provided assets and markets, e.g. when they
+        are no longer tracked"""
+        assets, markets = set(assets), set(markets)
+        for key in [key for key in self.pending if key[0] in assets or key[1] in markets]:
+            del self.pending[key]
+
+
+    async def get_many(self, max_count: int) -> List[schemas.AssetPriceFromApi]:
+        """Removes and returns up to `max_count` oldest quotes, waiting until
+        there is at least one"""
+        while not self.pending:
+            self.not_empty.clear()
+            await self.not_empty.wait()
+        keys = list(itertools.islice(self.pending, max_count))
+        now = time.perf_counter()
+        quotes = []
+        for key in keys:
+            quote, queued_at = self.pending.pop(key)
+            metrics.queue_wait_seconds.observe(now - queued_at)
+            quotes.append(quote)
+        return quotes
+
+
+async def run_detector_worker(
+        queue: CoalescingQueue,
+        process: Callable[[List[schemas.AssetPriceFromApi]], Awaitable[None]],
+        batch_size: int = 1) -> None:
+    """Takes quotes from the queue and processes them until cancelled.
+    Errors are logged, so the worker pool stays the same size"""
+    while True:
+        quotes = await queue.get_many(batch_size)
+        try:
+            await process(quotes)
+        except Exception as e:
+            logger.error("Processing of %d quotes failed: %r", len(quotes), e)
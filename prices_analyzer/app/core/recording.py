@@ -0,0 +1,390 @@
+import asyncio
+from collections import deque
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils import schemas
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# File layout: header, followed by chunks. Each chunk is a chunk header (type
+# and payload length) and its payload:
+# - symbols chunk: new asset and market names, "\n" separated, which get
+#   next ids in order of appearance
+# - quotes chunk: array of fixed size QUOTE_DTYPE records
+# Chunks are only appended, a truncated last chunk (e.g. after a crash) is
+# ignored by the reader.
+FILE_MAGIC = b"ARBQUOTE"
+FILE_FORMAT_VERSION = 1
+FILE_HEADER = struct.Struct("<8sI4x")
+CHUNK_HEADER = struct.Struct("<B3xI")
+CHUNK_SYMBOLS = 1
+CHUNK_QUOTES = 2
+
+QUOTE_DTYPE = np.dtype([
+    ("received_at", "<f8"),   # unix time
+    ("generated_at", "<f8"),  # unix time, NaN if not provided
+    ("price", "<f8"),
+    ("spread", "<f8"),
+    ("version", "<i8"),       # -1 if not provided
+    ("asset_id", "<u4"),
+    ("market_id", "<u4"),
+])
+
+
+class QuotesRecorder:
+    """
+    Appends received quotes to a binary recording file.
+
+    Quotes are buffered in a preallocated array and sealed into a chunk per
+    `flush_size` quotes, so recording costs a single array assignment per
+    quote. Appending to an existing recording continues its symbols.
+
+    While `run` is running, sealed chunks are written to the file in a
+    worker thread, at least every `flush_interval_s`, so a slow disk never
+    stalls the event loop which receives quotes. Otherwise they are written
+    right away.
+    """
+
+    def __init__(self, path: str, flush_size: int = 1000, flush_interval_s: float = 1.0):
+        self.path = path
+        self.flush_size = flush_size
+        self.flush_interval_s = flush_interval_s
+        self.symbols: Dict[str, int] = {}
+        self.new_symbols: List[str] = []
+        self.buffer = np.zeros(flush_size, dtype=QUOTE_DTYPE)
+        self.buffered = 0
+        # sealed chunks waiting to be written, in order
+        self.pending: Deque[Tuple[bytes, int]] = deque()
+        self.chunk_ready = asyncio.Event()
+        self.running = False
+        # file is written by a worker thread, and by `close` on shutdown
+        self.write_lock = threading.Lock()
+        self.quotes_recorded = 0
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with QuotesRecording(path) as recording:
+                self.symbols = {symbol: i for i, symbol in enumerate(recording.symbols)}
+                end_offset = recording.end_offset
+            self.file = open(path, "r+b")
+            # drop truncated chunk, if any
+            self.file.truncate(end_offset)
+            self.file.seek(end_offset)
+        else:
+            self.file = open(path, "wb")
+            self.file.write(FILE_HEADER.pack(FILE_MAGIC, FILE_FORMAT_VERSION))
+        logger.info("Recording quotes to %s", path)
+
+
+    def _get_symbol_id(self, symbol: str) -> int:
+        symbol_id = self.symbols.get(symbol, None)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self.symbols[symbol] = symbol_id
+            self.new_symbols.append(symbol)
+        return symbol_id
+
+
+    def record(self, assets_prices: List[schemas.AssetPriceFromApi],
+               received_at: Optional[float] = None) -> None:
+        """Records quotes received at once. Fits `PriceFetcher` quotes
+        listener signature"""
+        received_at = received_at if received_at is not None else time.time()
+        for asset_price in assets_prices:
+            self.buffer[self.buffered] = (
+                received_at,
+                np.nan if asset_price.generated_at is None else asset_price.generated_at,
+                asset_price.price,
+                asset_price.spread,
+                -1 if asset_price.version is None else asset_price.version,
+                self._get_symbol_id(asset_price.name),
+                self._get_symbol_id(asset_price.market))
+            self.buffered += 1
+            if self.buffered == self.flush_size:
+                self._seal()
+                if self.running:
+                    self.chunk_ready.set()
+                else:
+                    self._write_pending()
+
+
+    def _seal(self) -> None:
+        """Moves new symbols and buffered quotes to chunks waiting to be written"""
+        if self.new_symbols:
+            payload = "\n".join(self.new_symbols).encode()
+            self.pending.append((CHUNK_HEADER.pack(CHUNK_SYMBOLS, len(payload)) + payload, 0))
+            self.new_symbols = []
+        if self.buffered:
+            payload = self.buffer[:self.buffered].tobytes()
+            self.pending.append(
+                (CHUNK_HEADER.pack(CHUNK_QUOTES, len(payload)) + payload, self.buffered))
+            self.buffered = 0
+
+
+    def _write_pending(self) -> None:
+        with self.write_lock:
+            if self.file.closed:
+                return
+            while self.pending:
+                chunk, quotes_count = self.pending.popleft()
+                self.file.write(chunk)
+                self.quotes_recorded += quotes_count
+            self.file.flush()
+
+
+    async def run(self) -> None:
+        """Writes sealed chunks in a worker thread until cancelled"""
+        self.running = True
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self.chunk_ready.wait(), self.flush_interval_s)
+                except asyncio.TimeoutError:
+                    pass
+                self.chunk_ready.clear()
+                self._seal()
+                if self.pending:
+                    await asyncio.to_thread(self._write_pending)
+        finally:
+            self.running = False
+
+
+    def flush(self) -> None:
+        self._seal()
+        self._write_pending()
+
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            with self.write_lock:
+                self.file.close()
+            logger.info("Recorded %d quotes to %s", self.quotes_recorded, self.path)
+
+
+class QuotesRecording:
+    """
+    Memory mapped reader of a quotes recording.
+
+    Quotes are never copied into Python objects: each quotes chunk is exposed
+    as a read-only structured NumPy array viewing the mapped file, so
+    recordings larger than memory can be iterated.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        # start of the mapping, to locate chunks' pages
+        self.address = np.frombuffer(self.mmap, dtype=np.uint8, count=1).ctypes.data
+        self.symbols: List[str] = []
+        self.chunks: List[np.ndarray] = []
+        self.end_offset = 0
+        self._read_chunks()
+
+
+    def _read_chunks(self) -> None:
+        """Scans chunk headers. Headers are read from the file rather than
+        the mapping: touching a page of the mapping maps its neighbours too,
+        which would load most of the recording into memory"""
+        magic, format_version = FILE_HEADER.unpack(self.file.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC or format_version != FILE_FORMAT_VERSION:
+            raise ValueError(f"{self.path} is not a quotes recording of version "
+                             f"{FILE_FORMAT_VERSION}")
+
+        offset, size = FILE_HEADER.size, len(self.mmap)
+        while offset + CHUNK_HEADER.size <= size:
+            self.file.seek(offset)
+            chunk_type, length = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+            payload_offset = offset + CHUNK_HEADER.size
+            if payload_offset + length > size:
+                logger.warning("Truncated chunk at %s of %s is ignored", offset, self.path)
+                break
+            if chunk_type == CHUNK_SYMBOLS:
+                self.symbols.extend(self.file.read(length).decode().split("\n"))
+            elif chunk_type == CHUNK_QUOTES:
+                self.chunks.append(np.frombuffer(
+                    self.mmap, dtype=QUOTE_DTYPE,
+                    count=length // QUOTE_DTYPE.itemsize, offset=payload_offset))
+            offset = payload_offset + length
+        self.end_offset = offset
+
+
+    def __len__(self) -> int:
+        return sum(len(chunk) for chunk in self.chunks)
+
+
+    def __enter__(self) -> "QuotesRecording":
+        return self
+
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        # views of the mapping have to be released before it is closed
+        self.chunks = []
+        self.mmap.close()
+        self.file.close()
+
+
+    def _iter_chunks(self) -> Iterator[np.ndarray]:
+        """Yields quotes chunks. Pages of a chunk are released once it is
+        processed, so memory use does not grow while reading a recording"""
+        for chunk in self.chunks:
+            yield chunk
+            self._release_pages(chunk)
+
+
+    def _release_pages(self, chunk: np.ndarray) -> None:
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        start = chunk.ctypes.data - self.address
+        end = start + chunk.nbytes
+        # only whole pages of the chunk can be released
+        start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            self.mmap.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+    def iter_batches(self, batch_size: int = None) -> Iterator[np.ndarray]:
+        """Yields zero-copy arrays of consecutive quotes, one per chunk or
+        of up to `batch_size` quotes"""
+        for chunk in self._iter_chunks():
+            if batch_size is None:
+                yield chunk
+                continue
+            for start in range(0, len(chunk), batch_size):
+                yield chunk[start:start + batch_size]
+
+
+    def get_assets(self) -> List[str]:
+        """Names of all recorded assets, in order of first appearance"""
+        return self._get_symbols("asset_id")
+
+
+    def get_markets(self) -> List[str]:
+        return self._get_symbols("market_id")
+
+
+    def _get_symbols(self, field: str) -> List[str]:
+        symbols_ids = set()
+        for chunk in self._iter_chunks():
+            symbols_ids.update(np.unique(chunk[field]).tolist())
+        return [self.symbols[symbol_id] for symbol_id in sorted(symbols_ids)]
+
+
+    def to_asset_price(self, record: np.void) -> schemas.AssetPriceFromApi:
+        """Builds quote model of a record, without validation"""
+        return schemas.AssetPriceFromApi.model_construct(
+            name=self.symbols[record["asset_id"]],
+            market=self.symbols[record["market_id"]],
+            price=float(record["price"]),
+            spread=float(record["spread"]),
+            version=None if record["version"] < 0 else int(record["version"]),
+            generated_at=(None if np.isnan(record["generated_at"])
+                          else float(record["generated_at"])))
+
+
+class RecordedClock:
+    """Time source of a replay: receive time of the quote being replayed"""
+
+    def __init__(self):
+        self.now = 0.0
+
+
+    def __call__(self) -> float:
+        return self.now
+
+
+async def replay(recording: QuotesRecording, detector,
+                 speed: Optional[float] = None,
+                 per_quote: bool = False,
+                 batch_size: int = 1000,
+                 on_progress: Callable[[int], None] = None) -> dict:
+    """
+    Replays recorded quotes through detector.
+
+    By default quotes are replayed as fast as possible, in batches through
+    `process_prices_arrays`, without building a model per quote. With
+    `per_quote` each quote goes through `process_price`, as in analyzer's
+    `pair` mode. With `speed` quotes are paced by their receive time, e.g.
+    1.0 for recorded speed, 10.0 for 10 times faster.
+
+    Detector's clock is set to receive time of replayed quotes, so staleness
+    checks and detection latency are evaluated as at recording time.
+    """
+    clock = RecordedClock()
+    detector.clock = clock
+    # recording symbol id -> detector's book index, -1 if not tracked
+    assets_lookup = np.array([detector.assets_index.get(symbol, -1)
+                              for symbol in recording.symbols] or [-1], dtype=np.intp)
+    markets_lookup = np.array([detector.markets_index.get(symbol, -1)
+                               for symbol in recording.symbols] or [-1], dtype=np.intp)
+
+    loop = asyncio.get_running_loop()
+    replay_started = loop.time()
+    recording_started = None
+    quotes_replayed = 0
+
+    for batch in recording.iter_batches(batch_size):
+        if speed:
+            if recording_started is None:
+                recording_started = float(batch["received_at"][0])
+            # process quotes which are due, sleep until the next one
+            position = 0
+            while position < len(batch):
+                due_time = recording_started + (loop.time() - replay_started) * speed
+                due = int(np.searchsorted(batch["received_at"], due_time, side="right"))
+                if due <= position:
+                    next_time = float(batch["received_at"][position])
+                    await asyncio.sleep((next_time - due_time) / speed)
+                    continue
+                await _replay_batch(recording, detector, clock, batch[position:due],
+                                    assets_lookup, markets_lookup, per_quote)
+                position = due
+        else:
+            await _replay_batch(recording, detector, clock, batch,
+                                assets_lookup, markets_lookup, per_quote)
+        quotes_replayed += len(batch)
+        if on_progress is not None:
+            on_progress(quotes_replayed)
+
+    elapsed = loop.time() - replay_started
+    return {"quotes": quotes_replayed, "elapsed_s": elapsed,
+            "quotes_per_s": quotes_replayed / elapsed if elapsed else float("inf")}
+
+
+async def _replay_batch(recording: QuotesRecording, detector, clock: RecordedClock,
+                        batch: np.ndarray, assets_lookup: np.ndarray,
+                        markets_lookup: np.ndarray, per_quote: bool) -> None:
+    if per_quote:
+        for record in batch:
+            clock.now = float(record["received_at"])
+            await detector.process_price(recording.to_asset_price(record))
+        return
+
+    assets_idx = assets_lookup[batch["asset_id"]]
+    markets_idx = markets_lookup[batch["market_id"]]
+    tracked = (assets_idx >= 0) & (markets_idx >= 0)
+    if not tracked.all():
+        batch, assets_idx, markets_idx = batch[tracked], assets_idx[tracked], markets_idx[tracked]
+    if not len(batch):
+        return
+    # staleness of the whole batch is evaluated at receive time of its last quote
+    clock.now = float(batch["received_at"][-1])
+    detector.process_prices_arrays(
+        assets_idx=assets_idx, markets_idx=markets_idx,
+        prices=batch["price"], spreads=batch["spread"],
+        versions=batch["version"], generated_at=batch["generated_at"])
@@ -0,0 +1,241 @@
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .detector import ArbitrageDetector
+from ..utils.logger import get_logger
+from ..utils.utils import get_transfer_costs_filepath, load_yaml_file
+
+
+logger = get_logger(__name__)
+
+
+class TransferCosts:
+    """
+    Costs of moving goods between markets, in percent of their value.
+
+    Routes which are not configured cost `default_cost`, or are not possible
+    if it is None. A route can be limited to some assets, overriding the
+    route for them. Goods can be moved over several routes, so cheapest
+    paths between all markets are precomputed for each distinct set of
+    routes.
+
+    Costs are kept as distances `-log(1 - cost / 100)`, so the cost of a path
+    is the sum of its routes' distances.
+    """
+
+    def __init__(self, markets_list: List[str], default_cost: Optional[float] = 0.0,
+                 routes: Iterable[dict] = ()):
+        self.markets_list = markets_list
+        self.markets_index = {market: i for i, market in enumerate(markets_list)}
+        self.default_cost = default_cost
+        self.routes = [self._parse_route(route) for route in routes]
+        # (distances, next hops) by set of assets specific routes
+        self.paths: Dict[Tuple[int, ...], Tuple[np.ndarray, np.ndarray]] = {}
+
+
+    @classmethod
+    def from_file(cls, markets_list: List[str], file_path: str = None) -> "TransferCosts":
+        file_path = file_path or get_transfer_costs_filepath()
+        transfer_config = load_yaml_file(file_path) or {}
+        logger.info("Loaded transfer costs from %s", file_path)
+        return cls(markets_list, default_cost=transfer_config.get("default_cost", 0.0),
+                   routes=transfer_config.get("routes", None) or ())
+
+
+    def for_markets(self, markets_list: List[str]) -> "TransferCosts":
+        """The same costs over another list of markets"""
+        transfer_costs = TransferCosts(markets_list, default_cost=self.default_cost)
+        transfer_costs.routes = self.routes
+        return transfer_costs
+
+
+    @staticmethod
+    def _to_distance(cost: Optional[float]) -> float:
+        if cost is None:
+            return np.inf
+        if not 0 <= cost < 100:
+            raise ValueError(f"Transfer cost must be within [0, 100) percent, got {cost}")
+        return -math.log1p(-cost / 100)
+
+
+    def _parse_route(self, route: dict) -> dict:
+        return {
+            "from": route["from"],
+            "to": route["to"],
+            "distance": self._to_distance(route["cost"]),
+            "both_ways": route.get("both_ways", True),
+            "assets": frozenset(route["assets"]) if route.get("assets") else None,
+        }
+
+
+    def get_paths(self, asset: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns `markets x markets` matrices of cheapest path distances and
+        next market on these paths, for an asset. Assets with the same routes
+        share matrices"""
+        routes_ids = tuple(i for i, route in enumerate(self.routes)
+                           if route["assets"] is None or asset in route["assets"])
+        paths = self.paths.get(routes_ids, None)
+        if paths is None:
+            paths = self._compute_paths([self.routes[i] for i in routes_ids])
+            self.paths[routes_ids] = paths
+        return paths
+
+
+    def _compute_paths(self, routes: List[dict]) -> Tuple[np.ndarray, np.ndarray]:
+        markets_count = len(self.markets_list)
+        distances = np.full((markets_count, markets_count),
+                            self._to_distance(self.default_cost))
+        # routes limited to assets are applied last, so they override general ones
+        for route in sorted(routes, key=lambda route: route["assets"] is not None):
+            from_idx = self.markets_index.get(route["from"], None)
+            to_idx = self.markets_index.get(route["to"], None)
+            if from_idx is None or to_idx is None:
+                continue
+            distances[from_idx, to_idx] = route["distance"]
+            if route["both_ways"]:
+                distances[to_idx, from_idx] = route["distance"]
+        np.fill_diagonal(distances, 0.0)
+
+        # Floyd-Warshall, vectorized over pairs of markets
+        next_hops = np.tile(np.arange(markets_count), (markets_count, 1))
+        for via_idx in range(markets_count):
+            via_distances = distances[:, via_idx, None] + distances[None, via_idx, :]
+            shorter = via_distances < distances
+            distances = np.where(shorter, via_distances, distances)
+            next_hops = np.where(shorter, next_hops[:, via_idx, None], next_hops)
+        return distances, next_hops
+
+
+    def get_route(self, next_hops: np.ndarray, from_idx: int, to_idx: int) -> List[str]:
+        """Markets on the cheapest path, including both ends"""
+        route = [from_idx]
+        while route[-1] != to_idx:
+            route.append(int(next_hops[route[-1], to_idx]))
+        return [self.markets_list[market_idx] for market_idx in route]
+
+
+class RouteArbitrageDetector(ArbitrageDetector):
+    """
+    Arbitrage detector which accounts for costs of moving goods between
+    markets, possibly over several other markets.
+
+    Each asset is a graph of markets. A route buys the asset on one market,
+    moves it over the cheapest path and sells it on another one. It is
+    profitable if `price_sell * (1 - path cost) > price_buy`, i.e. its
+    log-weight `log(price_sell) - distance - log(price_buy)` is positive -
+    a negative cycle through cash in the usual formulation.
+
+    Transfer costs are static, so all cheapest paths are precomputed and
+    detection is incremental: a quote of a market only changes routes
+    starting or ending there, so only these `2 x markets` routes are
+    evaluated, instead of all `markets x markets` ones.
+    """
+
+    # a check evaluates only routes starting or ending at the quoted markets
+    checks_all_routes = False
+
+    def __init__(self, assets_list: List[str] = None, markets_list: List[str] = None,
+                 transfer_costs: TransferCosts = None, **kwargs):
+        super().__init__(assets_list=assets_list, markets_list=markets_list, **kwargs)
+        self.transfer_costs = transfer_costs or TransferCosts.from_file(self.markets_list)
+        self.distances: List[np.ndarray] = []
+        self.next_hops: List[np.ndarray] = []
+        self._set_paths()
+
+
+    def _set_paths(self) -> None:
+        """Cheapest paths between markets of each asset, by asset index"""
+        self.distances = []
+        self.next_hops = []
+        for asset in self.assets_list:
+            distances, next_hops = self.transfer_costs.get_paths(asset)
+            self.distances.append(distances)
+            self.next_hops.append(next_hops)
+
+
+    def set_universe(self, assets_list: List[str], markets_list: List[str]) -> None:
+        markets_changed = list(markets_list) != self.markets_list
+        super().set_universe(assets_list, markets_list)
+        if markets_changed:
+            self.transfer_costs = self.transfer_costs.for_markets(self.markets_list)
+        self._set_paths()
+
+
+    def _get_log_prices(self, asset_idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        # markets without quotes are -inf / +inf, so routes over them never win
+        with np.errstate(divide="ignore"):
+            return np.log(self.prices_buy[asset_idx]), np.log(self.prices_sell[asset_idx])
+
+
+    def _check_asset(self, asset_idx: int, market_idx: int) -> dict:
+        """Evaluates routes starting or ending at the quoted market and checks
+        the best of them"""
+        distances = self.distances[asset_idx]
+        log_buy, log_sell = self._get_log_prices(asset_idx)
+
+        from_scores = log_sell - distances[market_idx]
+        to_scores = log_sell[market_idx] - distances[:, market_idx] - log_buy
+        sell_idx = int(from_scores.argmax())
+        buy_idx = int(to_scores.argmax())
+        if from_scores[sell_idx] - log_buy[market_idx] >= to_scores[buy_idx]:
+            return self._check_for_arbitrage(asset_idx, market_idx, sell_idx)
+        return self._check_for_arbitrage(asset_idx, buy_idx, market_idx)
+
+
+    def _check_assets(self, assets_idx: np.ndarray, markets_idx: np.ndarray
+                      ) -> List[dict]:
+        """Evaluates routes starting or ending at quoted markets of each
+        affected asset, once per asset"""
+        pairs = np.unique(assets_idx * len(self.markets_list) + markets_idx)
+        pairs_assets_idx, pairs_markets_idx = np.divmod(pairs, len(self.markets_list))
+        # pairs are sorted by asset, so each asset's markets are a slice
+        affected_assets_idx, starts = np.unique(pairs_assets_idx, return_index=True)
+        return [self._check_asset_markets(int(asset_idx), markets_idx)
+                for asset_idx, markets_idx
+                in zip(affected_assets_idx, np.split(pairs_markets_idx, starts[1:]))]
+
+
+    def _check_asset_markets(self, asset_idx: int, markets_idx: np.ndarray) -> dict:
+        distances = self.distances[asset_idx]
+        log_buy, log_sell = self._get_log_prices(asset_idx)
+
+        # routes starting at quoted markets: markets_idx x all markets
+        from_scores = log_sell[None, :] - distances[markets_idx] - log_buy[markets_idx, None]
+        # routes ending at quoted markets: all markets x markets_idx
+        to_scores = log_sell[None, markets_idx] - distances[:, markets_idx] - log_buy[:, None]
+
+        from_best = np.unravel_index(from_scores.argmax(), from_scores.shape)
+        to_best = np.unravel_index(to_scores.argmax(), to_scores.shape)
+        if from_scores[from_best] >= to_scores[to_best]:
+            buy_idx, sell_idx = int(markets_idx[from_best[0]]), int(from_best[1])
+        else:
+            buy_idx, sell_idx = int(to_best[0]), int(markets_idx[to_best[1]])
+        return self._check_for_arbitrage(asset_idx, buy_idx, sell_idx)
+
+
+    def _check_for_arbitrage(self, asset_idx: int,
+                             best_buy_idx: int, best_sell_idx: int) -> dict:
+        """Provides a response indicating if the route is profitable after
+        transfer costs. Margin is net of them"""
+        response = {"arbitrage_found": False, "details": []}
+
+        distance = float(self.distances[asset_idx][best_buy_idx, best_sell_idx])
+        price_buy = float(self.prices_buy[asset_idx, best_buy_idx])
+        price_sell_net = float(self.prices_sell[asset_idx, best_sell_idx]) * math.exp(-distance)
+
+        if best_buy_idx != best_sell_idx and price_buy < price_sell_net:
+            route = self.transfer_costs.get_route(
+                self.next_hops[asset_idx], best_buy_idx, best_sell_idx)
+            transfer_cost = round(-math.expm1(-distance) * 100, 4)
+            details = self._get_opportunity_details(
+                asset_idx, best_buy_idx, best_sell_idx,
+                margin=round(price_sell_net - price_buy, 4),
+                message_suffix=f", via {' -> '.join(route)} for {transfer_cost}%")
+            details["route"] = route
+            details["transfer_cost"] = transfer_cost
+            response["details"].append(details)
+            response["arbitrage_found"] = True
+
+        return response
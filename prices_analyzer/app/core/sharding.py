@@ -0,0 +1,164 @@
+import multiprocessing
+import queue
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+def get_shard_id(asset: str, shards_count: int) -> int:
+    """Stable across processes and runs, unlike built-in `hash`"""
+    return zlib.crc32(asset.encode()) % shards_count
+
+
+def partition_assets(assets: List[str], shards_count: int) -> List[List[str]]:
+    """Splits assets into `shards_count` groups by hash of asset name"""
+    shards = [[] for _ in range(shards_count)]
+    for asset in assets:
+        shards[get_shard_id(asset, shards_count)].append(asset)
+    return shards
+
+
+class ShardReporter:
+    """Worker side of supervisor's queue: sends opportunities and health
+    reports of a shard. Never blocks the worker's event loop."""
+
+    def __init__(self, shard_id: int, reports_queue: multiprocessing.Queue):
+        self.shard_id = shard_id
+        self.reports_queue = reports_queue
+
+
+    def report_opportunity(self, details: dict) -> None:
+        self.reports_queue.put_nowait(("opportunity", self.shard_id, details))
+
+
+    def report_health(self, health: dict) -> None:
+        self.reports_queue.put_nowait(("health", self.shard_id, health))
+
+
+class ShardsSupervisor:
+    """
+    Runs each shard of assets in a separate worker process and supervises them.
+    Without assets, all `workers_count` workers are started and each one
+    discovers its shard of prices source's universe by itself.
+
+    Functionality:
+    - Starts a worker process per shard
+    - Collects opportunities and health reports sent by workers
+    - Restarts workers which died or stopped reporting health
+    """
+
+    def __init__(self,
+                 worker_target: Callable,
+                 assets: Optional[List[str]],
+                 markets: Optional[List[str]],
+                 workers_count: int,
+                 health_timeout_s: float = 30.0,
+                 summary_interval_s: float = 10.0):
+        self.worker_target = worker_target
+        self.markets = markets
+        self.shards = (partition_assets(assets, workers_count) if assets is not None
+                       else [None] * workers_count)
+        self.health_timeout_s = health_timeout_s
+        self.summary_interval_s = summary_interval_s
+        self.context = multiprocessing.get_context("spawn")
+        self.reports_queue = self.context.Queue()
+        self.workers: Dict[int, multiprocessing.Process] = {}
+        self.health: Dict[int, dict] = {}
+        self.last_report_time: Dict[int, float] = {}
+        self.opportunities_count = 0
+
+
+    def _start_worker(self, shard_id: int) -> None:
+        worker = self.context.Process(
+            target=self.worker_target,
+            args=(shard_id, self.shards[shard_id], self.markets, self.reports_queue),
+            name=f"analyzer-shard-{shard_id}",
+            daemon=True)
+        worker.start()
+        self.workers[shard_id] = worker
+        self.last_report_time[shard_id] = time.monotonic()
+        tracking = (f"{len(self.shards[shard_id])} assets" if self.shards[shard_id] is not None
+                    else "discovered assets")
+        logger.info("Started shard %d worker (pid %s) tracking %s", shard_id, worker.pid, tracking)
+
+
+    def _handle_report(self, report: tuple) -> None:
+        kind, shard_id, payload = report
+        self.last_report_time[shard_id] = time.monotonic()
+        if kind == "opportunity":
+            self.opportunities_count += 1
+            logger.info("Shard %d: %s", shard_id, payload["message"])
+        elif kind == "health":
+            self.health[shard_id] = payload
+            logger.debug("Shard %d health: %s", shard_id, payload)
+
+
+    def _check_workers(self) -> None:
+        """Restarts workers which exited or stopped reporting"""
+        now = time.monotonic()
+        for shard_id, worker in list(self.workers.items()):
+            if not worker.is_alive():
+                logger.error("Shard %d worker exited with code %s. Restarting",
+                             shard_id, worker.exitcode)
+                self._start_worker(shard_id)
+            elif now - self.last_report_time[shard_id] > self.health_timeout_s:
+                logger.error("Shard %d worker is not responding. Restarting", shard_id)
+                worker.terminate()
+                worker.join(timeout=5)
+                self._start_worker(shard_id)
+
+
+    def get_health(self) -> dict:
+        """Aggregated health of all shards"""
+        return {
+            "workers": len(self.workers),
+            "workers_alive": sum(worker.is_alive() for worker in self.workers.values()),
+            "quotes_processed": sum(h.get("quotes_processed", 0) for h in self.health.values()),
+            "opportunities_found": self.opportunities_count,
+            "shards": dict(self.health),
+        }
+
+
+    def _log_summary(self) -> None:
+        health = self.get_health()
+        logger.info("Shards alive: %d/%d, quotes processed: %d, opportunities found: %d",
+                    health["workers_alive"], health["workers"],
+                    health["quotes_processed"], health["opportunities_found"])
+
+
+    def run(self, check_interval_s: float = 1.0) -> None:
+        """Starts workers and supervises them until interrupted"""
+        for shard_id, shard_assets in enumerate(self.shards):
+            if shard_assets is None or shard_assets:
+                self._start_worker(shard_id)
+
+        next_check = time.monotonic() + check_interval_s
+        next_summary = time.monotonic() + self.summary_interval_s
+        try:
+            while True:
+                try:
+                    self._handle_report(self.reports_queue.get(timeout=check_interval_s))
+                except queue.Empty:
+                    pass
+                now = time.monotonic()
+                if now >= next_check:
+                    self._check_workers()
+                    next_check = now + check_interval_s
+                if now >= next_summary:
+                    self._log_summary()
+                    next_summary = now + self.summary_interval_s
+        finally:
+            self.stop()
+
+
+    def stop(self) -> None:
+        for worker in self.workers.values():
+            worker.terminate()
+        for worker in self.workers.values():
+            worker.join(timeout=5)
+        logger.info("All shard workers stopped")
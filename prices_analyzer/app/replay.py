@@ -0,0 +1,88 @@
+"""Replays a quotes recording through the arbitrage detector.
+
+Recordings are made by analyzer with `RECORD_QUOTES_FILE` set. Detector
+tracks all assets and markets found in the recording:
+
+    python -m app.replay quotes.bin
+    python -m app.replay quotes.bin --speed 1 --per-quote
+    python -m app.replay quotes.bin --min-margin 0 0.5 1 5
+    python -m app.replay quotes.bin --transfer-costs app/utils/config/transfer_costs.yaml
+
+Reports replay throughput and, for each `--min-margin` threshold, the number
+and total margin of opportunities which would have been reported with it.
+Quotes are replayed in batches of `--batch-size` by default, which reports
+at most one opportunity per asset per batch. Use `--per-quote` to replay
+quotes one by one, as in `pair` mode. With `--transfer-costs` routes
+detection engine is used, with costs from provided file.
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+
+from .core.detector import ArbitrageDetector
+from .core.recording import QuotesRecording, replay
+from .core.routes import RouteArbitrageDetector, TransferCosts
+
+
+class MarginThresholds:
+    """Counts opportunities which pass each of minimal margins"""
+
+    def __init__(self, min_margins: List[float]):
+        self.min_margins = sorted(min_margins)
+        self.opportunities: Dict[float, int] = {margin: 0 for margin in self.min_margins}
+        self.total_margin: Dict[float, float] = {margin: 0.0 for margin in self.min_margins}
+
+
+    def add_opportunity(self, details: dict) -> None:
+        for min_margin in self.min_margins:
+            if details["margin"] < min_margin:
+                break
+            self.opportunities[min_margin] += 1
+            self.total_margin[min_margin] += details["margin"]
+
+
+async def main(args) -> None:
+    with QuotesRecording(args.file) as recording:
+        assets, markets = recording.get_assets(), recording.get_markets()
+        if args.transfer_costs:
+            detector = RouteArbitrageDetector(
+                assets_list=assets, markets_list=markets, max_quote_age_s=args.max_quote_age,
+                transfer_costs=TransferCosts.from_file(markets, args.transfer_costs))
+        else:
+            detector = ArbitrageDetector(assets_list=assets, markets_list=markets,
+                                         max_quote_age_s=args.max_quote_age)
+        thresholds = MarginThresholds(args.min_margin)
+        detector.add_opportunity_listener(thresholds.add_opportunity)
+        print(f"Replaying {len(recording)} quotes of {len(detector.assets_list)} assets"
+              f" on {len(detector.markets_list)} markets")
+
+        stats = await replay(recording, detector, speed=args.speed,
+                             per_quote=args.per_quote, batch_size=args.batch_size)
+
+    print(f"Replayed {stats['quotes']} quotes in {stats['elapsed_s']:.3f} s:"
+          f" {stats['quotes_per_s']:.0f} quotes/s")
+    print(f"Processed: {detector.quotes_processed},"
+          f" dropped out of order: {detector.quotes_dropped_out_of_order},"
+          f" dropped stale: {detector.quotes_dropped_stale}")
+    print(f"{'min margin':>12}{'opportunities':>16}{'total margin':>16}")
+    for min_margin in thresholds.min_margins:
+        print(f"{min_margin:>12}{thresholds.opportunities[min_margin]:>16}"
+              f"{thresholds.total_margin[min_margin]:>16.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", help="quotes recording")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="replay speed relative to recorded, as fast as possible if omitted")
+    parser.add_argument("--per-quote", action="store_true",
+                        help="process quotes one by one instead of in batches")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-quote-age", type=float, default=None,
+                        help="override MAX_QUOTE_AGE_S, 0 to disable staleness check")
+    parser.add_argument("--transfer-costs", default=None,
+                        help="transfer costs file, to account for costs of moving goods")
+    parser.add_argument("--min-margin", type=float, nargs="+", default=[0.0],
+                        help="minimal margins of opportunities to count")
+    asyncio.run(main(parser.parse_args()))
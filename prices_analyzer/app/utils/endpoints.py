@@ -0,0 +1,288 @@
+"""Client-side balancing of requests between prices source endpoints.
+
+Analyzer can talk to several generator replicas directly, without a proxy
+in between:
+- each request goes to the better of two randomly picked endpoints, scored
+  by moving average of their latency times requests in flight, so slow or
+  busy replicas get fewer requests
+- each endpoint has a circuit breaker. An endpoint failing
+  `eject_after_failures` requests in a row is ejected (circuit is open) for
+  `eject_s`. Afterwards a single probe request is let through (half-open):
+  if it succeeds, the endpoint is re-admitted, otherwise it is ejected for
+  twice as long, up to `eject_max_s`. While all endpoints are ejected,
+  requests fail fast with `CircuitOpenError` without being sent
+- requests to each endpoint may be rate limited with a token bucket of
+  `rate_limit_per_s` and `rate_limit_burst`
+- a request still unanswered after `hedge_percentile` of recent latencies
+  can be hedged: sent again to another endpoint, first response wins.
+  Hedges are limited to `hedge_max_ratio` of recent requests, so a slowdown
+  of all endpoints does not double the load on them.
+"""
+import asyncio
+from collections import deque
+import random
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..utils import metrics
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+# values of circuit states in metrics
+CIRCUIT_STATES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """All endpoints are ejected, so the request is not sent"""
+
+
+class TokenBucket:
+    """Rate limit of `rate_per_s` on average, with bursts up to `burst`"""
+
+    def __init__(self, rate_per_s: float, burst: float):
+        self.rate_per_s = rate_per_s
+        self.burst = max(burst, 1.0)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate_per_s, self.burst)
+        self.updated = now
+
+
+    def try_acquire(self) -> bool:
+        """Takes a token if one is available right away"""
+        self._refill()
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+    async def acquire(self) -> None:
+        """Takes a token, waiting for it if there are none left. Tokens are
+        reserved on call, going below zero, so waiters are served in order"""
+        self._refill()
+        self.tokens -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate_per_s)
+
+
+    def get_available(self) -> float:
+        self._refill()
+        return self.tokens
+
+
+class Endpoint:
+    """Prices source replica and its observed state"""
+
+    def __init__(self, url: str, rate_limiter: Optional[TokenBucket] = None):
+        self.url = url
+        self.rate_limiter = rate_limiter
+        # moving average of latency, None until the first response
+        self.latency_s: Optional[float] = None
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        # times ejected since the last successful request
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests_count = 0
+        self.failures_count = 0
+
+
+    def get_circuit_state(self, now: float) -> str:
+        if self.ejected_until > now:
+            return OPEN
+        # re-admitted, but not succeeded yet
+        if self.ejections:
+            return HALF_OPEN
+        return CLOSED
+
+
+    def is_admitted(self, now: float) -> bool:
+        state = self.get_circuit_state(now)
+        return state == CLOSED or (state == HALF_OPEN and self.in_flight == 0)
+
+
+    async def acquire(self) -> None:
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire()
+
+
+    def try_acquire(self) -> bool:
+        return self.rate_limiter is None or self.rate_limiter.try_acquire()
+
+
+    def get_score(self) -> float:
+        # endpoints without responses yet are tried first
+        return (self.latency_s or 0.0) * (self.in_flight + 1)
+
+
+    def get_state(self) -> dict:
+        now = time.monotonic()
+        return {
+            "circuit": self.get_circuit_state(now),
+            "reopens_in_s": round(max(self.ejected_until - now, 0.0), 3),
+            "latency_ms": None if self.latency_s is None else round(self.latency_s * 1000, 3),
+            "in_flight": self.in_flight,
+            "rate_limit_tokens": (None if self.rate_limiter is None
+                                  else round(self.rate_limiter.get_available(), 3)),
+            "requests": self.requests_count,
+            "failures": self.failures_count,
+        }
+
+
+class EndpointsBalancer:
+    """Chooses endpoints for requests and keeps track of their latency and
+    failures. Used from a single event loop"""
+
+    def __init__(self, urls: List[str],
+                 eject_after_failures: int = 3,
+                 eject_s: float = 1.0,
+                 eject_max_s: float = 5.0,
+                 latency_decay: float = 0.2,
+                 hedging: bool = True,
+                 hedge_percentile: float = 95.0,
+                 hedge_max_ratio: float = 0.1,
+                 hedge_min_samples: int = 100,
+                 latency_window: int = 1000,
+                 rate_limit_per_s: float = 0.0,
+                 rate_limit_burst: float = 100.0):
+        if not urls:
+            raise ValueError("At least one prices source endpoint is required")
+        self.endpoints = [
+            Endpoint(url, TokenBucket(rate_limit_per_s, rate_limit_burst)
+                     if rate_limit_per_s > 0 else None)
+            for url in urls]
+        self.eject_after_failures = eject_after_failures
+        self.eject_s = eject_s
+        self.eject_max_s = eject_max_s
+        self.latency_decay = latency_decay
+        self.hedging = hedging and len(self.endpoints) > 1
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        # each request earns `hedge_max_ratio` of a hedge, saved up to a burst
+        self.hedge_tokens = 0.0
+        self.hedge_tokens_max = max(hedge_max_ratio * 100, 1.0)
+        self.hedge_min_samples = hedge_min_samples
+        # recent latencies of all endpoints, hedge delay is their percentile
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        self.hedge_delay_s: Optional[float] = None
+        # percentile is recomputed every this number of responses
+        self.hedge_delay_refresh = max(latency_window // 10, 1)
+        self.responses_since_refresh = 0
+        self.requests_count = 0
+        self.hedged_count = 0
+        self.hedge_wins_count = 0
+        self.ejections_count = 0
+
+
+    def choose(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """Better of two random admitted endpoints, None if there are none"""
+        now = time.monotonic()
+        admitted = [endpoint for endpoint in self.endpoints
+                    if endpoint is not exclude and endpoint.is_admitted(now)]
+        if len(admitted) > 1:
+            first, second = random.sample(admitted, 2)
+            return first if first.get_score() <= second.get_score() else second
+        return admitted[0] if admitted else None
+
+
+    def start_request(self, endpoint: Endpoint, hedge: bool = False) -> None:
+        endpoint.in_flight += 1
+        endpoint.requests_count += 1
+        if hedge:
+            self.hedged_count += 1
+            self.hedge_tokens -= 1
+        else:
+            self.requests_count += 1
+            self.hedge_tokens = min(self.hedge_tokens + self.hedge_max_ratio,
+                                    self.hedge_tokens_max)
+
+
+    def finish_request(self, endpoint: Endpoint) -> None:
+        endpoint.in_flight -= 1
+
+
+    def record_connected(self, endpoint: Endpoint) -> None:
+        """Closes endpoint's circuit after a successful request without
+        recording its latency, e.g. after connecting to a stream"""
+        endpoint.consecutive_failures = 0
+        endpoint.ejections = 0
+
+
+    def record_success(self, endpoint: Endpoint, latency_s: float) -> None:
+        self.record_connected(endpoint)
+        if endpoint.latency_s is None:
+            endpoint.latency_s = latency_s
+        else:
+            endpoint.latency_s += self.latency_decay * (latency_s - endpoint.latency_s)
+        metrics.endpoint_latency_seconds.labels(endpoint.url).observe(latency_s)
+
+        self.latencies.append(latency_s)
+        self.responses_since_refresh += 1
+        if self.responses_since_refresh >= self.hedge_delay_refresh:
+            self.responses_since_refresh = 0
+            self._refresh_hedge_delay()
+
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        endpoint.consecutive_failures += 1
+        endpoint.failures_count += 1
+        if endpoint.ejected_until > time.monotonic():
+            # requests sent before the ejection
+            return
+        # a probe of half-open circuit has no second chance
+        if endpoint.consecutive_failures >= self.eject_after_failures or endpoint.ejections:
+            self._eject(endpoint)
+
+
+    def _eject(self, endpoint: Endpoint) -> None:
+        duration_s = min(self.eject_s * 2 ** endpoint.ejections, self.eject_max_s)
+        endpoint.ejected_until = time.monotonic() + duration_s
+        endpoint.ejections += 1
+        endpoint.consecutive_failures = 0
+        self.ejections_count += 1
+        metrics.endpoint_ejections_total.labels(endpoint.url).inc()
+        logger.warning("Prices source %s is ejected for %.1f s", endpoint.url, duration_s)
+
+
+    def _refresh_hedge_delay(self) -> None:
+        if len(self.latencies) < self.hedge_min_samples:
+            return
+        latencies = sorted(self.latencies)
+        index = min(int(len(latencies) * self.hedge_percentile / 100), len(latencies) - 1)
+        self.hedge_delay_s = latencies[index]
+
+
+    def get_hedge_delay_s(self) -> Optional[float]:
+        """Delay after which a request may be hedged, None if it may not"""
+        if not self.hedging or self.hedge_delay_s is None:
+            return None
+        if self.hedge_tokens < 1:
+            return None
+        return self.hedge_delay_s
+
+
+    def get_state(self) -> dict:
+        return {endpoint.url: endpoint.get_state() for endpoint in self.endpoints}
+
+
+    def get_circuit_states(self) -> Dict[Tuple[str], float]:
+        now = time.monotonic()
+        return {(endpoint.url,): CIRCUIT_STATES[endpoint.get_circuit_state(now)]
+                for endpoint in self.endpoints}
+
+
+    def get_rate_limit_tokens(self) -> Dict[Tuple[str], float]:
+        return {(endpoint.url,): endpoint.rate_limiter.get_available()
+                for endpoint in self.endpoints if endpoint.rate_limiter is not None}
+
+
+    def get_in_flight(self) -> Dict[Tuple[str], float]:
+        return {(endpoint.url,): endpoint.in_flight for endpoint in self.endpoints}
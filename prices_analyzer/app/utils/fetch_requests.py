@@ -1,57 +1,512 @@
 import asyncio
 from decouple import config
 import httpx
+import importlib.util
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
 
-from ..utils import schemas
+from ..utils import metrics, schemas, wire
+from ..utils.endpoints import CircuitOpenError, Endpoint, EndpointsBalancer
 from ..utils.logger import get_logger
 
 
 logger = get_logger(__name__)
+PRICE_PATH_TEMPLATE = "/price?asset_name={asset}&market={market}"
+SNAPSHOT_PATH = "/prices"
+STREAM_PATH = "/prices/stream"
+UNIVERSE_PATH = "/universe"
 
 
 class PriceFetcher:
-    """Class responsible for fetching price of an asset on a market from predefined API"""
+    """Class responsible for fetching price of an asset on a market from predefined API.
+
+    Owns a single pooled HTTP client for its whole lifetime, so connections to
+    the prices source are kept alive and reused between requests. Call
+    `start()` before use and `close()` on shutdown, or use it as an async
+    context manager.
+
+    Single price requests are conditional: ETag of the last quote of each pair
+    is sent as `If-None-Match`, and if price has not changed, prices source
+    responds with `304 Not Modified` and the last quote is returned again.
+
+    Prices source may consist of several endpoints, listed in
+    `PRICES_SOURCE_ENDPOINTS`. Requests are balanced between them by observed
+    latency, failing endpoints are ejected for a while, and slow single price
+    requests are hedged to another endpoint, see `EndpointsBalancer`.
+
+    Prices snapshots are requested in compact binary encoding if
+    `FETCHER_WIRE_FORMAT` is `binary` (default), single prices if
+    `FETCHER_PRICE_WIRE_FORMAT` is. JSON is accepted too from prices sources
+    which do not support it. Both are decoded in a single pydantic-core
+    pass, see `utils/wire.py`.
+
+    Requests in flight are capped at `FETCHER_MAX_CONCURRENCY`, further
+    requests wait for a free slot. Requests to each endpoint may be rate
+    limited with `FETCHER_RATE_LIMIT_PER_S`. Failed requests are not retried
+    by the fetcher: it returns no quotes, and callers retry with a backoff.
+    """
 
     def __init__(
             self,
             host: str = None,
             port: str = None,
             protocol: str = None,
-            prices_request_interval_s: float = None
+            endpoints: List[str] = None,
+            prices_request_interval_s: float = None,
+            max_connections: int = None,
+            max_keepalive_connections: int = None,
+            keepalive_expiry_s: float = None,
+            http2: bool = None,
+            timeout_s: float = None,
+            conditional_requests: bool = None,
+            wire_format: str = None,
+            price_wire_format: str = None,
+            transport: httpx.AsyncBaseTransport = None
             ):
         self.prices_source_protocol = protocol or config('PRICES_SOURCE_PROTOCOL', default="http")
-        self.prices_source_host = host or config('PRICES_SOURCE_HOST')
-        self.prices_source_port = port or config('PRICES_SOURCE_PORT')
-        self._get_api_url_template()
+        self.balancer = EndpointsBalancer(
+            self._get_endpoints_urls(host, port, endpoints),
+            eject_after_failures=config('FETCHER_EJECT_AFTER_FAILURES', default=3, cast=int),
+            eject_s=config('FETCHER_EJECT_S', default=1.0, cast=float),
+            eject_max_s=config('FETCHER_EJECT_MAX_S', default=5.0, cast=float),
+            hedging=config('FETCHER_HEDGING', default=True, cast=bool),
+            hedge_percentile=config('FETCHER_HEDGE_PERCENTILE', default=95.0, cast=float),
+            hedge_max_ratio=config('FETCHER_HEDGE_MAX_RATIO', default=0.1, cast=float),
+            rate_limit_per_s=config('FETCHER_RATE_LIMIT_PER_S', default=0.0, cast=float),
+            rate_limit_burst=config('FETCHER_RATE_LIMIT_BURST', default=100.0, cast=float),
+            )
+        self.max_concurrency = config('FETCHER_MAX_CONCURRENCY', default=100, cast=int)
+        self.concurrency_limit = asyncio.Semaphore(self.max_concurrency)
+        self.requests_active = 0
+        self.requests_waiting = 0
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections or config(
+                'FETCHER_MAX_CONNECTIONS', default=100, cast=int),
+            max_keepalive_connections=max_keepalive_connections or config(
+                'FETCHER_MAX_KEEPALIVE_CONNECTIONS', default=100, cast=int),
+            keepalive_expiry=keepalive_expiry_s or config(
+                'FETCHER_KEEPALIVE_EXPIRY_S', default=30.0, cast=float),
+            )
+        self.timeout = httpx.Timeout(
+            timeout_s or config('FETCHER_TIMEOUT_S', default=10.0, cast=float))
+        self.http2 = self._get_http2_setting(
+            http2 if http2 is not None
+            else config('FETCHER_HTTP2', default=False, cast=bool))
+        self.stream_read_timeout_s = config('STREAM_READ_TIMEOUT_S', default=30.0, cast=float)
+        self.conditional_requests = (
+            conditional_requests if conditional_requests is not None
+            else config('FETCHER_CONDITIONAL_REQUESTS', default=True, cast=bool))
+        # "binary" or "json" quotes of snapshot and single price requests.
+        # A single quote is decoded faster from JSON, a snapshot from binary
+        self.snapshot_accept = self._get_accept(
+            wire_format or config('FETCHER_WIRE_FORMAT', default="binary"))
+        self.price_accept = self._get_accept(
+            price_wire_format or config('FETCHER_PRICE_WIRE_FORMAT', default="json"))
+        # last quote and its ETag of each asset / market pair
+        self.quotes: Dict[Tuple[str, str], Tuple[str, schemas.AssetPriceFromApi]] = {}
+        self.not_modified_count = 0
+        # ETag of the last received universe
+        self.universe_etag: Optional[str] = None
+        self.quotes_listeners: List[Callable[[List[schemas.AssetPriceFromApi], float], None]] = []
+        self.transport = transport  # custom transport, e.g. for in-process testing
+        self.client: httpx.AsyncClient = None
 
 
-    def _get_api_url_template(self):
-        self.api_url_template: str = (
-            f"{self.prices_source_protocol}://{self.prices_source_host}:"
-            + f"{self.prices_source_port}"
-            + f"/price?asset_name={{asset}}&market={{market}}"
+    def _get_endpoints_urls(self, host: str, port: str, endpoints: List[str]) -> List[str]:
+        """Endpoints passed or listed in `PRICES_SOURCE_ENDPOINTS`, e.g.
+        "generator_1:8000,generator_2:8000", otherwise the single endpoint at
+        `PRICES_SOURCE_HOST` and `PRICES_SOURCE_PORT`"""
+        if endpoints is None and host is None:
+            endpoints = [endpoint.strip() for endpoint
+                         in config('PRICES_SOURCE_ENDPOINTS', default="").split(",")
+                         if endpoint.strip()]
+        if not endpoints:
+            endpoints = [f"{host or config('PRICES_SOURCE_HOST')}:"
+                         f"{port or config('PRICES_SOURCE_PORT')}"]
+        return [endpoint if "://" in endpoint else f"{self.prices_source_protocol}://{endpoint}"
+                for endpoint in endpoints]
+
+
+    def _get_http2_setting(self, http2: bool) -> bool:
+        """HTTP/2 requires optional `h2` package. Falls back to HTTP/1.1 if
+        it is not installed."""
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("HTTP/2 requested but `h2` package is not installed."
+                           " Falling back to HTTP/1.1")
+            return False
+        return http2
+
+
+    async def start(self) -> None:
+        """Creates shared HTTP client. Safe to call multiple times"""
+        if self.client is not None and not self.client.is_closed:
+            return
+
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=self.limits,
+            http2=self.http2,
+            transport=self.transport
             )
+        logger.info("Price fetcher started. Endpoints: %s, limits: %s, http2: %s",
+                    ", ".join(endpoint.url for endpoint in self.balancer.endpoints),
+                    self.limits, self.http2)
+
+
+    async def close(self) -> None:
+        """Closes shared HTTP client and all its connections"""
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+            logger.info("Price fetcher closed")
+
+
+    async def __aenter__(self) -> "PriceFetcher":
+        await self.start()
+        return self
+
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            await self.start()
+        return self.client
+
+
+    def add_quotes_listener(
+            self, listener: Callable[[List[schemas.AssetPriceFromApi], float], None]
+            ) -> None:
+        """Registers a callable invoked with every batch of received quotes
+        and its receive time, e.g. to record them. Quotes answered with
+        `304 Not Modified` are not received again, so are not passed"""
+        self.quotes_listeners.append(listener)
+
+
+    def _notify_listeners(self, assets_data: List[schemas.AssetPriceFromApi]) -> None:
+        if not self.quotes_listeners or not assets_data:
+            return
+        received_at = time.time()
+        for listener in self.quotes_listeners:
+            try:
+                listener(assets_data, received_at)
+            except Exception as e:
+                logger.error("Quotes listener %s failed: %r", listener, e)
+
+
+    def get_limits_state(self) -> dict:
+        """State of concurrency and rate limits and circuit breakers"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "requests_active": self.requests_active,
+            "requests_waiting": self.requests_waiting,
+            "endpoints": self.balancer.get_state(),
+        }
 
 
     def get_api(self, asset, market):
-        return self.api_url_template.format(asset=asset, market=market)
+        """URL of pair's price at the first endpoint"""
+        return self.balancer.endpoints[0].url + PRICE_PATH_TEMPLATE.format(
+            asset=asset, market=market)
+
+
+    async def _send(self, client: httpx.AsyncClient, endpoint: Endpoint, path: str,
+                    hedge: bool = False, **kwargs) -> httpx.Response:
+        """Sends a GET request to an endpoint, within concurrency and
+        endpoint's rate limits, and records its latency, or failure if it
+        failed or got a server error"""
+        self.requests_waiting += 1
+        try:
+            await self.concurrency_limit.acquire()
+        finally:
+            self.requests_waiting -= 1
+        self.requests_active += 1
+        try:
+            if not hedge:
+                # hedges take their token before they are sent
+                await endpoint.acquire()
+            if not endpoint.is_admitted(time.monotonic()):
+                # ejected while the request waited
+                raise CircuitOpenError(f"Prices source {endpoint.url} is ejected")
+            self.balancer.start_request(endpoint, hedge)
+            started = time.perf_counter()
+            try:
+                response = await client.get(endpoint.url + path, **kwargs)
+            except httpx.RequestError:
+                self.balancer.record_failure(endpoint)
+                raise
+            finally:
+                self.balancer.finish_request(endpoint)
+        finally:
+            self.requests_active -= 1
+            self.concurrency_limit.release()
+        if response.status_code >= 500:
+            self.balancer.record_failure(endpoint)
+        else:
+            self.balancer.record_success(endpoint, time.perf_counter() - started)
+        return response
+
+
+    @staticmethod
+    def _is_successful(task: asyncio.Task) -> bool:
+        return task.exception() is None and task.result().status_code < 500
+
+
+    async def _get(self, path: str, hedge: bool = False, **kwargs) -> httpx.Response:
+        """Sends a GET request to the endpoint chosen by balancer. If `hedge`
+        is set and no response comes within balancer's hedge delay, or the
+        request fails earlier, it is sent to another endpoint too, and the
+        first successful response is returned. The other request is
+        cancelled. Raises `CircuitOpenError` if all endpoints are ejected"""
+        client = await self._get_client()
+        endpoint = self.balancer.choose()
+        if endpoint is None:
+            raise CircuitOpenError("All prices source endpoints are ejected")
+        hedge_delay_s = self.balancer.get_hedge_delay_s() if hedge else None
+        if hedge_delay_s is None:
+            return await self._send(client, endpoint, path, **kwargs)
+
+        first = asyncio.ensure_future(self._send(client, endpoint, path, **kwargs))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay_s)
+            if done and self._is_successful(first):
+                return first.result()
+            hedge_endpoint = None
+            if (self.balancer.get_hedge_delay_s() is not None
+                    and not self.concurrency_limit.locked()):
+                hedge_endpoint = self.balancer.choose(exclude=endpoint)
+            if hedge_endpoint is None or not hedge_endpoint.try_acquire():
+                return await first
+
+            tasks.append(asyncio.ensure_future(
+                self._send(client, hedge_endpoint, path, hedge=True, **kwargs)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if self._is_successful(task):
+                        if task is not first:
+                            self.balancer.hedge_wins_count += 1
+                        return task.result()
+            # both failed, first one's error is handled by caller
+            return first.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+
+    @staticmethod
+    def _get_accept(wire_format: str) -> str:
+        if wire_format == "binary":
+            return wire.CONTENT_TYPE + ", application/json;q=0.5"
+        return "application/json"
+
+
+    @staticmethod
+    def _decode_quotes(response: httpx.Response,
+                       single: bool = False) -> List[schemas.AssetPriceFromApi]:
+        """Quotes of a prices snapshot response, or of a `single` price one,
+        in binary or JSON encoding. Raises `ValueError` if they are invalid"""
+        if wire.is_binary(response.headers.get("Content-Type", None)):
+            return wire.decode_quotes(response.content)
+        if single:
+            return [schemas.AssetPriceFromApi.model_validate_json(response.content)]
+        return wire.decode_json_quotes(response.content)
 
 
     async def fetch_price(self, asset: str, market: str):
+        """Fetches current quote of a pair. If price has not changed since
+        previous request, previous quote object is returned"""
         asset_data = None
         try:
-            async with httpx.AsyncClient(timeout=httpx.Timeout(10.0)) as client:
-                api_url = self.get_api(asset=asset, market=market)
-                response = await client.get(api_url)
-                response.raise_for_status()
-                asset_data = response.json()
-                logger.debug(f"Received asset data: {asset_data}")
-                asset_data = schemas.AssetPriceFromApi(**asset_data)
+            cached = self.quotes.get((asset, market), None)
+            headers = {"Accept": self.price_accept}
+            if cached is not None and self.conditional_requests:
+                headers["If-None-Match"] = cached[0]
+            requested = time.perf_counter()
+            response = await self._get(
+                PRICE_PATH_TEMPLATE.format(asset=asset, market=market),
+                hedge=True, headers=headers)
+            metrics.fetch_duration_seconds.labels(market).observe(
+                time.perf_counter() - requested)
+            if response.status_code == httpx.codes.NOT_MODIFIED and cached is not None:
+                self.not_modified_count += 1
+                return cached[1]
+            response.raise_for_status()
+            quotes = self._decode_quotes(response, single=True)
+            if len(quotes) != 1:
+                raise ValueError(f"Expected a single quote, received {len(quotes)}")
+            logger.debug("Received asset data: %s", quotes[0])
+            etag = response.headers.get("ETag", None)
+            if etag is not None and self.conditional_requests:
+                self.quotes[(asset, market)] = (etag, quotes[0])
+            self._notify_listeners(quotes)
+            asset_data = quotes[0]
+
+        except httpx.HTTPStatusError as e:
+            logger.error("HTTP error for %s in %s: %s", asset, market, e)
+            metrics.fetch_errors_total.labels(market, "status").inc()
+        except httpx.TimeoutException as e:
+            logger.error("Request timeout for %s in %s: %r", asset, market, e)
+            metrics.fetch_errors_total.labels(market, "timeout").inc()
+        except httpx.RequestError as e:
+            logger.error("Request error for %s in %s: %s", asset, market, e)
+            metrics.fetch_errors_total.labels(market, "request").inc()
+        except CircuitOpenError as e:
+            logger.debug("Request for %s in %s is not sent: %s", asset, market, e)
+            metrics.fetch_errors_total.labels(market, "circuit_open").inc()
+        except ValueError as e:
+            logger.error("Invalid quote of %s in %s: %s", asset, market, e)
+            metrics.fetch_errors_total.labels(market, "decode").inc()
+        return asset_data
+
+
+    def forget_pairs(self, pairs: Iterable[Tuple[str, str]]) -> None:
+        """Drops cached quotes of pairs which are no longer tracked, so that
+        an ETag of a pair removed and added again never matches"""
+        for pair in pairs:
+            self.quotes.pop(pair, None)
+
+
+    async def fetch_universe(self, conditional: bool = True) -> Optional[schemas.Universe]:
+        """Fetches assets and markets of prices source. Returns None if they
+        have not changed since previous request, if `conditional`, or if the
+        request failed"""
+        try:
+            headers = ({"If-None-Match": self.universe_etag}
+                       if conditional and self.universe_etag is not None else None)
+            response = await self._get(UNIVERSE_PATH, headers=headers)
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                return None
+            response.raise_for_status()
+            universe = schemas.Universe.model_validate_json(response.content)
+            self.universe_etag = response.headers.get("ETag", None)
+            logger.debug("Received universe of %d assets and %d markets",
+                         len(universe.assets), len(universe.markets))
+            return universe
+
+        except httpx.HTTPStatusError as e:
+            logger.error("HTTP error for universe: %s", e)
+        except httpx.RequestError as e:
+            logger.error("Request error for universe: %s", e)
+        except CircuitOpenError as e:
+            logger.debug("Universe request is not sent: %s", e)
+        except ValueError as e:
+            logger.error("Invalid universe: %s", e)
+        return None
+
+
+    async def fetch_prices(self, assets: List[str] = None,
+                           markets: List[str] = None,
+                           shard: Optional[int] = None,
+                           shards: int = 1
+                           ) -> List[schemas.AssetPriceFromApi]:
+        """Fetches prices of all requested asset and market pairs with a
+        single request. All assets or markets are requested if None, and
+        nothing if empty. `shard` selects assets of a shard out of `shards`
+        by hash on prices source side, so the request stays small with any
+        number of assets"""
+        assets_data = []
+        if (assets is not None and not assets) or (markets is not None and not markets):
+            return assets_data
+        params = {}
+        if assets is not None:
+            params["assets"] = assets
+        if markets is not None:
+            params["markets"] = markets
+        if shard is not None:
+            params["shard"], params["shards"] = shard, shards
+
+        try:
+            response = await self._get(SNAPSHOT_PATH, params=params,
+                                       headers={"Accept": self.snapshot_accept})
+            response.raise_for_status()
+            assets_data = self._decode_quotes(response)
+            logger.debug("Received prices snapshot of %d quotes", len(assets_data))
+            self._notify_listeners(assets_data)
 
         except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error for {asset} in {market}: {e}")
-            await asyncio.sleep(0.1)
+            logger.error("HTTP error for prices snapshot: %s", e)
         except httpx.RequestError as e:
-            logger.error(f"Request error for {asset} in {market}: {e}")
-            await asyncio.sleep(0.1)
-        return asset_data
\ No newline at end of file
+            logger.error("Request error for prices snapshot: %s", e)
+        except CircuitOpenError as e:
+            logger.debug("Prices snapshot request is not sent: %s", e)
+        except ValueError as e:
+            logger.error("Invalid prices snapshot: %s", e)
+        return assets_data
+
+
+    async def stream_prices(self, assets: List[str] = None,
+                            markets: List[str] = None,
+                            shard: Optional[int] = None,
+                            shards: int = 1
+                            ) -> AsyncIterator[List[schemas.AssetPriceFromApi]]:
+        """Subscribes to prices stream (server-sent events) and yields received
+        quotes. First yielded batch is a snapshot of all requested pairs, 
+        followed by single price updates, or a fresh snapshot if the server 
+        had to resync the subscription. 
+        Connection errors and `CircuitOpenError` are propagated, so caller
+        can reconnect. All assets or markets are subscribed to if None, and
+        nothing is yielded if empty. `shard` selects assets as in
+        `fetch_prices`."""
+        if (assets is not None and not assets) or (markets is not None and not markets):
+            return
+        params = {}
+        if assets is not None:
+            params["assets"] = assets
+        if markets is not None:
+            params["markets"] = markets
+        if shard is not None:
+            params["shard"], params["shards"] = shard, shards
+        # server sends keep-alive comments, so a long read timeout means a dead connection
+        timeout = httpx.Timeout(self.timeout.connect, read=self.stream_read_timeout_s)
+
+        client = await self._get_client()
+        # a new endpoint is chosen on each (re)connection
+        endpoint = self.balancer.choose()
+        if endpoint is None:
+            raise CircuitOpenError("All prices source endpoints are ejected")
+        await endpoint.acquire()
+        try:
+            async with client.stream("GET", endpoint.url + STREAM_PATH, params=params,
+                                     timeout=timeout) as response:
+                if response.status_code >= 500:
+                    self.balancer.record_failure(endpoint)
+                response.raise_for_status()
+                # time to headers of a stream is not a latency of requests,
+                # which hedging and balancing are based on
+                self.balancer.record_connected(endpoint)
+                logger.info("Subscribed to prices stream at %s", endpoint.url)
+                event, data_lines = None, []
+                async for line in response.aiter_lines():
+                    if line:
+                        field, _, value = line.partition(":")
+                        if field == "event":
+                            event = value.strip()
+                        elif field == "data":
+                            data_lines.append(value.lstrip())
+                        continue
+
+                    # empty line ends an event
+                    if data_lines:
+                        data = "\n".join(data_lines)
+                        if event == "snapshot":
+                            assets_data = wire.decode_json_quotes(data)
+                            logger.debug("Received prices snapshot of %d quotes",
+                                         len(assets_data))
+                        else:
+                            assets_data = [schemas.AssetPriceFromApi.model_validate_json(data)]
+                            logger.debug("Received asset data: %s", assets_data[0])
+                        self._notify_listeners(assets_data)
+                        yield assets_data
+                    event, data_lines = None, []
+        except httpx.RequestError:
+            self.balancer.record_failure(endpoint)
+            raise
@@ -0,0 +1,80 @@
+"""Prometheus metrics of prices analyzer.
+
+Metrics are kept in a dedicated registry and exposed by analyzer's API at
+`GET /metrics`. All metrics are recorded from analyzer's event loop only,
+with lock-free metric classes shared with generator, see `local_metrics`.
+Counters and gauges which already exist as plain attributes are collected
+on scrape, see `attributes_collector`.
+Each shard worker process has its own registry, served by its own embedded
+API, so a scrape returns metrics of that worker only.
+If `METRICS_ENABLED` is false, all metrics are no-ops.
+"""
+from decouple import config
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+from local_metrics import AttributesCollector, LocalCounter, LocalHistogram, NoopMetric
+
+
+metrics_enabled = config('METRICS_ENABLED', default=True, cast=bool)
+registry = CollectorRegistry()
+content_type = CONTENT_TYPE_LATEST
+
+LATENCY_BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                     0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCK_WAIT_BUCKETS_S = (0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+
+def _create(metric_class, *args, **kwargs):
+    if not metrics_enabled:
+        return NoopMetric()
+    metric = metric_class(*args, **kwargs)
+    registry.register(metric)
+    return metric
+
+
+attributes_collector = AttributesCollector()
+if metrics_enabled:
+    registry.register(attributes_collector)
+
+fetch_duration_seconds = _create(
+    LocalHistogram, "analyzer_fetch_duration_seconds",
+    "Latency of single price requests by market",
+    labelnames=("market",), buckets=LATENCY_BUCKETS_S)
+fetch_errors_total = _create(
+    LocalCounter, "analyzer_fetch_errors",
+    ("Failed price requests by market and kind: timeout, request, status,"
+     " circuit_open or decode"),
+    labelnames=("market", "kind"))
+endpoint_latency_seconds = _create(
+    LocalHistogram, "analyzer_endpoint_latency_seconds",
+    "Latency of successful requests by prices source endpoint",
+    labelnames=("endpoint",), buckets=LATENCY_BUCKETS_S)
+endpoint_ejections_total = _create(
+    LocalCounter, "analyzer_endpoint_ejections",
+    "Ejections of a prices source endpoint after failed requests",
+    labelnames=("endpoint",))
+lock_wait_seconds = _create(
+    LocalHistogram, "analyzer_lock_wait_seconds",
+    "Time spent waiting for an asset's lock in detector",
+    buckets=LOCK_WAIT_BUCKETS_S)
+detection_latency_seconds = _create(
+    LocalHistogram, "analyzer_detection_latency_seconds",
+    "Time from generation of a quote to detection of opportunity it triggered",
+    buckets=LATENCY_BUCKETS_S)
+queue_wait_seconds = _create(
+    LocalHistogram, "analyzer_queue_wait_seconds",
+    "Time quotes of a pair waited in the queue for a detector worker",
+    buckets=LATENCY_BUCKETS_S)
+opportunities_total = _create(
+    LocalCounter, "analyzer_opportunities",
+    "Detected arbitrage opportunities by asset", labelnames=("asset",))
+stream_reconnects_total = _create(
+    LocalCounter, "analyzer_stream_reconnects", "Reconnects to prices stream")
+universe_changes_total = _create(
+    LocalCounter, "analyzer_universe_changes",
+    "Changes of tracked assets and markets applied at runtime")
+
+
+def get_metrics() -> bytes:
+    return generate_latest(registry)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 from uuid import UUID, uuid4
 
 class Asset(BaseModel):
@@ -22,7 +22,16 @@ class AssetPrice(Asset, PriceBase):
 
 
 class AssetPriceFromApi(Asset, PriceBaseAPI):
-    pass
+    # sequence number, incremented by prices source on each price change, and
+    # unix time of the change, if supported
+    version: Optional[int] = None
+    generated_at: Optional[float] = None
+
+
+class Universe(BaseModel):
+    # assets and markets of prices source
+    assets: List[str]
+    markets: List[str]
 
 
 class PriceConfig(BaseModel):
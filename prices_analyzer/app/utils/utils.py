@@ -1,4 +1,6 @@
 # from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+import os
 from ..utils.logger import get_logger
 import yaml
 
@@ -11,15 +13,19 @@ def load_yaml_file(file_path: str) -> dict:
         with open(file_path, 'r') as file:
             return yaml.safe_load(file)
     except FileNotFoundError:
-        logger.error(f"Config file not found: {file_path}")
+        logger.error("Config file not found: %s", file_path)
         raise
     except yaml.YAMLError as e:
-        logger.error(f"Failed to parse YAML file {file_path}: {e}")
+        logger.error("Failed to parse YAML file %s: %s", file_path, e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error when loading YAML file {file_path}: {e}")
+        logger.error("Unexpected error when loading YAML file %s: %s", file_path, e)
         raise
 
 
-
-
+def get_transfer_costs_filepath() -> str:
+    """Helper function to get absolute transfer costs config location. Can
+    be overridden with TRANSFER_COSTS_FILE environment variable."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config_filepath = os.path.join(base_dir, 'config', 'transfer_costs.yaml')
+    return config('TRANSFER_COSTS_FILE', default=config_filepath)
@@ -0,0 +1,68 @@
+"""Decoding of price quotes, binary encoded or JSON.
+
+Prices source sends quotes in binary format instead of JSON if requested
+with `Accept: application/x-price-quotes`. The layout is described in
+generator's `utils/wire.py`, the two must be kept in sync.
+
+Quotes of either format are built by a single pydantic-core call over the
+whole response. With pydantic 2 this is cheaper than parsing JSON in Python
+and validating quote by quote, and also cheaper than skipping validation
+with `model_construct`, which runs in Python.
+"""
+import struct
+from typing import List
+
+from pydantic import TypeAdapter
+
+from ..utils import schemas
+
+
+CONTENT_TYPE = "application/x-price-quotes"
+MAGIC = b"QTS1"
+HEADER = struct.Struct("<4sIIII")
+# asset and market indices, price, spread, version and generated_at, see
+# generator's `QUOTE_DTYPE`
+QUOTE = struct.Struct("<IIddqd")
+QUOTES = TypeAdapter(List[schemas.AssetPriceFromApi])
+
+
+def is_binary(content_type: str) -> bool:
+    return content_type is not None and content_type.startswith(CONTENT_TYPE)
+
+
+def decode_json_quotes(content: bytes) -> List[schemas.AssetPriceFromApi]:
+    """Decodes a JSON list of quotes. Raises `ValueError` if it is invalid"""
+    return QUOTES.validate_json(content)
+
+
+def decode_quotes(content: bytes) -> List[schemas.AssetPriceFromApi]:
+    """Decodes binary quotes. Raises `ValueError` if they are malformed"""
+    if len(content) < HEADER.size:
+        raise ValueError("Binary quotes are truncated")
+    magic, assets_count, markets_count, quotes_count, names_size = HEADER.unpack_from(content)
+    if magic != MAGIC:
+        raise ValueError(f"Unknown binary quotes format {magic!r}")
+    names_end = HEADER.size + names_size
+    if len(content) != names_end + quotes_count * QUOTE.size:
+        raise ValueError("Size of binary quotes does not match their header")
+
+    names = content[HEADER.size:names_end].decode().split("\0") if names_size else []
+    if len(names) != assets_count + markets_count:
+        raise ValueError("Number of names does not match binary quotes header")
+    assets, markets = names[:assets_count], names[assets_count:]
+    try:
+        quotes = [
+            {"name": assets[asset], "market": markets[market], "price": price,
+             "spread": spread,
+             # versions and generation times are optional
+             "version": version if version >= 0 else None,
+             "generated_at": generated_at if generated_at == generated_at else None}
+            for asset, market, price, spread, version, generated_at
+            in QUOTE.iter_unpack(memoryview(content)[names_end:])
+            ]
+    except IndexError:
+        raise ValueError("Binary quotes refer to unknown names")
+    # list adapter's own overhead is larger than a single quote's validation
+    if len(quotes) == 1:
+        return [schemas.AssetPriceFromApi.model_validate(quotes[0])]
+    return QUOTES.validate_python(quotes)
@@ -1,82 +1,334 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, HTTPException, status
-import random
+from decouple import config
+from fastapi import FastAPI, Header, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
+import numpy as np
+from typing import AsyncIterator, List, Optional
 
 from .core import assets_manager
-from .utils import schemas
+from .core.broadcaster import PriceBroadcaster, PriceSubscription
+from .core.quotes_cache import QuotesCache
+from .core.scheduler import PriceUpdateScheduler
+from .core.shared_prices import SharedPrices
+from .utils import metrics, schemas, wire
 from .utils.logger import get_logger
 from .utils.utils import get_config_filepath
 
 
 logger = get_logger(__name__)
-thread_pool = ThreadPoolExecutor(max_workers=10)
+stream_keepalive_s = config('STREAM_KEEPALIVE_S', default=10.0, cast=float)
+stream_queue_size = config('STREAM_QUEUE_SIZE', default=1000, cast=int)
+# serve prices written to this shared memory segment by `app.price_engine`,
+# instead of generating them in this process. Empty to generate own prices
+shared_prices_name = config('SHARED_PRICES_NAME', default="")
+shared_prices_attach_timeout_s = config('SHARED_PRICES_ATTACH_TIMEOUT_S', default=30.0, cast=float)
+# how often shared prices are checked for updates, to stream them
+shared_prices_poll_s = config('SHARED_PRICES_POLL_S', default=0.1, cast=float)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """ 
     Initializes assets manager and starts infinite prices updade task in the 
-    background.
+    background. With shared prices, attaches to prices written by price 
+    engine and watches them for updates instead.
     """
-    config_filepath = get_config_filepath()
-    app.state.assets_manager = assets_manager.AssetsManager(config_filepath)
-    logger.debug(app.state.assets_manager.prices_dict)
+    if shared_prices_name:
+        app.state.assets_manager = assets_manager.SharedAssetsReader(SharedPrices.attach(
+            shared_prices_name, timeout_s=shared_prices_attach_timeout_s))
+        app.state.quotes_cache = QuotesCache(
+            app.state.assets_manager, check_versions=True,
+            epoch=app.state.assets_manager.shared_prices.epoch)
+    else:
+        config_filepath = get_config_filepath()
+        app.state.assets_manager = assets_manager.AssetsManager(config_filepath)
+        app.state.quotes_cache = QuotesCache(app.state.assets_manager)
+    # incremented on each change of assets and markets, for universe's ETag
+    app.state.universe_version = 0
+    app.state.price_broadcaster = PriceBroadcaster(
+        encode=encode_price_quote, queue_size=stream_queue_size)
+    metrics.attributes_collector.add_gauge(
+        "generator_stream_subscribers", "Open prices stream subscriptions",
+        lambda: len(app.state.price_broadcaster.subscriptions))
+    logger.debug("Prices initialized for %d pairs", app.state.assets_manager.pairs_count)
 
-    app.add_event_handler("startup", start_background_tasks(app))
+    if shared_prices_name:
+        app.state.price_scheduler_task = asyncio.create_task(watch_shared_prices(app))
+    else:
+        start_background_tasks(app)
     yield
+    app.state.price_scheduler_task.cancel()
 
 
 def start_background_tasks(app: FastAPI):
-    """Starts separate background tasks for updating the prices of each asset 
-    independently.
+    """Starts a single background task which updates the price of each asset
+    on each market after its own random interval.
     """
     assets_manager = app.state.assets_manager
+    price_config = assets_manager.price_config
 
-    for asset_and_market in assets_manager.prices_dict.keys():
-        # Create and start a separate task for each asset
-        asset = assets_manager.prices_dict[asset_and_market]
-        asyncio.create_task(update_asset_price_loop(app, asset))
-        logger.debug(f"Update price loop created for asset {asset}")
+    price_scheduler = PriceUpdateScheduler(
+        update_batch=lambda keys: update_assets_prices(app, keys),
+        interval_min_s=price_config.price_update_interval_min,
+        interval_max_s=price_config.price_update_interval_max)
+    # all prices are updated right after start, as before
+    price_scheduler.schedule_all(range(assets_manager.pairs_count),
+                                 due_time=asyncio.get_running_loop().time())
 
+    metrics.attributes_collector.add_gauge(
+        "generator_scheduled_pairs", "Pairs waiting for their next update",
+        lambda: len(price_scheduler.heap))
+    app.state.price_scheduler = price_scheduler
+    app.state.price_scheduler_task = asyncio.create_task(price_scheduler.run())
+    logger.debug("Price update scheduler created for %d pairs", len(price_scheduler.heap))
 
-async def update_asset_price_loop(app: FastAPI, asset: schemas.Asset):
+
+def update_assets_prices(app: FastAPI, pairs_ids: List[int]):
     """
-    Independent infinite background task for updating a specific asset's price.
+    Updates prices of provided asset and market pairs, which are due to update.
     """
     assets_manager = app.state.assets_manager
+    price_broadcaster = app.state.price_broadcaster
+    started = time.perf_counter()
+
+    assets_manager.update_prices(pairs_ids)
+    app.state.quotes_cache.invalidate(pairs_ids)
+    if price_broadcaster.subscriptions:
+        for pair_id in pairs_ids:
+            price_broadcaster.publish(assets_manager.get_asset_price(pair_id))
+
+    metrics.price_update_batch_duration_seconds.observe(time.perf_counter() - started)
+    metrics.price_updates_total.inc(len(pairs_ids))
+
+    logger.debug("Prices of %d pairs are updated.", len(pairs_ids))
 
+
+async def watch_shared_prices(app: FastAPI):
+    """Publishes updates of shared prices, made by price engine process, to
+    stream subscribers. Versions are only compared while there are any"""
+    assets_manager = app.state.assets_manager
+    price_broadcaster = app.state.price_broadcaster
+    versions = None
     while True:
-        assets_manager.update_asset_price(asset)
+        await asyncio.sleep(shared_prices_poll_s)
+        if not price_broadcaster.subscriptions:
+            versions = None
+            continue
+        current_versions = assets_manager.versions.copy()
+        if versions is not None:
+            for pair_id in np.flatnonzero(current_versions != versions):
+                price_broadcaster.publish(assets_manager.get_asset_price(pair_id))
+        versions = current_versions
+
 
-        # simulate different waiting time update
-        sleep_duration = round(random.uniform(3, 6), 1)  
-        logger.debug((f"Asset's {asset} price is updated."
-                      f" Sleep duration: {sleep_duration} s"))
-        await asyncio.sleep(sleep_duration)
+def change_universe(app: FastAPI, change: schemas.UniverseChange) -> None:
+    """Adds and removes assets and markets. Prices, update schedule and
+    cached quotes of pairs which stay are kept, under pairs' new ids. New
+    pairs are due to update right away. Raises `UniverseChangeError` if
+    universe can not be changed"""
+    previous_ids = app.state.assets_manager.change_universe(
+        add_assets=change.add_assets, remove_assets=change.remove_assets,
+        add_markets=change.add_markets, remove_markets=change.remove_markets)
+    kept = previous_ids >= 0
+    pairs_map = dict(zip(previous_ids[kept].tolist(), np.flatnonzero(kept).tolist()))
+    app.state.quotes_cache.remap(pairs_map)
+    price_scheduler = app.state.price_scheduler
+    price_scheduler.remap(pairs_map)
+    price_scheduler.schedule_all(np.flatnonzero(~kept).tolist(),
+                                 due_time=asyncio.get_running_loop().time())
+    app.state.universe_version += 1
+    metrics.universe_changes_total.inc()
+
+
+def encode_price_quote(asset_price: schemas.AssetPrice) -> bytes:
+    """Encoded JSON quote of a price, served from quotes cache"""
+    pair_id = app.state.assets_manager.get_pair_id(asset_price.name, asset_price.market)
+    return app.state.quotes_cache.get(pair_id)
+
+
+def encode_binary_quotes(pairs_ids) -> bytes:
+    """Binary encoded quotes of pairs, see `utils/wire.py`"""
+    assets_manager = app.state.assets_manager
+    return wire.encode_quotes(assets_manager.assets, assets_manager.markets, pairs_ids,
+                              assets_manager.get_prices_records(pairs_ids))
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.RequestMetricsMiddleware, paths=('/price', '/prices'))
+
+
+@app.get('/price', response_model=schemas.PriceQuoteOut)
+async def get_price(asset_name: str, market: str,
+                    if_none_match: Optional[str] = Header(default=None),
+                    accept: Optional[str] = Header(default=None)
+                    ) -> Response:
+    """
+    API to provide current asset price at specific market.
+    Served from pre-encoded quotes cache directly on the event loop.
+    Supports conditional requests: if `If-None-Match` header matches quote's
+    ETag, price has not changed and empty `304 Not Modified` is returned.
+    Quote is binary encoded if `Accept` header asks for it, see `utils/wire.py`.
+    """
+    pair_id = app.state.assets_manager.get_pair_id(asset_name, market)
+    if pair_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                            detail='Asset and market pair not found')
+
+    quotes_cache = app.state.quotes_cache
+    etag = quotes_cache.get_etag(pair_id)
+    if if_none_match is not None and is_etag_matched(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED,
+                        headers={"ETag": etag, "Vary": "Accept"})
+
+    if wire.accepts_binary(accept):
+        return Response(content=encode_binary_quotes([pair_id]),
+                        media_type=wire.CONTENT_TYPE,
+                        headers={"ETag": etag, "Vary": "Accept"})
+    return Response(content=quotes_cache.get(pair_id),
+                    media_type="application/json",
+                    headers={"ETag": etag, "Vary": "Accept"})
+
+
+def is_etag_matched(etag: str, if_none_match: str) -> bool:
+    """Checks ETag against `If-None-Match` header, which may contain a list
+    of weak or strong ETags, or `*`"""
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag
+               for tag in if_none_match.split(","))
+
+
+def check_shard(shard: Optional[int], shards: int) -> None:
+    if shard is not None and shard >= shards:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail=f"Shard {shard} is out of {shards} shards")
+
+
+@app.get('/prices', response_model=List[schemas.PriceQuoteOut])
+async def get_prices(
+        assets: Optional[List[str]] = Query(default=None),
+        markets: Optional[List[str]] = Query(default=None),
+        shard: Optional[int] = Query(default=None, ge=0),
+        shards: int = Query(default=1, ge=1),
+        accept: Optional[str] = Header(default=None)
+        ) -> Response:
+    """
+    API to provide current prices of all asset and market pairs in a single
+    response. Optionally filtered by assets and / or markets, e.g.
+    `/prices?assets=Copper&assets=Oil&markets=US`, and by shard of assets,
+    e.g. `/prices?shard=0&shards=4`, as analyzer splits them between its
+    workers. Quotes are binary encoded if `Accept` header asks for it.
+    """
+    check_shard(shard, shards)
+    pairs_ids = app.state.assets_manager.get_pairs_ids(
+        assets=assets, markets=markets, shard=shard, shards=shards)
+
+    if wire.accepts_binary(accept):
+        return Response(content=encode_binary_quotes(pairs_ids),
+                        media_type=wire.CONTENT_TYPE, headers={"Vary": "Accept"})
+    return Response(content=app.state.quotes_cache.get_many(pairs_ids),
+                    media_type="application/json", headers={"Vary": "Accept"})
 
 
-@app.get('/price')
-async def get_price(asset_name, market) -> schemas.PriceQuoteOut:
+async def price_events(subscription: PriceSubscription) -> AsyncIterator[bytes]:
     """
-    API to provide current asset price at specific market
+    Generates server-sent events for a subscription. First event is always a
+    snapshot of current prices, followed by price updates as they happen.
+    If subscriber falls behind, pending updates are dropped and a fresh 
+    snapshot is sent instead. Stops when client disconnects.
     """
+    assets_manager = app.state.assets_manager
+    price_broadcaster = app.state.price_broadcaster
+
+    def snapshot_event() -> bytes:
+        subscription.reset()
+        pairs_ids = assets_manager.get_pairs_ids(
+            assets=subscription.assets, markets=subscription.markets,
+            shard=subscription.shard, shards=subscription.shards)
+        return (b"event: snapshot\ndata: " 
+                + app.state.quotes_cache.get_many(pairs_ids) + b"\n\n")
+
     try:
-        asset = schemas.Asset(name=asset_name, market=market) # validate input
-    except ValueError as e:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                            detail=str(e))
+        yield snapshot_event()
+        while True:
+            if subscription.overflowed:
+                logger.warning("Prices subscriber is too slow. Resyncing from snapshot")
+                yield snapshot_event()
+                continue
+            try:
+                message = await asyncio.wait_for(subscription.queue.get(),
+                                                 timeout=stream_keepalive_s)
+            except asyncio.TimeoutError:
+                metrics.stream_keepalive_timeouts_total.inc()
+                yield b": keep-alive\n\n"
+                continue
+            yield b"event: price\ndata: " + message + b"\n\n"
+    finally:
+        price_broadcaster.unsubscribe(subscription)
+
+
+@app.get('/prices/stream')
+async def stream_prices(
+        assets: Optional[List[str]] = Query(default=None),
+        markets: Optional[List[str]] = Query(default=None),
+        shard: Optional[int] = Query(default=None, ge=0),
+        shards: int = Query(default=1, ge=1)
+        ) -> StreamingResponse:
+    """
+    API to stream prices as server-sent events. Optionally filtered by assets
+    and / or markets, and by shard of assets, as `/prices`. Emits `snapshot`
+    event with all current prices on connect and `price` event on each price
+    update.
+    """
+    check_shard(shard, shards)
+    subscription = app.state.price_broadcaster.subscribe(
+        assets=assets, markets=markets, shard=shard, shards=shards)
+
+    return StreamingResponse(price_events(subscription),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+
+@app.get('/universe', response_model=schemas.Universe)
+async def get_universe(if_none_match: Optional[str] = Header(default=None)) -> Response:
+    """
+    API to provide assets and markets which prices are generated for.
+    Supports conditional requests, its ETag changes with the universe.
+    """
+    etag = f'"{app.state.quotes_cache.epoch}-u{app.state.universe_version}"'
+    if if_none_match is not None and is_etag_matched(etag, if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
 
     assets_manager = app.state.assets_manager
+    universe = schemas.Universe(assets=assets_manager.get_assets_list(),
+                                markets=assets_manager.get_markets_list())
+    return Response(content=universe.model_dump_json(), media_type="application/json",
+                    headers={"ETag": etag})
 
-    price_data = await asyncio.get_event_loop().run_in_executor(
-            thread_pool, assets_manager.get_curr_asset_price, asset)
-    if price_data is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                            detail='Asset and market pair not found')
 
-    return price_data
\ No newline at end of file
+@app.patch('/universe', response_model=schemas.Universe)
+async def patch_universe(change: schemas.UniverseChange) -> Response:
+    """
+    API to add and remove assets and markets at runtime, e.g.
+    `{"add_assets": ["Gold"], "remove_markets": ["UK"]}`. Prices of pairs
+    which stay are kept, new pairs get initial prices. Not supported with
+    shared prices, which universe is fixed by price engine.
+    """
+    if shared_prices_name:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Universe of shared prices is fixed, restart price engine")
+    try:
+        change_universe(app, change)
+    except assets_manager.UniverseChangeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return await get_universe(if_none_match=None)
+
+
+@app.get('/metrics')
+async def get_metrics() -> Response:
+    """
+    API to provide service metrics in Prometheus text format
+    """
+    return Response(content=metrics.get_metrics(), media_type=metrics.content_type)
@@ -1,19 +1,30 @@
-from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import os
 from pydantic import ValidationError
-import random
-from typing import List, Tuple, Dict, Set
+import time
+from typing import Dict, Iterable, List, Optional
 
+from .shared_prices import PAIR_DTYPE, SharedPrices
 from ..utils.logger import get_logger
 from ..utils import schemas
-from ..utils.utils import load_yaml_file
+from ..utils.utils import counter_uniform, get_shard_id, load_yaml_file
 
 
 logger = get_logger(__name__)
 
 
 RANDOM = 42
-random.seed(RANDOM)
+# each pair has its own random stream, keyed by pair id. Its first draws
+# make the initial price, then each update takes 2 draws, by pair's version
+INITIAL_PRICE_DRAW = 0
+INITIAL_SPREAD_DRAW = 1
+# base prices are drawn from assets' streams, keyed by asset index, which
+# are separated from pairs' ones by the seed
+ASSETS_STREAMS = 1
+
+
+class UniverseChangeError(Exception):
+    pass
 
 
 class AssetsManager:
@@ -25,15 +36,71 @@ class AssetsManager:
     - Initializes prices
     - Updates prices
     - Return prices 
-    """
-    price_config: schemas.PriceConfig = None
-    prices_dict: Dict[Tuple[str, str], schemas.AssetPrice] = {}
 
+    Prices are stored compactly: each asset and market pair has an integer 
+    id (`asset index * markets count + market index`), which indexes flat 
+    arrays of prices and spreads. Pydantic models are only built when prices
+    are returned. Each pair also has a version, incremented on every price
+    update, which serves as pair's quotes sequence number, so clients can tell
+    whether a price changed since their last request and order quotes. 
+    Time of the last update (unix time) is kept along with it.
+
+    All random values of a pair come from its own counter-based random
+    stream, so prices are generated for all pairs at once in vectorized
+    form, and the same config always produces the same prices of each pair,
+    whatever the order and batches of updates are.
+
+    With `shared_prices_name` the arrays live in a shared memory segment of
+    that name instead, so other processes can serve prices from it with
+    `SharedAssetsReader`.
+
+    Assets and markets can be added or removed at runtime, see
+    `change_universe`. Pairs which stay keep their prices and versions but
+    get new ids, so random streams, and thus prices after such change,
+    depend on the order of changes. Universe of shared prices is fixed.
+    """
 
-    def __init__(self, price_config_file: str):
-        self.price_config = self._get_price_config(price_config_file)
-        self.prices_dict = self._construct_prices_dict()
-        pass
+    # max difference of an asset's initial price on a market from its base price
+    market_price_diff_max = 0.03
+
+    def __init__(self, price_config_file: str, shared_prices_name: Optional[str] = None):
+        self.price_config: schemas.PriceConfig = self._get_price_config(price_config_file)
+        self.seed = RANDOM
+        self._set_universe(list(self.price_config.assets), list(self.price_config.markets))
+        self.shared_prices: Optional[SharedPrices] = None
+        if shared_prices_name:
+            self.shared_prices = SharedPrices.create(
+                shared_prices_name, self.assets, self.markets)
+            self._use_shared_prices()
+            self.versions[:] = 1
+            self.generated_at[:] = time.time()
+        else:
+            self.prices = np.zeros(self.pairs_count, dtype=np.float64)
+            self.spreads = np.zeros(self.pairs_count, dtype=np.float64)
+            self.versions = np.ones(self.pairs_count, dtype=np.int64)
+            self.generated_at = np.full(self.pairs_count, time.time(), dtype=np.float64)
+        self._construct_prices()
+        if self.shared_prices is not None:
+            self.shared_prices.publish()
+
+
+    def _set_universe(self, assets: List[str], markets: List[str]) -> None:
+        self.assets: List[str] = assets
+        self.markets: List[str] = markets
+        self.assets_index: Dict[str, int] = {
+            asset: i for i, asset in enumerate(self.assets)}
+        self.markets_index: Dict[str, int] = {
+            market: i for i, market in enumerate(self.markets)}
+        self.pairs_count = len(self.assets) * len(self.markets)
+
+
+    def _use_shared_prices(self) -> None:
+        """Prices arrays become views of shared prices records"""
+        records = self.shared_prices.records
+        self.prices = records["price"]
+        self.spreads = records["spread"]
+        self.versions = records["version"]
+        self.generated_at = records["generated_at"]
 
 
     def _get_price_config(self, config_file: str) -> schemas.PriceConfig:
@@ -51,134 +118,242 @@ class AssetsManager:
         markets_data = load_yaml_file(markets_file_path)
         
         try:
+            # duplicates are dropped, keeping the order, so pair ids and thus
+            # prices only depend on config
             price_config = schemas.PriceConfig(
-                assets=set(assets_data),#, .get('assets', [])),
-                markets=set(markets_data),#.get('markets', [])),
+                assets=list(dict.fromkeys(assets_data)),
+                markets=list(dict.fromkeys(markets_data)),
                 **config_data.get('price_config', {})
             )
         
         except ValidationError as ve:
-            logger.error(f"Validation error when creating PriceConfig: {ve}")
+            logger.error("Validation error when creating PriceConfig: %s", ve)
             raise
         except Exception as e:
-            logger.error(f"Unexpected error when creating PriceConfig: {e}")
+            logger.error("Unexpected error when creating PriceConfig: %s", e)
             raise
         
         return price_config
 
 
-    def _create_base_price(self):
-        """Generates random price within allowed range"""
-        price_min = self.price_config.price_min
-        price_max = self.price_config.price_max
-        price = round(
-            number = (price_min 
-                        + (price_max - price_min) * random.random()),
-            ndigits = 4)
-        return price
-    
-
-    def _set_asset_initial_prices(self, asset_name, max_diff=0.03):
-        """Generates asset price for each market. 
-        Done in 2 steps:
-        1. Generate random base price within range
-        2. Iterate over markets and modify base price by market 
-           coefficient
-        """
-        base_price = self._create_base_price()
-        markets = self.price_config.markets
-        asset_prices = {}
-        for market in markets:
-
-            market_coef = random.uniform(-max_diff, max_diff)
-            asset_market_price = base_price * (1 + market_coef)
-            spread = self._get_new_spread(
-                self.price_config.spread_min,
-                self.price_config.spread_max
-            )
-
-            asset_price = schemas.AssetPrice(
-                name=asset_name, 
-                market=market, 
-                price=asset_market_price, 
-                spread=spread
-            )
-
-            asset_prices[asset_name, market] = asset_price
-
-        return asset_prices
-
-
-    def _construct_prices_dict(
-            self
-            ) -> Dict[Tuple[str, str], schemas.AssetPrice]:
-        """Generate price for each asset for each market"""
-
-        config = self.price_config
-
-        assets_price_dict = {}
-
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(self._set_asset_initial_prices, 
-                                asset_name=asset_name) 
-                    for asset_name in config.assets
-            ]
-
-            for future in futures:
-                asset_price_dict = future.result()
-                assets_price_dict.update(asset_price_dict)
-                
-        return assets_price_dict
-
-
-    def _get_new_price(self, curr_price: float, price_change_max: float) -> float:
-        """Modify provided price by coeficinet randomly defined within 
-        range. If resulting price less or equal to 0, recalculates applying  
-        maximum allowed positive coefficient instead of randomly selected.
+    def _get_base_prices(self, assets_idx: np.ndarray) -> np.ndarray:
+        """Random base prices of assets within range"""
+        return np.round(counter_uniform(
+            self.seed + ASSETS_STREAMS, assets_idx, 0,
+            self.price_config.price_min, self.price_config.price_max), 4)
+
+
+    def _construct_prices(self, pairs_ids: Optional[np.ndarray] = None,
+                          base_prices: Optional[np.ndarray] = None) -> None:
+        """Generates initial prices of pairs, all by default, at once, in 2 steps:
+        1. Generate random base price of each asset within range, unless
+           base prices of all assets are provided
+        2. Modify it on each market by market coefficient
+        Spreads are randomly generated within configured range"""
+        price_config = self.price_config
+        if pairs_ids is None:
+            pairs_ids = np.arange(self.pairs_count)
+        if base_prices is None:
+            base_prices = self._get_base_prices(np.arange(len(self.assets)))
+
+        market_coefs = counter_uniform(
+            self.seed, pairs_ids, INITIAL_PRICE_DRAW,
+            -self.market_price_diff_max, self.market_price_diff_max)
+        self.prices[pairs_ids] = base_prices[pairs_ids // len(self.markets)] * (1 + market_coefs)
+        self.spreads[pairs_ids] = np.round(counter_uniform(
+            self.seed, pairs_ids, INITIAL_SPREAD_DRAW,
+            price_config.spread_min, price_config.spread_max), 1)
+
+
+    def change_universe(self,
+                        add_assets: Iterable[str] = (), remove_assets: Iterable[str] = (),
+                        add_markets: Iterable[str] = (), remove_markets: Iterable[str] = ()
+                        ) -> np.ndarray:
+        """Adds and removes assets and markets. Added names go to the end,
+        known names are not added again, unknown ones are not removed.
+        Returns previous id of each pair in new pair id order, -1 for new
+        pairs, which get initial prices: a new asset's base price is random,
+        a new market's price of a known asset deviates from the asset's
+        current average price"""
+        if self.shared_prices is not None:
+            raise UniverseChangeError("Universe of shared prices is fixed")
+        remove_assets, remove_markets = set(remove_assets), set(remove_markets)
+        assets = list(dict.fromkeys(
+            [asset for asset in self.assets if asset not in remove_assets] + list(add_assets)))
+        markets = list(dict.fromkeys(
+            [market for market in self.markets if market not in remove_markets]
+            + list(add_markets)))
+        if not assets or not markets:
+            raise UniverseChangeError("At least one asset and one market must stay")
+
+        previous_assets_idx = np.array([self.assets_index.get(asset, -1) for asset in assets],
+                                       dtype=np.int64)
+        previous_markets_idx = np.array([self.markets_index.get(market, -1)
+                                         for market in markets], dtype=np.int64)
+        previous_ids = (previous_assets_idx[:, None] * len(self.markets)
+                        + previous_markets_idx[None, :]).ravel()
+        previous_ids[np.logical_or.outer(previous_assets_idx < 0,
+                                         previous_markets_idx < 0).ravel()] = -1
+        kept = previous_ids >= 0
+
+        base_prices = self._get_base_prices(np.arange(len(assets)))
+        known_assets = previous_assets_idx >= 0
+        base_prices[known_assets] = self.prices.reshape(len(self.assets), len(self.markets))[
+            previous_assets_idx[known_assets]].mean(axis=1)
+        previous_arrays = (self.prices, self.spreads, self.versions, self.generated_at)
+
+        self._set_universe(assets, markets)
+        self.price_config.assets, self.price_config.markets = assets, markets
+        self.prices = np.zeros(self.pairs_count, dtype=np.float64)
+        self.spreads = np.zeros(self.pairs_count, dtype=np.float64)
+        self.versions = np.ones(self.pairs_count, dtype=np.int64)
+        self.generated_at = np.full(self.pairs_count, time.time(), dtype=np.float64)
+        for array, previous_array in zip(
+                (self.prices, self.spreads, self.versions, self.generated_at), previous_arrays):
+            array[kept] = previous_array[previous_ids[kept]]
+        self._construct_prices(np.flatnonzero(~kept), base_prices)
+
+        logger.info("Universe changed to %d assets and %d markets, %d pairs added",
+                    len(assets), len(markets), int((~kept).sum()))
+        return previous_ids
+
+
+    def get_pair_id(self, asset_name: str, market: str) -> Optional[int]:
+        asset_idx = self.assets_index.get(asset_name, None)
+        market_idx = self.markets_index.get(market, None)
+        if asset_idx is None or market_idx is None:
+            return None
+        return asset_idx * len(self.markets) + market_idx
+
+
+    def get_pairs_ids(self,
+                      assets: Optional[Iterable[str]] = None,
+                      markets: Optional[Iterable[str]] = None,
+                      shard: Optional[int] = None,
+                      shards: int = 1
+                      ) -> np.ndarray:
+        """Ids of all pairs of provided assets and markets. All assets or 
+        markets are used if not provided. Unknown names are ignored. If
+        `shard` is provided, only assets of that shard out of `shards` are
+        used, see `get_shard_id`"""
+        assets_idx = (np.arange(len(self.assets)) if not assets else 
+                      np.array([self.assets_index[asset] for asset in assets
+                                if asset in self.assets_index], dtype=np.int64))
+        if shard is not None:
+            in_shard = np.fromiter(
+                (get_shard_id(self.assets[asset_idx], shards) == shard for asset_idx in assets_idx),
+                dtype=bool, count=len(assets_idx))
+            assets_idx = assets_idx[in_shard]
+        markets_idx = (np.arange(len(self.markets)) if not markets else
+                       np.array([self.markets_index[market] for market in markets
+                                 if market in self.markets_index], dtype=np.int64))
+
+        return (assets_idx[:, None] * len(self.markets) + markets_idx[None, :]).ravel()
+
+
+    def update_prices(self, pairs_ids: np.ndarray) -> None:
+        """Updates prices of provided pairs at once.
+        Each price is modified by coefficient randomly defined within range.
+        If resulting price is less or equal to 0, maximum allowed positive
+        coefficient is applied instead. New spread is randomly generated 
+        within configured range.
         """
-        new_price_coef = random.uniform(- price_change_max, price_change_max)
-        new_price = curr_price * (1 + new_price_coef)
-        new_price = round(new_price, 4)
-
-        if new_price <= 0:
-            new_price = curr_price * (1 + price_change_max)
-
-        return new_price
-
-
-    def _get_new_spread(self, spread_min, spread_max):
-        """Return spread randomly generated within privoded range."""
-        new_spread = random.uniform(spread_min, spread_max)
-        new_spread = round(new_spread, 1)
-
-        return new_spread
-
+        price_change_max = self.price_config.price_change_max
+        if self.shared_prices is not None:
+            self.shared_prices.begin_write(pairs_ids)
+
+        curr_prices = self.prices[pairs_ids]
+        # draws 2 * version and 2 * version + 1 of each pair's random stream
+        draws = self.versions[pairs_ids] * 2
+        new_price_coefs = counter_uniform(self.seed, pairs_ids, draws,
+                                          -price_change_max, price_change_max)
+        new_prices = np.round(curr_prices * (1 + new_price_coefs), 4)
+        self.prices[pairs_ids] = np.where(
+            new_prices > 0, new_prices, curr_prices * (1 + price_change_max))
+
+        new_spreads = counter_uniform(self.seed, pairs_ids, draws + 1,
+                                      self.price_config.spread_min,
+                                      self.price_config.spread_max)
+        self.spreads[pairs_ids] = np.round(new_spreads, 1)
+        self.versions[pairs_ids] += 1
+        self.generated_at[pairs_ids] = time.time()
+        if self.shared_prices is not None:
+            self.shared_prices.end_write(pairs_ids)
+
+
+    def update_asset_price(self, pair_id: int) -> schemas.AssetPrice:
+        """High level method to perform price update of a single pair.
+        Returned price is stamped with its sequence number and generation time"""
+        self.update_prices(np.array([pair_id]))
+
+        return self.get_asset_price(pair_id)
+
+
+    def get_asset_price(self, pair_id: int) -> schemas.AssetPrice:
+        """Builds price model of a pair"""
+        asset_idx, market_idx = divmod(int(pair_id), len(self.markets))
+        return schemas.AssetPrice(
+            name=self.assets[asset_idx],
+            market=self.markets[market_idx],
+            price=float(self.prices[pair_id]),
+            spread=float(self.spreads[pair_id]),
+            version=int(self.versions[pair_id]),
+            generated_at=float(self.generated_at[pair_id])
+        )
+
+
+    def get_prices_records(self, pairs_ids: np.ndarray) -> np.ndarray:
+        """Prices of pairs as records with `price`, `spread`, `version` and
+        `generated_at` fields"""
+        records = np.empty(len(pairs_ids), dtype=PAIR_DTYPE)
+        records["price"] = self.prices[pairs_ids]
+        records["spread"] = self.spreads[pairs_ids]
+        records["version"] = self.versions[pairs_ids]
+        records["generated_at"] = self.generated_at[pairs_ids]
+        return records
+
+
+    def get_assets_list(self) -> List[str]:
+        return self.assets
+
+
+    def get_markets_list(self) -> List[str]:
+        return self.markets
+
+
+class SharedAssetsReader(AssetsManager):
+    """
+    Read-only assets manager over prices written by another process's
+    `AssetsManager` to shared memory. Universe, in its pair id order, is
+    taken from the segment, price config is not needed.
 
-    def update_asset_price(self, asset: schemas.AssetPrice) -> schemas.AssetPrice:
-        """High level method to perform price update"""
-        asset.price = self._get_new_price(asset.price, self.price_config.price_change_max)
-        asset.spread = self._get_new_spread(
-            self.price_config.spread_max, self.price_config.spread_min
-            )
+    Each pair is read consistently, without locks, so any number of
+    processes serve the same prices while only the writer updates them.
+    """
 
-        self.prices_dict[(asset.name, asset.market)] = asset
+    def __init__(self, shared_prices: SharedPrices):
+        self.price_config = None
+        self.shared_prices = shared_prices
+        self._set_universe(shared_prices.assets, shared_prices.markets)
+        self._use_shared_prices()
 
-        return asset
-    
 
-    def get_curr_asset_price(self, asset: schemas.Asset) -> schemas.AssetPrice:
-        asset_name = asset.name
-        market = asset.market
+    def update_prices(self, pairs_ids: np.ndarray) -> None:
+        raise RuntimeError("Shared prices are read only, they are updated by price engine")
 
-        asset_price = self.prices_dict.get(tuple([asset_name, market]), None)
 
-        return asset_price
-    
+    def get_asset_price(self, pair_id: int) -> schemas.AssetPrice:
+        asset_idx, market_idx = divmod(int(pair_id), len(self.markets))
+        price, spread, version, generated_at = self.shared_prices.read(int(pair_id))
+        return schemas.AssetPrice(
+            name=self.assets[asset_idx],
+            market=self.markets[market_idx],
+            price=price,
+            spread=spread,
+            version=version,
+            generated_at=generated_at
+        )
 
-    def get_assets_list(self):
-        return self.price_config.assets
-    
 
-    def get_markets_list(self):
-        return self.price_config.markets
\ No newline at end of file
+    def get_prices_records(self, pairs_ids: np.ndarray) -> np.ndarray:
+        return self.shared_prices.read_many(pairs_ids)
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Callable, List, Optional, Set
+
+from ..utils import metrics, schemas
+from ..utils.logger import get_logger
+from ..utils.utils import get_shard_id
+
+
+logger = get_logger(__name__)
+
+
+class PriceSubscription:
+    """
+    Subscription to price updates, optionally filtered by assets and markets,
+    and by shard of assets, which follows assets added at runtime.
+
+    Updates are kept in a bounded queue. If subscriber does not keep up and
+    the queue is full, further updates are dropped and subscription is marked
+    as overflowed, so the subscriber has to resync from a prices snapshot.
+    """
+
+    def __init__(self,
+                 assets: Optional[List[str]] = None,
+                 markets: Optional[List[str]] = None,
+                 queue_size: int = 1000,
+                 shard: Optional[int] = None,
+                 shards: int = 1):
+        self.assets = set(assets) if assets else None
+        self.markets = set(markets) if markets else None
+        self.shard = shard
+        self.shards = shards
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        self.dropped = 0
+
+
+    def matches(self, asset_price: schemas.AssetPrice) -> bool:
+        return ((self.assets is None or asset_price.name in self.assets)
+                and (self.markets is None or asset_price.market in self.markets)
+                and (self.shard is None
+                     or get_shard_id(asset_price.name, self.shards) == self.shard))
+
+
+    def put(self, message: bytes) -> None:
+        """Non blocking put. Marks subscription as overflowed if queue is full"""
+        if self.overflowed:
+            self.dropped += 1
+            metrics.stream_dropped_updates_total.inc()
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.dropped += 1
+            metrics.stream_dropped_updates_total.inc()
+
+
+    def reset(self) -> None:
+        """Drops all pending updates. To be called right before subscriber
+        resyncs from a snapshot"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.overflowed = False
+
+
+class PriceBroadcaster:
+    """
+    Fans out price updates to subscribers.
+
+    Publishing never blocks: slow subscribers lose updates and resync from a
+    snapshot instead of delaying prices update loops.
+    """
+
+    def __init__(self, encode: Callable[[schemas.AssetPrice], bytes],
+                 queue_size: int = 1000):
+        self.encode = encode
+        self.queue_size = queue_size
+        self.subscriptions: Set[PriceSubscription] = set()
+
+
+    def subscribe(self,
+                  assets: Optional[List[str]] = None,
+                  markets: Optional[List[str]] = None,
+                  shard: Optional[int] = None,
+                  shards: int = 1
+                  ) -> PriceSubscription:
+        subscription = PriceSubscription(assets, markets, self.queue_size, shard, shards)
+        self.subscriptions.add(subscription)
+        logger.info("New prices subscription. Total: %d", len(self.subscriptions))
+        return subscription
+
+
+    def unsubscribe(self, subscription: PriceSubscription) -> None:
+        self.subscriptions.discard(subscription)
+        logger.info("Prices subscription closed. Updates dropped: %d. Total: %d",
+                    subscription.dropped, len(self.subscriptions))
+
+
+    def publish(self, asset_price: schemas.AssetPrice) -> None:
+        """Sends price update to all matching subscribers. Update is encoded
+        once, only if there is at least one matching subscriber"""
+        message = None
+        for subscription in self.subscriptions:
+            if not subscription.matches(asset_price):
+                continue
+            if message is None:
+                message = self.encode(asset_price)
+            subscription.put(message)
@@ -0,0 +1,78 @@
+import secrets
+from typing import Dict, Iterable, Mapping, Optional
+
+from ..utils import schemas
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class QuotesCache:
+    """
+    Cache of JSON encoded price quotes, keyed by pair id.
+
+    A quote is encoded once, on the first request after a price update, and
+    then served as is until the price changes again. So a quote id identifies
+    a specific price of a pair rather than a specific response.
+
+    ETag of a quote is derived from pair's price version. It is prefixed with
+    a random epoch, so ETags issued before a restart never match again.
+    Processes serving the same shared prices share the epoch of their writer.
+
+    If prices are updated by another process, nobody invalidates the cache,
+    so with `check_versions` a cached quote is served only while its version
+    is still the current one.
+    """
+
+    def __init__(self, assets_manager, check_versions: bool = False,
+                 epoch: Optional[str] = None):
+        self.assets_manager = assets_manager
+        self.entries: Dict[int, bytes] = {}
+        self.check_versions = check_versions
+        # versions of cached quotes, if checked
+        self.entries_versions: Dict[int, int] = {}
+        self.epoch = epoch or secrets.token_hex(4)
+
+
+    def _encode(self, pair_id: int) -> bytes:
+        asset_price = self.assets_manager.get_asset_price(pair_id)
+        if self.check_versions:
+            self.entries_versions[pair_id] = asset_price.version
+        return schemas.PriceQuoteOut(**asset_price.model_dump()).model_dump_json().encode()
+
+
+    def get(self, pair_id: int) -> bytes:
+        """Encoded quote of a pair. Encodes and caches it if needed"""
+        entry = self.entries.get(pair_id, None)
+        if entry is None or (self.check_versions and self.entries_versions[pair_id]
+                             != self.assets_manager.versions[pair_id]):
+            entry = self._encode(pair_id)
+            self.entries[pair_id] = entry
+        return entry
+
+
+    def get_etag(self, pair_id: int) -> str:
+        return f'"{self.epoch}-{self.assets_manager.versions[pair_id]}"'
+
+
+    def get_many(self, pairs_ids: Iterable[int]) -> bytes:
+        """Encoded JSON array of quotes of provided pairs"""
+        return b"[" + b",".join(self.get(int(pair_id)) for pair_id in pairs_ids) + b"]"
+
+
+    def invalidate(self, pairs_ids: Iterable[int]) -> None:
+        """To be called after prices of provided pairs are updated"""
+        entries = self.entries
+        for pair_id in pairs_ids:
+            entries.pop(int(pair_id), None)
+
+
+    def remap(self, pairs_map: Mapping[int, int]) -> None:
+        """To be called after pairs got new ids: cached quotes of pairs in
+        `pairs_map` are kept under their new ids, others are dropped"""
+        self.entries = {pairs_map[pair_id]: entry for pair_id, entry in self.entries.items()
+                        if pair_id in pairs_map}
+        self.entries_versions = {pairs_map[pair_id]: version
+                                 for pair_id, version in self.entries_versions.items()
+                                 if pair_id in pairs_map}
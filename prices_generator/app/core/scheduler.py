@@ -0,0 +1,92 @@
+import asyncio
+import heapq
+import random
+from typing import Callable, Hashable, List, Mapping, Tuple
+
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class PriceUpdateScheduler:
+    """
+    Schedules price updates of all asset and market pairs from a single task.
+
+    Next update time of each pair is kept in a heap. Scheduler wakes up at
+    most once per tick and updates all pairs which are due in batches, then
+    reschedules each of them after a random interval within configured range.
+    Batches are limited in size, so the event loop is not blocked for long
+    when many pairs are due at once (e.g. on start).
+    """
+
+    def __init__(self,
+                 update_batch: Callable[[List[Hashable]], None],
+                 interval_min_s: float,
+                 interval_max_s: float,
+                 tick_s: float = 0.1,
+                 max_batch_size: int = 500):
+        self.update_batch = update_batch
+        self.interval_min_s = interval_min_s
+        self.interval_max_s = interval_max_s
+        self.tick_s = tick_s
+        self.max_batch_size = max_batch_size
+        self.heap: List[Tuple[float, Hashable]] = []
+
+
+    def _get_interval(self) -> float:
+        """Random interval, rounded to ticks"""
+        interval = random.uniform(self.interval_min_s, self.interval_max_s)
+        return round(interval / self.tick_s) * self.tick_s
+
+
+    def schedule(self, key: Hashable, due_time: float) -> None:
+        heapq.heappush(self.heap, (due_time, key))
+
+
+    def schedule_all(self, keys: List[Hashable], due_time: float) -> None:
+        """Schedules many pairs at once. Cheaper than separate `schedule` calls"""
+        self.heap.extend((due_time, key) for key in keys)
+        heapq.heapify(self.heap)
+
+
+    def remap(self, keys_map: Mapping[Hashable, Hashable]) -> None:
+        """Replaces keys, keeping their due times. Keys missing in `keys_map`
+        are unscheduled"""
+        self.heap = [(due_time, keys_map[key]) for due_time, key in self.heap
+                     if key in keys_map]
+        heapq.heapify(self.heap)
+
+
+    def pop_due(self, now: float) -> List[Hashable]:
+        due = []
+        while (self.heap and self.heap[0][0] <= now 
+               and len(due) < self.max_batch_size):
+            due.append(heapq.heappop(self.heap)[1])
+        return due
+
+
+    async def run(self) -> None:
+        """Infinite scheduling loop"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            now = loop.time()
+            due = self.pop_due(now)
+            if due:
+                try:
+                    self.update_batch(due)
+                except Exception as e:
+                    logger.error("Prices update of %d pairs failed: %r", len(due), e)
+                for key in due:
+                    heapq.heappush(self.heap, (now + self._get_interval(), key))
+                if len(due) == self.max_batch_size:
+                    # more pairs may be due, let other tasks run first
+                    await asyncio.sleep(0)
+                    continue
+
+            if not self.heap:
+                await asyncio.sleep(self.tick_s)
+                continue
+            # sleep until the next pair is due, but not less than a tick
+            await asyncio.sleep(max(self.heap[0][0] - loop.time(), self.tick_s))
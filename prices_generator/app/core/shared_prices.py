@@ -0,0 +1,196 @@
+import json
+from multiprocessing import resource_tracker, shared_memory
+import secrets
+import struct
+import time
+from typing import List, Tuple
+
+import numpy as np
+
+from ..utils.logger import get_logger
+
+
+logger = get_logger(__name__)
+
+
+SEGMENT_MAGIC = b"ARBPRICE"
+# magic, layout version, pairs count, size of encoded universe
+SEGMENT_HEADER = struct.Struct("<8sIQI")
+LAYOUT_VERSION = 1
+RECORDS_ALIGNMENT = 64
+# `seq` is odd while the pair is being written
+PAIR_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("price", "<f8"),
+    ("spread", "<f8"),
+    ("version", "<i8"),
+    ("generated_at", "<f8"),
+])
+
+
+class SharedPricesError(Exception):
+    pass
+
+
+class SharedPrices:
+    """
+    Prices of all pairs in a named shared memory segment, written by a single
+    price engine process and read lock-free by any number of processes.
+
+    Segment starts with a header and the universe (assets and markets in
+    pair id order, and an epoch of the writer's prices versions, as JSON),
+    followed by a fixed size record per pair. The
+    magic is written last, once initial prices are in place, so readers never
+    attach to a half initialized segment.
+
+    Each record is guarded by a sequence lock: writer makes `seq` odd, writes
+    the fields, then makes it even again. Reader copies the record and
+    retries if `seq` was odd or changed meanwhile, so it never sees a price
+    of one update with a spread or version of another. Fields are 8 byte
+    aligned, so a single field, e.g. `version`, is always read whole. Stores
+    and loads are relied on to become visible in program order, as on x86.
+    """
+
+    def __init__(self, segment: shared_memory.SharedMemory,
+                 assets: List[str], markets: List[str], epoch: str,
+                 records_offset: int, owner: bool = False):
+        self.segment = segment
+        self.name = segment.name
+        self.assets = assets
+        self.markets = markets
+        # versions restart with a new writer, so readers tag them with it
+        self.epoch = epoch
+        self.pairs_count = len(assets) * len(markets)
+        self.records = np.ndarray((self.pairs_count,), dtype=PAIR_DTYPE,
+                                  buffer=segment.buf, offset=records_offset)
+        self.seqs = self.records["seq"]
+        self.owner = owner
+
+
+    @staticmethod
+    def _get_layout(universe: bytes, pairs_count: int) -> Tuple[int, int]:
+        """Offset of records and total size of the segment"""
+        records_offset = SEGMENT_HEADER.size + len(universe)
+        records_offset += -records_offset % RECORDS_ALIGNMENT
+        return records_offset, records_offset + pairs_count * PAIR_DTYPE.itemsize
+
+
+    @classmethod
+    def create(cls, name: str, assets: List[str], markets: List[str]) -> "SharedPrices":
+        """Creates the segment for a writer. A segment left by a previous
+        writer which did not exit cleanly is replaced"""
+        epoch = secrets.token_hex(4)
+        universe = json.dumps({"assets": assets, "markets": markets, "epoch": epoch}).encode()
+        pairs_count = len(assets) * len(markets)
+        records_offset, size = cls._get_layout(universe, pairs_count)
+        try:
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            logger.warning("Replacing existing shared prices segment %s", name)
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            segment = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        segment.buf[SEGMENT_HEADER.size:SEGMENT_HEADER.size + len(universe)] = universe
+        struct.pack_into("<IQI", segment.buf, len(SEGMENT_MAGIC),
+                         LAYOUT_VERSION, pairs_count, len(universe))
+        logger.info("Created shared prices segment %s of %d bytes for %d pairs",
+                    name, size, pairs_count)
+        return cls(segment, assets, markets, epoch, records_offset, owner=True)
+
+
+    def publish(self) -> None:
+        """Makes the segment available to readers. To be called by writer
+        once initial prices are written"""
+        self.segment.buf[:len(SEGMENT_MAGIC)] = SEGMENT_MAGIC
+
+
+    @classmethod
+    def attach(cls, name: str, timeout_s: float = 30.0,
+               poll_interval_s: float = 0.1) -> "SharedPrices":
+        """Attaches a reader to the segment, waiting up to `timeout_s` for
+        the writer to create and publish it"""
+        deadline = time.monotonic() + timeout_s
+        while True:
+            try:
+                segment = _attach_segment(name)
+                magic, layout_version, pairs_count, universe_size = (
+                    SEGMENT_HEADER.unpack_from(segment.buf))
+                if magic == SEGMENT_MAGIC:
+                    break
+                segment.close()
+            except FileNotFoundError:
+                pass
+            if time.monotonic() > deadline:
+                raise SharedPricesError(
+                    f"Shared prices segment {name} is not published within {timeout_s} s")
+            time.sleep(poll_interval_s)
+
+        if layout_version != LAYOUT_VERSION:
+            raise SharedPricesError(f"Unsupported shared prices layout {layout_version}")
+        universe = bytes(segment.buf[SEGMENT_HEADER.size:SEGMENT_HEADER.size + universe_size])
+        universe_data = json.loads(universe)
+        records_offset, _ = cls._get_layout(universe, pairs_count)
+        logger.info("Attached to shared prices segment %s of %d pairs", name, pairs_count)
+        return cls(segment, universe_data["assets"], universe_data["markets"],
+                   universe_data["epoch"], records_offset)
+
+
+    def begin_write(self, pairs_ids: np.ndarray) -> None:
+        self.seqs[pairs_ids] += 1
+
+
+    def end_write(self, pairs_ids: np.ndarray) -> None:
+        self.seqs[pairs_ids] += 1
+
+
+    def read(self, pair_id: int, timeout_s: float = 1.0) -> Tuple[float, float, int, float]:
+        """Consistent (price, spread, version, generated_at) of a pair"""
+        seqs, records = self.seqs, self.records
+        deadline = None
+        while True:
+            seq = seqs[pair_id]
+            record = records[pair_id].item()
+            if not seq & 1 and seqs[pair_id] == seq:
+                return record[1:]
+            if deadline is None:
+                deadline = time.monotonic() + timeout_s
+            elif time.monotonic() > deadline:
+                raise SharedPricesError(f"Pair {pair_id} is being written for too long,"
+                                        f" price engine may have stopped mid-update")
+
+
+    def read_many(self, pairs_ids: np.ndarray, timeout_s: float = 1.0) -> np.ndarray:
+        """Consistent copies of records of pairs. All records are copied at
+        once, those written meanwhile are read again one by one"""
+        seqs = self.seqs[pairs_ids]
+        records = self.records[pairs_ids]
+        torn = ((seqs & 1) != 0) | (self.seqs[pairs_ids] != seqs)
+        for idx in np.flatnonzero(torn):
+            records[idx] = (0,) + self.read(int(pairs_ids[idx]), timeout_s)
+        return records
+
+
+    def unlink(self) -> None:
+        """Removes the segment, to be called by writer on exit. Attached
+        readers keep their mapping until they exit"""
+        if self.owner:
+            self.segment.unlink()
+
+
+def _attach_segment(name: str) -> shared_memory.SharedMemory:
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+    # before Python 3.13 attached segments are tracked as well, and unlinked
+    # when the reader exits, taking them away from all others. Unregistering
+    # afterwards would drop writer's registration if they share the tracker,
+    # e.g. in forked processes, so registration is skipped instead
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
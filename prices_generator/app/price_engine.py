@@ -0,0 +1,61 @@
+"""Price engine of shared prices mode.
+
+Generates and updates prices of all pairs, the same way the API process does
+on its own, but writes them to a shared memory segment named
+`SHARED_PRICES_NAME`. Any number of API processes started with the same
+`SHARED_PRICES_NAME` serve these prices read-only, so they all return the
+same price for a pair:
+
+    SHARED_PRICES_NAME=prices python -m app.price_engine
+    SHARED_PRICES_NAME=prices uvicorn app.app:app --workers 4
+
+The segment is removed when the engine stops.
+"""
+import asyncio
+from decouple import config
+import signal
+import time
+
+from .core.assets_manager import AssetsManager
+from .core.scheduler import PriceUpdateScheduler
+from .utils.logger import get_logger
+from .utils.utils import get_config_filepath
+
+
+logger = get_logger(__name__)
+shared_prices_name = config('SHARED_PRICES_NAME', default="prices")
+
+
+async def main():
+    assets_manager = AssetsManager(get_config_filepath(), shared_prices_name=shared_prices_name)
+    price_config = assets_manager.price_config
+
+    def update_prices(pairs_ids):
+        started = time.perf_counter()
+        assets_manager.update_prices(pairs_ids)
+        logger.debug("Prices of %d pairs are updated in %.2f ms",
+                     len(pairs_ids), (time.perf_counter() - started) * 1000)
+
+    price_scheduler = PriceUpdateScheduler(
+        update_batch=update_prices,
+        interval_min_s=price_config.price_update_interval_min,
+        interval_max_s=price_config.price_update_interval_max)
+    loop = asyncio.get_running_loop()
+    price_scheduler.schedule_all(range(assets_manager.pairs_count), due_time=loop.time())
+
+    task = asyncio.current_task()
+    loop.add_signal_handler(signal.SIGTERM, task.cancel)
+    logger.info("Price engine is updating %d pairs in shared memory segment %s",
+                assets_manager.pairs_count, shared_prices_name)
+    try:
+        await price_scheduler.run()
+    finally:
+        assets_manager.shared_prices.unlink()
+        logger.info("Shared memory segment %s is removed", shared_prices_name)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
@@ -1,21 +1,182 @@
+"""Logging of the service.
+
+Loggers never write to the output themselves: records are put into a
+bounded queue and written by a single background thread, so a slow stdout
+or disk never blocks the event loop. Records are formatted by the writer
+thread, and hot paths pass arguments instead of formatted strings, so
+messages below the logging level cost only a level check. If the writer
+falls behind and the queue is full, records are dropped and counted.
+
+Configuration:
+- `LOGGING_LEVEL`
+- `LOGGING_FORMAT`: `text` (default) or `json`, one object per line. Extra
+  fields passed with `extra={...}` are included in JSON output.
+- `LOGGING_SAMPLE_RATES`: fractions of records to keep for high frequency
+  loggers, e.g. `app.utils.fetch_requests=0.01,app.core=0.1`. Matched by
+  logger name prefix, the longest prefix wins. Only records up to
+  `LOGGING_SAMPLE_MAX_LEVEL` (default INFO) are sampled.
+"""
 from decouple import config
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+from typing import Dict, Optional
 
 
 logging_level = config('LOGGING_LEVEL')
+logging_format = config('LOGGING_FORMAT', default="text")
+logging_queue_size = config('LOGGING_QUEUE_SIZE', default=10000, cast=int)
+logging_sample_rates = config('LOGGING_SAMPLE_RATES', default="")
+logging_sample_max_level = config('LOGGING_SAMPLE_MAX_LEVEL', default="INFO")
+
+TEXT_FORMAT = '%(levelname)-8s - %(asctime)s - %(name)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+# attributes of any record, the rest are extra fields
+RECORD_ATTRIBUTES = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single line JSON object"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps every n-th record of a logger, up to `max_level`. Records of
+    higher levels always pass"""
+
+    def __init__(self, rate: float, max_level: int):
+        super().__init__()
+        self.interval = max(round(1 / rate), 1) if rate > 0 else 0
+        self.max_level = max_level
+        # records of the logger since the last kept one
+        self.count = 0
+
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        if not self.interval:
+            return False
+        keep = self.count == 0
+        self.count = (self.count + 1) % self.interval
+        return keep
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records into a bounded queue as they are, without formatting
+    them, and drops them if the queue is full"""
+
+    def __init__(self, records_queue: queue.Queue):
+        super().__init__(records_queue)
+        self.dropped_count = 0
+
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the writer thread is in the same process, so records need not be
+        # formatted for pickling
+        return record
+
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+class BlockingStopQueueListener(logging.handlers.QueueListener):
+    """Waits for space in a full queue to stop, so remaining records are
+    written on exit"""
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def _create_output_handler() -> logging.Handler:
+    handler = logging.StreamHandler()
+    if logging_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+    return handler
+
+
+def _parse_sample_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for item in filter(None, (item.strip() for item in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+_handler = DroppingQueueHandler(queue.Queue(logging_queue_size))
+_listener: Optional[BlockingStopQueueListener] = None
+_sample_rates = _parse_sample_rates(logging_sample_rates)
+
+
+def _start_listener() -> None:
+    global _listener
+    _listener = BlockingStopQueueListener(_handler.queue, _create_output_handler())
+    _listener.start()
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_in_child() -> None:
+    """Writer thread does not survive fork, and the queue may be locked by
+    another thread of the parent, so a forked child starts its own"""
+    _handler.queue = queue.Queue(logging_queue_size)
+    if _listener is not None:
+        _start_listener()
+
+
+def _get_sample_rate(name: str) -> Optional[float]:
+    matches = [prefix for prefix in _sample_rates
+               if name == prefix or name.startswith(prefix + ".")]
+    return _sample_rates[max(matches, key=len)] if matches else None
+
+
+def get_records_dropped() -> int:
+    """Log records dropped because the writer thread fell behind"""
+    return _handler.dropped_count
+
 
 def get_logger(name):
     logger = logging.getLogger(name)
 
-    if not logger.hasHandlers():
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging_level)
-        formatter = logging.Formatter(
-            '%(levelname)-8s - %(asctime)s - %(name)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S')
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+    if _listener is None:
+        _start_listener()
+    if _handler not in logger.handlers:
+        logger.addHandler(_handler)
+        rate = _get_sample_rate(name)
+        if rate is not None:
+            logger.addFilter(SamplingFilter(
+                rate, logging.getLevelName(logging_sample_max_level.upper())))
 
     logger.setLevel(logging_level)
 
-    return logger
\ No newline at end of file
+    return logger
+
+
+atexit.register(_stop_listener)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_in_child)
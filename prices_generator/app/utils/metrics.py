@@ -0,0 +1,105 @@
+"""Prometheus metrics of prices generator.
+
+Metrics are kept in a dedicated registry and exposed by `GET /metrics`.
+All metrics are recorded from generator's event loop only, with lock-free
+metric classes shared with analyzer, see `local_metrics`. Counters and
+gauges of existing state are collected on scrape, see `attributes_collector`.
+Each uvicorn worker process has its own registry, so with several workers a
+scrape returns metrics of the process which served it.
+If `METRICS_ENABLED` is false, all metrics are no-ops.
+"""
+from decouple import config
+import time
+from typing import Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest
+
+from local_metrics import AttributesCollector, LocalCounter, LocalHistogram, NoopMetric
+
+from .logger import get_records_dropped
+
+
+metrics_enabled = config('METRICS_ENABLED', default=True, cast=bool)
+registry = CollectorRegistry()
+content_type = CONTENT_TYPE_LATEST
+
+LATENCY_BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                     0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _create(metric_class, *args, **kwargs):
+    if not metrics_enabled:
+        return NoopMetric()
+    metric = metric_class(*args, **kwargs)
+    registry.register(metric)
+    return metric
+
+
+attributes_collector = AttributesCollector()
+if metrics_enabled:
+    registry.register(attributes_collector)
+
+http_request_duration_seconds = _create(
+    LocalHistogram, "generator_http_request_duration_seconds",
+    "Latency of prices requests, until response is sent",
+    labelnames=("path",), buckets=LATENCY_BUCKETS_S)
+http_responses_total = _create(
+    LocalCounter, "generator_http_responses",
+    "Responses to prices requests by status code",
+    labelnames=("path", "status"))
+price_update_batch_duration_seconds = _create(
+    LocalHistogram, "generator_price_update_batch_duration_seconds",
+    "Time to update a batch of due prices, blocking the event loop",
+    buckets=LATENCY_BUCKETS_S)
+price_updates_total = _create(
+    LocalCounter, "generator_price_updates", "Price updates of all pairs")
+universe_changes_total = _create(
+    LocalCounter, "generator_universe_changes", "Runtime changes of assets and markets")
+stream_keepalive_timeouts_total = _create(
+    LocalCounter, "generator_stream_keepalive_timeouts",
+    "Waits for a price update which timed out and sent a keep-alive instead")
+stream_dropped_updates_total = _create(
+    LocalCounter, "generator_stream_dropped_updates",
+    "Price updates dropped because a subscriber did not keep up")
+attributes_collector.add_counter(
+    "generator_log_records_dropped",
+    "Log records dropped because the log writer thread fell behind",
+    get_records_dropped)
+
+
+def get_metrics() -> bytes:
+    return generate_latest(registry)
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware recording latency and status of requests to tracked
+    paths. Requests to other paths are passed through untouched, so long
+    lived streams and scrapes do not skew latencies.
+    """
+
+    def __init__(self, app, paths: Tuple[str, ...]):
+        self.app = app
+        self.paths = frozenset(paths)
+
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        if not metrics_enabled or scope["type"] != "http" or path not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_request_duration_seconds.labels(path).observe(time.perf_counter() - started)
+            http_responses_total.labels(path, status).inc()
@@ -1,6 +1,8 @@
 from pydantic import BaseModel, Field
 from typing import List
-from uuid import UUID, uuid4
+from uuid import UUID
+
+from .utils import new_quote_id
 
 class Asset(BaseModel):
     name: str
@@ -13,11 +15,14 @@ class PriceBase(BaseModel):
 
 
 class AssetPrice(PriceBase, Asset):
-    pass
+    # sequence number of pair's prices, incremented on each update
+    version: int = Field(default=1, ge=1)
+    # unix time of the update
+    generated_at: float = Field(default=0, ge=0)
 
 
 class PriceQuoteOut(AssetPrice):
-    price_quote_id: UUID = Field(default_factory=uuid4)
+    price_quote_id: UUID = Field(default_factory=new_quote_id)
 
 
 class PriceConfig(BaseModel):
@@ -27,4 +32,17 @@ class PriceConfig(BaseModel):
     price_max: float = Field(gt=0)
     spread_min: float = Field(ge=0)
     spread_max: float = Field(gt=0)
-    price_change_max: float = Field(gt=0)
\ No newline at end of file
+    price_change_max: float = Field(gt=0)
+    price_update_interval_min: float = Field(default=3, gt=0)
+    price_update_interval_max: float = Field(default=6, gt=0)
+
+class Universe(BaseModel):
+    assets: List[str]
+    markets: List[str]
+
+
+class UniverseChange(BaseModel):
+    add_assets: List[str] = []
+    remove_assets: List[str] = []
+    add_markets: List[str] = []
+    remove_markets: List[str] = []
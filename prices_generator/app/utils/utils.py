@@ -1,31 +1,85 @@
+from decouple import config
+import itertools
+import numpy as np
 import os
+import secrets
+from uuid import UUID
 import yaml
+import zlib
 from ..utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+# libyaml based loader parses large files, e.g. of 100k+ assets, many times
+# faster than the pure Python one
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 
 def load_yaml_file(file_path: str) -> dict:
     """Reads yaml file."""
     try:
         with open(file_path, 'r') as file:
-            return yaml.safe_load(file)
+            return yaml.load(file, Loader=YamlLoader)
     except FileNotFoundError:
-        logger.error(f"Config file not found: {file_path}")
+        logger.error("Config file not found: %s", file_path)
         raise
     except yaml.YAMLError as e:
-        logger.error(f"Failed to parse YAML file {file_path}: {e}")
+        logger.error("Failed to parse YAML file %s: %s", file_path, e)
         raise
     except Exception as e:
-        logger.error(f"Unexpected error when loading YAML file {file_path}: {e}")
+        logger.error("Unexpected error when loading YAML file %s: %s", file_path, e)
         raise
 
 
+_quote_id_prefix = secrets.randbits(64) << 64
+_quote_id_counter = itertools.count()
+
+
+def new_quote_id() -> UUID:
+    """Cheap unique id: random per process prefix followed by a counter.
+    Avoids reading system randomness for each id, as `uuid4` does."""
+    return UUID(int=_quote_id_prefix | next(_quote_id_counter), version=4)
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """SplitMix64 finalizer: bijective mixing of 64-bit integers"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def counter_uniform(seed: int, keys, counters, low: float = 0.0,
+                    high: float = 1.0) -> np.ndarray:
+    """Counter-based random numbers, uniform in [low, high): the n-th number of
+    stream `key` is a hash of (seed, key, n). So each key, e.g. a pair id, has
+    its own reproducible stream, which does not depend on which other keys
+    are generated, in which order or batches, and any element of it is
+    generated directly in vectorized form"""
+    keys = np.asarray(keys, dtype=np.uint64)
+    counters = np.asarray(counters, dtype=np.uint64)
+    # multiplications wrap around by design
+    with np.errstate(over="ignore"):
+        streams = _mix64(keys * np.uint64(0x9E3779B97F4A7C15) ^ np.uint64(seed))
+        values = _mix64(streams ^ _mix64(counters + np.uint64(0x632BE59BD9B4E019)))
+    # top 53 bits give uniformly spaced doubles in [0, 1)
+    uniform = (values >> np.uint64(11)) * (1.0 / (1 << 53))
+    return low + (high - low) * uniform
+
+
+def get_shard_id(asset: str, shards_count: int) -> int:
+    """Shard of an asset, by the same stable hash analyzer uses to split
+    assets between its worker processes"""
+    return zlib.crc32(asset.encode()) % shards_count
+
+
 def get_config_filepath():
-    """Helper function to get absolute price_config location."""
+    """Helper function to get absolute price_config location. Can be 
+    overridden with PRICE_CONFIG_FILE environment variable."""
     base_dir = os.path.dirname(os.path.abspath(__file__))
     config_filepath = os.path.join(base_dir, 'config', 'price_config.yaml')
-    return config_filepath
+    return config('PRICE_CONFIG_FILE', default=config_filepath)
 
 
 
@@ -0,0 +1,56 @@
+"""Compact binary encoding of price quotes.
+
+Served instead of JSON by `/price` and `/prices` to clients which send
+`Accept: application/x-price-quotes`. Layout, little-endian:
+- header: magic `QTS1`, then numbers of assets, markets and quotes and size
+  of names, as uint32
+- names: UTF-8 names of assets, followed by names of markets, separated by
+  zero bytes. Only assets and markets of included quotes are listed
+- quotes: `QUOTE_DTYPE` records, 40 bytes each, where `asset` and `market`
+  are indices into names
+
+Quote ids are not included. Decoded by analyzer's `utils/wire.py`, the two
+must be kept in sync.
+"""
+import struct
+from typing import List
+
+import numpy as np
+
+
+CONTENT_TYPE = "application/x-price-quotes"
+MAGIC = b"QTS1"
+HEADER = struct.Struct("<4sIIII")
+QUOTE_DTYPE = np.dtype([
+    ("asset", "<u4"),
+    ("market", "<u4"),
+    ("price", "<f8"),
+    ("spread", "<f8"),
+    ("version", "<i8"),
+    ("generated_at", "<f8"),
+])
+
+
+def accepts_binary(accept: str) -> bool:
+    """Whether `Accept` header of a request asks for binary quotes"""
+    return accept is not None and CONTENT_TYPE in accept
+
+
+def encode_quotes(assets: List[str], markets: List[str],
+                  pairs_ids: np.ndarray, records: np.ndarray) -> bytes:
+    """Encodes quotes of pairs from their prices records, see
+    `AssetsManager.get_prices_records`"""
+    pairs_ids = np.asarray(pairs_ids, dtype=np.int64)
+    assets_idx, markets_idx = np.divmod(pairs_ids, len(markets))
+    used_assets, quotes_assets = np.unique(assets_idx, return_inverse=True)
+    used_markets, quotes_markets = np.unique(markets_idx, return_inverse=True)
+    names = "\0".join([assets[idx] for idx in used_assets.tolist()]
+                      + [markets[idx] for idx in used_markets.tolist()]).encode()
+
+    quotes = np.empty(len(pairs_ids), dtype=QUOTE_DTYPE)
+    quotes["asset"] = quotes_assets
+    quotes["market"] = quotes_markets
+    for field in ("price", "spread", "version", "generated_at"):
+        quotes[field] = records[field]
+    return (HEADER.pack(MAGIC, len(used_assets), len(used_markets), len(quotes), len(names))
+            + names + quotes.tobytes())
@@ -0,0 +1,132 @@
+"""Conditional requests of quotes: generator's ETags of `/price`, fetcher's
+cache of not modified quotes and polling interval adapted to price versions."""
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks._loader import load_analyzer_module, load_generator_module
+from benchmarks._universe import write_price_config
+
+
+generator_app = load_generator_module("app")
+fetch_requests = load_analyzer_module("utils.fetch_requests")
+AdaptivePollInterval = load_analyzer_module("core.polling").AdaptivePollInterval
+
+PRICE_PATH = "/price?asset_name=Asset 0&market=Market 1"
+
+
+@pytest.fixture
+def price_config(tmp_path, monkeypatch):
+    # prices are updated once after start, then only by tests
+    monkeypatch.setenv("PRICE_CONFIG_FILE", write_price_config(
+        str(tmp_path), assets_count=2, markets_count=2,
+        price_update_interval_min=1000, price_update_interval_max=2000))
+
+
+def run_with_generator(test):
+    """Runs `test(app, client)` with generator's app started in process"""
+    async def run():
+        app = generator_app.app
+        async with app.router.lifespan_context(app):
+            await asyncio.sleep(0.1)
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                         base_url="http://generator") as client:
+                await test(app, client)
+    asyncio.run(run())
+
+
+def update_price(app) -> None:
+    pair_id = app.state.assets_manager.get_pair_id("Asset 0", "Market 1")
+    generator_app.update_assets_prices(app, [pair_id])
+
+
+def test_price_is_not_modified_until_version_changes(price_config):
+    async def test(app, client):
+        response = await client.get(PRICE_PATH)
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+
+        response = await client.get(PRICE_PATH, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert response.content == b""
+        response = await client.get(PRICE_PATH, headers={"If-None-Match": f'"other", W/{etag}'})
+        assert response.status_code == 304
+
+        update_price(app)
+        response = await client.get(PRICE_PATH, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["version"] == int(etag.strip('"').split("-")[1]) + 1
+
+    run_with_generator(test)
+
+
+def test_fetcher_returns_cached_quote_if_not_modified(price_config):
+    async def test(app, client):
+        price_fetcher = fetch_requests.PriceFetcher(
+            host="generator", port="80", conditional_requests=True,
+            transport=httpx.ASGITransport(app=app))
+        await price_fetcher.start()
+        try:
+            quote = await price_fetcher.fetch_price("Asset 0", "Market 1")
+            assert await price_fetcher.fetch_price("Asset 0", "Market 1") is quote
+            assert price_fetcher.not_modified_count == 1
+
+            update_price(app)
+            updated_quote = await price_fetcher.fetch_price("Asset 0", "Market 1")
+            assert updated_quote.version == quote.version + 1
+            assert price_fetcher.not_modified_count == 1
+
+            # a pair added again is requested unconditionally
+            price_fetcher.forget_pairs([("Asset 0", "Market 1")])
+            assert await price_fetcher.fetch_price("Asset 0", "Market 1") is not updated_quote
+            assert price_fetcher.not_modified_count == 1
+        finally:
+            await price_fetcher.close()
+
+    run_with_generator(test)
+
+
+def test_poll_interval_follows_observed_update_period():
+    interval = AdaptivePollInterval(interval_min_s=0.1, interval_max_s=10, polls_per_update=2)
+    assert interval.observe(1, now=0.0)
+    assert interval.get_interval() == 0.1
+
+    # an update every 2 s, one of them missed between polls
+    assert interval.observe(3, now=4.0)
+    assert interval.get_interval() == 1.0
+    assert not interval.observe(3, now=5.0)
+    assert interval.get_interval() == 1.0
+
+    # smoothed towards the new period
+    assert interval.observe(4, now=8.0)
+    assert interval.get_interval() == pytest.approx((2 + 0.3 * (4 - 2)) / 2)
+
+
+def test_poll_interval_stays_within_bounds():
+    interval = AdaptivePollInterval(interval_min_s=1, interval_max_s=5, polls_per_update=2)
+    interval.observe(1, now=0.0)
+    interval.observe(2, now=100.0)
+    assert interval.get_interval() == 5
+
+    interval = AdaptivePollInterval(interval_min_s=1, interval_max_s=5, polls_per_update=2)
+    interval.observe(1, now=0.0)
+    interval.observe(101, now=1.0)
+    assert interval.get_interval() == 1
+
+
+def test_poll_interval_without_versions_or_after_restart():
+    interval = AdaptivePollInterval(interval_min_s=0.1, interval_max_s=10)
+    assert interval.observe(None, now=0.0)
+    assert interval.observe(None, now=1.0)
+    assert interval.get_interval() == 0.1
+
+    interval.observe(100, now=0.0)
+    interval.observe(102, now=2.0)
+    # a lower version is a change, but not a measurement of the period
+    assert interval.observe(1, now=3.0)
+    assert interval.get_interval() == 0.5
+    assert interval.observe(2, now=7.0)
+    assert interval.get_interval() == pytest.approx((1 + 0.3 * (4 - 1)) / 2)
@@ -0,0 +1,244 @@
+"""Analyzer's arbitrage detector against a brute force model of the book."""
+import asyncio
+import random
+
+import pytest
+
+from benchmarks._loader import load_analyzer_module
+
+
+ArbitrageDetector = load_analyzer_module("core.detector").ArbitrageDetector
+schemas = load_analyzer_module("utils.schemas")
+
+ASSETS = ["Oil", "Corn", "Gold"]
+MARKETS = ["US", "UK", "Asia", "Europe"]
+
+
+def make_detector(**kwargs) -> ArbitrageDetector:
+    kwargs.setdefault("max_quote_age_s", 0)
+    return ArbitrageDetector(assets_list=ASSETS, markets_list=MARKETS,
+                             clock=lambda: 1000.0, **kwargs)
+
+
+def make_quote(asset: str, market: str, price: float = 100.0, spread: float = 1.0,
+               version: int = None, generated_at: float = None
+               ) -> schemas.AssetPriceFromApi:
+    return schemas.AssetPriceFromApi(name=asset, market=market, price=price, spread=spread,
+                                     version=version, generated_at=generated_at)
+
+
+def make_random_quote(rnd: random.Random) -> schemas.AssetPriceFromApi:
+    return make_quote(rnd.choice(ASSETS), rnd.choice(MARKETS),
+                      price=rnd.uniform(90, 110), spread=rnd.uniform(0.1, 5))
+
+
+class BookModel:
+    """Latest buying and selling prices of each quoted pair, searched for
+    the best ones of an asset market by market"""
+
+    def __init__(self):
+        self.prices = {}
+
+    def apply(self, quote: schemas.AssetPriceFromApi) -> None:
+        self.prices[quote.name, quote.market] = (
+            round(quote.price * (1 + quote.spread / 100), 4),
+            round(quote.price * (1 - quote.spread / 100), 4))
+
+    def get_opportunity(self, asset: str):
+        """Returns (market_buy, price_buy, market_sell, price_sell) of the
+        asset's opportunity or None. Ties go to the first market"""
+        best_buy = best_sell = None
+        for market in MARKETS:
+            price_buy, price_sell = self.prices.get((asset, market), (float("inf"), 0.0))
+            if best_buy is None or price_buy < best_buy[1]:
+                best_buy = (market, price_buy)
+            if best_sell is None or price_sell > best_sell[1]:
+                best_sell = (market, price_sell)
+        if best_buy[0] == best_sell[0] or not best_buy[1] < best_sell[1]:
+            return None
+        return best_buy + best_sell
+
+
+def get_opportunity(response: dict):
+    if not response["arbitrage_found"]:
+        return None
+    details, = response["details"]
+    return (details["market_buy"], details["price_buy"],
+            details["market_sell"], details["price_sell"])
+
+
+def test_per_market_book_matches_model():
+    rnd = random.Random(42)
+    detector, model = make_detector(), BookModel()
+    for _ in range(2000):
+        quote = make_random_quote(rnd)
+        response = asyncio.run(detector.process_price(quote))
+        model.apply(quote)
+
+        assert get_opportunity(response) == model.get_opportunity(quote.name)
+        for (asset, market), (price_buy, price_sell) in model.prices.items():
+            asset_idx, market_idx = detector.assets_index[asset], detector.markets_index[market]
+            assert detector.prices_buy[asset_idx, market_idx] == price_buy
+            assert detector.prices_sell[asset_idx, market_idx] == price_sell
+    assert detector.quotes_processed == 2000
+
+
+def test_worsened_best_market_falls_back_to_next_best():
+    detector = make_detector()
+    for market, price in (("US", 100.0), ("UK", 101.0), ("Asia", 104.0), ("Europe", 110.0)):
+        asyncio.run(detector.process_price(make_quote("Oil", market, price=price)))
+    assert get_opportunity(asyncio.run(detector.process_price(
+        make_quote("Oil", "US", price=100.0)))) == ("US", 101.0, "Europe", 108.9)
+
+    # the cheapest market got expensive, the next cheapest one is used
+    response = asyncio.run(detector.process_price(make_quote("Oil", "US", price=120.0)))
+    assert get_opportunity(response) == ("UK", 102.01, "US", 118.8)
+
+    # the best selling market got cheap, the next best one is used
+    response = asyncio.run(detector.process_price(make_quote("Oil", "US", price=100.0)))
+    response = asyncio.run(detector.process_price(make_quote("Oil", "Europe", price=90.0)))
+    assert get_opportunity(response) == ("Europe", 90.9, "Asia", 102.96)
+
+    # no market is better than the worsened one anymore
+    for market in ("UK", "Asia", "Europe"):
+        asyncio.run(detector.process_price(make_quote("Oil", market, price=100.0)))
+    assert get_opportunity(asyncio.run(detector.process_price(
+        make_quote("Oil", "US", price=100.0)))) is None
+
+
+def test_batch_matches_per_quote_processing():
+    rnd = random.Random(42)
+    batch_detector, quote_detector = make_detector(), make_detector()
+    for _ in range(300):
+        batch = [make_random_quote(rnd) for _ in range(rnd.randrange(1, 20))]
+        responses = asyncio.run(batch_detector.process_prices(batch))
+
+        # a batch responds once per affected asset, in order of tracked assets,
+        # as a per-quote check after the asset's last quote of the batch
+        last_responses = {}
+        for quote in batch:
+            last_responses[quote.name] = asyncio.run(quote_detector.process_price(quote))
+        assert responses == [last_responses[asset] for asset in ASSETS
+                             if asset in last_responses]
+        assert (batch_detector.prices_buy == quote_detector.prices_buy).all()
+        assert (batch_detector.prices_sell == quote_detector.prices_sell).all()
+    assert batch_detector.quotes_processed == quote_detector.quotes_processed
+
+
+def apply_one_by_one(detector: ArbitrageDetector, quotes: list) -> None:
+    for quote in quotes:
+        asyncio.run(detector.process_price(quote))
+
+
+def apply_as_batches(detector: ArbitrageDetector, quotes: list) -> None:
+    for quote in quotes:
+        asyncio.run(detector.process_prices([quote]))
+
+
+def get_price(detector: ArbitrageDetector, asset: str = "Oil", market: str = "US") -> float:
+    """Returns price of the pair's applied quote, in the middle of its
+    buying and selling prices, or 0 if none was applied"""
+    asset_idx, market_idx = detector.assets_index[asset], detector.markets_index[market]
+    if not detector.prices_sell[asset_idx, market_idx]:
+        return 0.0
+    return round(float(detector.prices_buy[asset_idx, market_idx]
+                       + detector.prices_sell[asset_idx, market_idx]) / 2, 4)
+
+
+@pytest.mark.parametrize("apply", [apply_one_by_one, apply_as_batches])
+def test_older_quotes_of_pair_are_dropped(apply):
+    detector = make_detector()
+    apply(detector, [make_quote("Oil", "US", price=101.0, version=5, generated_at=50.0),
+                     make_quote("Oil", "US", price=102.0, version=4, generated_at=40.0),
+                     make_quote("Oil", "US", price=103.0, version=5, generated_at=50.0)])
+
+    assert get_price(detector) == 101.0
+    assert detector.quotes_dropped_out_of_order == 2
+    assert detector.quotes_processed == 1
+
+
+@pytest.mark.parametrize("apply", [apply_one_by_one, apply_as_batches])
+def test_lower_version_generated_later_is_applied_after_restart(apply):
+    detector = make_detector()
+    apply(detector, [make_quote("Oil", "US", price=101.0, version=500, generated_at=50.0),
+                     make_quote("Oil", "US", price=102.0, version=1, generated_at=60.0),
+                     make_quote("Oil", "US", price=103.0, version=1, generated_at=55.0)])
+
+    assert get_price(detector) == 102.0
+    assert detector.versions[0, 0] == 1
+    assert detector.generated_at[0, 0] == 60.0
+    # a repeated sequence number generated earlier is still out of order
+    assert detector.quotes_dropped_out_of_order == 1
+
+
+@pytest.mark.parametrize("apply", [apply_one_by_one, apply_as_batches])
+def test_unstamped_quotes_are_always_applied(apply):
+    detector = make_detector(max_quote_age_s=10)
+    apply(detector, [make_quote("Oil", "US", price=101.0, version=5, generated_at=995.0),
+                     make_quote("Oil", "US", price=102.0),
+                     make_quote("Oil", "US", price=103.0)])
+
+    assert get_price(detector) == 103.0
+    # stamps of the last stamped quote are kept
+    assert detector.versions[0, 0] == 5
+    assert detector.generated_at[0, 0] == 995.0
+    assert detector.quotes_dropped_out_of_order == detector.quotes_dropped_stale == 0
+
+
+@pytest.mark.parametrize("apply", [apply_one_by_one, apply_as_batches])
+def test_quotes_older_than_max_age_are_dropped(apply):
+    detector = make_detector(max_quote_age_s=10)
+    apply(detector, [make_quote("Oil", "US", price=101.0, version=1, generated_at=995.0),
+                     make_quote("Oil", "US", price=102.0, version=2, generated_at=985.0),
+                     make_quote("Oil", "UK", price=103.0, version=1, generated_at=980.0)])
+
+    assert get_price(detector) == 101.0
+    assert get_price(detector, market="UK") == 0.0
+    assert detector.quotes_dropped_stale == 2
+    assert detector.quotes_dropped_out_of_order == 0
+
+
+@pytest.mark.parametrize("apply", [apply_one_by_one, apply_as_batches])
+def test_zero_max_age_disables_age_check(apply):
+    detector = make_detector(max_quote_age_s=0)
+    apply(detector, [make_quote("Oil", "US", price=101.0, version=1, generated_at=1.0)])
+
+    assert get_price(detector) == 101.0
+    assert detector.quotes_dropped_stale == 0
+
+
+def test_newest_quote_of_pair_wins_within_batch():
+    detector = make_detector()
+    asyncio.run(detector.process_prices([
+        # by generation time, regardless of position in the batch
+        make_quote("Oil", "US", price=101.0, version=3, generated_at=30.0),
+        make_quote("Oil", "US", price=102.0, version=2, generated_at=20.0),
+        # by sequence number if generated at the same time
+        make_quote("Oil", "UK", price=103.0, version=3, generated_at=30.0),
+        make_quote("Oil", "UK", price=104.0, version=2, generated_at=30.0),
+        # by position if not stamped
+        make_quote("Corn", "US", price=105.0),
+        make_quote("Corn", "US", price=106.0)]))
+
+    assert get_price(detector) == 101.0
+    assert get_price(detector, market="UK") == 103.0
+    assert get_price(detector, asset="Corn") == 106.0
+    assert detector.versions[0, 0] == 3
+    assert detector.generated_at[0, 0] == 30.0
+
+
+def test_batch_drops_quotes_older_than_applied_ones():
+    detector = make_detector(max_quote_age_s=10)
+    asyncio.run(detector.process_price(
+        make_quote("Oil", "US", price=101.0, version=5, generated_at=995.0)))
+    responses = asyncio.run(detector.process_prices([
+        make_quote("Oil", "US", price=102.0, version=4, generated_at=994.0),
+        make_quote("Oil", "UK", price=103.0, version=1, generated_at=980.0),
+        make_quote("Corn", "US", price=104.0, version=1, generated_at=996.0)]))
+
+    assert get_price(detector) == 101.0
+    assert get_price(detector, market="UK") == 0.0
+    assert get_price(detector, asset="Corn") == 104.0
+    # only the asset with an applied quote is checked
+    assert len(responses) == 1
+    assert detector.quotes_dropped_out_of_order == detector.quotes_dropped_stale == 1
@@ -0,0 +1,226 @@
+"""Analyzer's balancing of prices source endpoints: circuit breakers, rate
+limits and retry backoff."""
+import asyncio
+import time
+import types
+
+import httpx
+import pytest
+
+from benchmarks._loader import load_analyzer_module
+
+
+endpoints_module = load_analyzer_module("utils.endpoints")
+EndpointsBalancer = endpoints_module.EndpointsBalancer
+TokenBucket = endpoints_module.TokenBucket
+CircuitOpenError = endpoints_module.CircuitOpenError
+fetch_requests = load_analyzer_module("utils.fetch_requests")
+RetryBackoff = load_analyzer_module("core.polling").RetryBackoff
+
+URLS = ["http://generator_1", "http://generator_2"]
+
+
+class Clock:
+    """Monotonic time of the endpoints module, moved by tests. Starts at
+    real monotonic time, which the fetcher compares ejections with"""
+
+    def __init__(self):
+        self.now = time.monotonic()
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay_s: float) -> None:
+        self.sleeps.append(delay_s)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(endpoints_module, "time", clock)
+    monkeypatch.setattr(endpoints_module, "asyncio", types.SimpleNamespace(sleep=clock.sleep))
+    return clock
+
+
+def get_states(balancer: EndpointsBalancer) -> list:
+    return [endpoint.get_circuit_state(endpoints_module.time.monotonic())
+            for endpoint in balancer.endpoints]
+
+
+def fail(balancer: EndpointsBalancer, endpoint, times: int = 1) -> None:
+    for _ in range(times):
+        balancer.start_request(endpoint)
+        balancer.finish_request(endpoint)
+        balancer.record_failure(endpoint)
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    balancer = EndpointsBalancer(URLS, eject_after_failures=3, eject_s=1.0, eject_max_s=5.0)
+    first, second = balancer.endpoints
+    fail(balancer, first, times=2)
+    balancer.record_success(first, 0.01)
+    fail(balancer, first, times=2)
+    assert get_states(balancer) == ["closed", "closed"]
+
+    fail(balancer, first)
+    assert get_states(balancer) == ["open", "closed"]
+    assert all(balancer.choose() is second for _ in range(10))
+    # requests sent before the ejection do not extend it
+    fail(balancer, first)
+    assert first.ejected_until == clock.now + 1.0
+    assert balancer.ejections_count == 1
+
+    fail(balancer, second, times=3)
+    assert balancer.choose() is None
+
+
+def test_half_open_circuit_lets_single_probe_through(clock):
+    balancer = EndpointsBalancer(URLS[:1], eject_after_failures=1, eject_s=1.0, eject_max_s=3.0)
+    endpoint, = balancer.endpoints
+    fail(balancer, endpoint)
+    clock.now += 1.0
+    assert get_states(balancer) == ["half_open"]
+
+    probe = balancer.choose()
+    assert probe is endpoint
+    balancer.start_request(probe)
+    assert balancer.choose() is None
+    balancer.finish_request(probe)
+    balancer.record_success(probe, 0.01)
+    assert get_states(balancer) == ["closed"]
+
+    # failure of a request of closed circuit is tolerated again
+    balancer.eject_after_failures = 2
+    fail(balancer, endpoint)
+    assert get_states(balancer) == ["closed"]
+
+
+def test_failed_probe_reopens_circuit_for_longer(clock):
+    balancer = EndpointsBalancer(URLS[:1], eject_after_failures=3, eject_s=1.0, eject_max_s=3.0)
+    endpoint, = balancer.endpoints
+    fail(balancer, endpoint, times=3)
+
+    for expected_s in (2.0, 3.0, 3.0):
+        clock.now = endpoint.ejected_until
+        assert get_states(balancer) == ["half_open"]
+        # a probe has no second chance
+        fail(balancer, endpoint)
+        assert get_states(balancer) == ["open"]
+        assert endpoint.ejected_until == clock.now + expected_s
+
+    clock.now = endpoint.ejected_until
+    balancer.record_success(endpoint, 0.01)
+    fail(balancer, endpoint, times=3)
+    assert endpoint.ejected_until == clock.now + 1.0
+
+
+def make_fetcher(handler, **kwargs) -> "fetch_requests.PriceFetcher":
+    return fetch_requests.PriceFetcher(
+        endpoints=URLS[:1], transport=httpx.MockTransport(handler), **kwargs)
+
+
+def test_requests_fail_fast_while_all_circuits_are_open(clock):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(503)
+
+    async def run():
+        price_fetcher = make_fetcher(handler)
+        for _ in range(price_fetcher.balancer.eject_after_failures):
+            response = await price_fetcher._get("/prices")
+            assert response.status_code == 503
+        with pytest.raises(CircuitOpenError):
+            await price_fetcher._get("/prices")
+        assert await price_fetcher.fetch_price("Oil", "US") is None
+        await price_fetcher.close()
+        return price_fetcher
+
+    price_fetcher = asyncio.run(run())
+    assert len(requests) == price_fetcher.balancer.eject_after_failures
+
+
+def test_request_waiting_for_slot_is_not_sent_to_endpoint_ejected_meanwhile(clock):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json=[])
+
+    async def run():
+        price_fetcher = make_fetcher(handler)
+        endpoint, = price_fetcher.balancer.endpoints
+        # the only slot is taken
+        price_fetcher.concurrency_limit = asyncio.Semaphore(1)
+        await price_fetcher.concurrency_limit.acquire()
+        request = asyncio.create_task(price_fetcher._get("/prices"))
+        await asyncio.sleep(0)
+        assert price_fetcher.requests_waiting == 1
+
+        price_fetcher.balancer._eject(endpoint)
+        price_fetcher.concurrency_limit.release()
+        with pytest.raises(CircuitOpenError):
+            await request
+        assert price_fetcher.requests_active == 0
+        await price_fetcher.close()
+
+    asyncio.run(run())
+    assert requests == []
+
+
+def test_token_bucket_allows_bursts_and_refills_at_rate(clock):
+    bucket = TokenBucket(rate_per_s=10, burst=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+    clock.now += 0.15
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+    # never refilled above the burst
+    clock.now += 100
+    assert bucket.get_available() == 3
+
+
+def test_token_bucket_waiters_are_served_in_order(clock):
+    bucket = TokenBucket(rate_per_s=10, burst=1)
+
+    async def acquire_all():
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(acquire_all())
+    # tokens are reserved below zero, each waiter waits for its own one
+    assert clock.sleeps == pytest.approx([0.1, 0.2, 0.3])
+    assert bucket.get_available() == pytest.approx(-3)
+
+
+def test_retry_backoff_grows_exponentially_up_to_max():
+    backoff = RetryBackoff(delay_s=1.0, delay_max_s=5.0)
+    for delay_s in (1.0, 2.0, 4.0, 5.0, 5.0):
+        assert delay_s / 2 <= backoff.get_delay() <= delay_s
+
+    backoff.reset()
+    assert 0.5 <= backoff.get_delay() <= 1.0
+    # no overflow after a long outage
+    backoff.failures = 10000
+    assert 2.5 <= backoff.get_delay() <= 5.0
+
+
+def test_stream_connection_closes_circuit_without_latency_sample(clock):
+    def handler(request):
+        return httpx.Response(200, content=b"event: snapshot\ndata: []\n\n")
+
+    async def run():
+        price_fetcher = make_fetcher(handler)
+        endpoint, = price_fetcher.balancer.endpoints
+        fail(price_fetcher.balancer, endpoint, times=2)
+        batches = [batch async for batch in price_fetcher.stream_prices()]
+        await price_fetcher.close()
+        return price_fetcher.balancer, endpoint, batches
+
+    balancer, endpoint, batches = asyncio.run(run())
+    assert batches == [[]]
+    assert endpoint.consecutive_failures == 0
+    assert endpoint.latency_s is None
+    assert len(balancer.latencies) == 0
@@ -0,0 +1,95 @@
+"""Analyzer's live ranking of opportunities against brute force sorting."""
+import random
+
+from benchmarks._loader import load_analyzer_module
+
+
+opportunities_module = load_analyzer_module("core.opportunities")
+IndexedHeap = opportunities_module.IndexedHeap
+OpportunityIndex = opportunities_module.OpportunityIndex
+
+
+def test_indexed_heap_matches_sorting_under_random_updates():
+    rnd = random.Random(42)
+    heap, priorities = IndexedHeap(), {}
+    for _ in range(5000):
+        key = rnd.randrange(200)
+        if key in priorities and rnd.random() < 0.3:
+            heap.remove(key)
+            del priorities[key]
+        else:
+            priorities[key] = rnd.uniform(-100, 100)
+            heap.set(key, priorities[key])
+
+        expected = sorted((priority, key) for key, priority in priorities.items())
+        assert len(heap) == len(priorities)
+        assert all(heap.positions[key] == position
+                   for position, (_, key) in enumerate(heap.entries))
+        count = rnd.randrange(1, 20)
+        assert ([priority for priority, _ in heap.get_smallest(count)]
+                == [priority for priority, _ in expected[:count]])
+
+    popped = [heap.pop()[0] for _ in range(len(heap))]
+    assert popped == sorted(priorities.values())
+
+
+def make_details(asset: str, market_buy: str, market_sell: str,
+                 margin: float, detected_at: float) -> dict:
+    return {"asset": asset, "market_buy": market_buy, "market_sell": market_sell,
+            "price_buy": 100.0, "price_sell": 100.0 + margin, "margin": margin,
+            "detected_at": detected_at}
+
+
+def test_opportunity_index_top_matches_sorting_with_expiry():
+    rnd = random.Random(7)
+    now = 0.0
+    index = OpportunityIndex(ttl_s=5.0, clock=lambda: now)
+    assets = [f"Asset {i}" for i in range(30)]
+    markets = ["US", "UK", "EU", "Asia"]
+    # what brute force expects: opportunity and its expiry by key
+    expected = {}
+    for _ in range(3000):
+        now += rnd.uniform(0, 0.05)
+        asset = rnd.choice(assets)
+        details = None
+        if rnd.random() < 0.7:
+            market_buy, market_sell = rnd.sample(markets, 2)
+            details = make_details(asset, market_buy, market_sell,
+                                   rnd.uniform(0.1, 50), now)
+        # a check of all routes of the asset replaces all its opportunities
+        expected = {key: value for key, value in expected.items() if key[0] != asset}
+        if details is not None:
+            key = (asset, details["market_buy"], details["market_sell"])
+            expected[key] = (details["margin"], now + index.ttl_s)
+        index.update(asset, details, now=now)
+
+        expected = {key: value for key, value in expected.items() if value[1] > now}
+        count = rnd.randrange(1, 10)
+        top = index.get_top(count)
+        assert len(index) == len(expected)
+        assert ([opportunity["margin"] for opportunity in top]
+                == sorted((margin for margin, _ in expected.values()), reverse=True)[:count])
+
+
+def test_opportunity_index_keeps_first_detection_of_refreshed_opportunity():
+    index = OpportunityIndex(ttl_s=5.0, clock=lambda: 0.0)
+    index.update("Oil", make_details("Oil", "US", "UK", 2.0, detected_at=0.0), now=0.0)
+    index.update("Oil", make_details("Oil", "US", "UK", 3.0, detected_at=4.0), now=4.0)
+    assert index.expire(now=8.0) == 0
+
+    opportunity, = index.get_top(1)
+    assert opportunity["first_detected_at"] == 0.0
+    assert opportunity["margin"] == 3.0
+    assert index.expire(now=9.0) == 1
+    assert len(index) == 0
+
+
+def test_opportunity_index_discards_untracked_assets_and_markets():
+    index = OpportunityIndex(ttl_s=0)
+    index.update("Oil", make_details("Oil", "US", "UK", 2.0, 0.0), now=0.0)
+    index.update("Corn", make_details("Corn", "EU", "US", 1.0, 0.0), now=0.0)
+    index.update("Gold", make_details("Gold", "EU", "Asia", 3.0, 0.0), now=0.0)
+
+    index.discard(assets=["Oil"], markets=["Asia"])
+    assert list(index.opportunities) == [("Corn", "EU", "US")]
+    assert len(index.by_margin) == 1
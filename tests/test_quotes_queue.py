@@ -0,0 +1,55 @@
+"""Analyzer's queue of quotes waiting for detection."""
+import asyncio
+
+from benchmarks._loader import load_analyzer_module
+
+
+CoalescingQueue = load_analyzer_module("core.quotes_queue").CoalescingQueue
+schemas = load_analyzer_module("utils.schemas")
+
+
+def make_quote(asset: str, market: str, price: float = 100.0) -> schemas.AssetPriceFromApi:
+    return schemas.AssetPriceFromApi(name=asset, market=market, price=price, spread=1.0)
+
+
+def get_pairs(queue: CoalescingQueue) -> list:
+    quotes = asyncio.run(queue.get_many(len(queue)))
+    return [(quote.name, quote.market, quote.price) for quote in quotes]
+
+
+def test_queue_keeps_latest_quote_of_pair_in_its_place():
+    queue = CoalescingQueue(capacity=10)
+    queue.put_many([make_quote("Oil", "US"), make_quote("Corn", "US"),
+                    make_quote("Oil", "US", price=101.0)])
+
+    assert get_pairs(queue) == [("Oil", "US", 101.0), ("Corn", "US", 100.0)]
+    assert queue.coalesced_count == 1
+
+
+def test_full_queue_drops_oldest_pair():
+    queue = CoalescingQueue(capacity=2)
+    queue.put_many([make_quote("Oil", "US"), make_quote("Corn", "US"), make_quote("Gold", "US")])
+
+    assert get_pairs(queue) == [("Corn", "US", 100.0), ("Gold", "US", 100.0)]
+    assert queue.dropped_count == 1
+
+
+def test_discard_drops_quotes_of_assets_and_markets():
+    queue = CoalescingQueue(capacity=10)
+    queue.put_many([make_quote(asset, market) for asset in ("Oil", "Corn", "Gold")
+                    for market in ("US", "UK")])
+
+    queue.discard(assets=["Oil"], markets=["UK"])
+    assert get_pairs(queue) == [("Corn", "US", 100.0), ("Gold", "US", 100.0)]
+
+
+def test_discard_keeps_order_of_other_pairs_and_nothing_by_default():
+    queue = CoalescingQueue(capacity=10)
+    queue.put_many([make_quote("Oil", "US"), make_quote("Corn", "US"), make_quote("Gold", "US")])
+
+    queue.discard()
+    assert len(queue) == 3
+    queue.discard(assets=["Corn"])
+    queue.put(make_quote("Corn", "US", price=101.0))
+    assert get_pairs(queue) == [("Oil", "US", 100.0), ("Gold", "US", 100.0),
+                                ("Corn", "US", 101.0)]
@@ -0,0 +1,68 @@
+"""Analyzer's quotes recording: quotes recorded on the event loop are written
+off it and read back in order."""
+import asyncio
+import threading
+
+from benchmarks._loader import load_analyzer_module
+
+
+recording_module = load_analyzer_module("core.recording")
+schemas = load_analyzer_module("utils.schemas")
+
+
+def make_quote(asset: str, market: str, price: float) -> schemas.AssetPriceFromApi:
+    return schemas.AssetPriceFromApi(name=asset, market=market, price=price, spread=1.0)
+
+
+def read_back(path: str) -> list:
+    with recording_module.QuotesRecording(path) as recording:
+        return [(recording.symbols[record["asset_id"]], recording.symbols[record["market_id"]],
+                 float(record["price"]))
+                for batch in recording.iter_batches() for record in batch]
+
+
+def test_running_recorder_writes_chunks_off_event_loop(tmp_path):
+    path = str(tmp_path / "quotes.bin")
+    recorder = recording_module.QuotesRecorder(path, flush_size=10, flush_interval_s=0.01)
+    writers = set()
+    write = recorder.file.write
+
+    def write_from_thread(data):
+        writers.add(threading.current_thread())
+        return write(data)
+
+    recorder.file.write = write_from_thread
+    expected = []
+
+    async def run():
+        task = asyncio.create_task(recorder.run())
+        await asyncio.sleep(0)
+        for i in range(25):
+            asset = "Oil" if i % 2 else f"Asset {i // 10}"
+            recorder.record([make_quote(asset, "US", price=100.0 + i)])
+            expected.append((asset, "US", 100.0 + i))
+            await asyncio.sleep(0)
+        # the last partial chunk is written after flush interval
+        await asyncio.sleep(0.1)
+        assert recorder.quotes_recorded == 25
+        task.cancel()
+
+    asyncio.run(run())
+    assert writers and threading.main_thread() not in writers
+    recorder.close()
+    assert read_back(path) == expected
+
+
+def test_recorder_without_run_writes_synchronously_and_appends(tmp_path):
+    path = str(tmp_path / "quotes.bin")
+    recorder = recording_module.QuotesRecorder(path, flush_size=2)
+    recorder.record([make_quote("Oil", "US", 100.0), make_quote("Oil", "UK", 101.0)])
+    assert recorder.quotes_recorded == 2
+    recorder.record([make_quote("Corn", "US", 102.0)])
+    recorder.close()
+
+    recorder = recording_module.QuotesRecorder(path)
+    recorder.record([make_quote("Corn", "UK", 103.0)])
+    recorder.close()
+    assert read_back(path) == [("Oil", "US", 100.0), ("Oil", "UK", 101.0),
+                               ("Corn", "US", 102.0), ("Corn", "UK", 103.0)]
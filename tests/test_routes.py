@@ -0,0 +1,91 @@
+"""Cheapest transfer paths of the routes detection engine."""
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from benchmarks._loader import load_analyzer_module
+
+
+TransferCosts = load_analyzer_module("core.routes").TransferCosts
+
+MARKETS = ["US", "UK", "EU", "Asia"]
+ROUTES = [
+    {"from": "US", "to": "UK", "cost": 1.0},
+    {"from": "UK", "to": "EU", "cost": 1.0},
+    {"from": "US", "to": "EU", "cost": 5.0, "both_ways": False},
+    {"from": "US", "to": "EU", "cost": 0.5, "assets": ["Gold"]},
+    {"from": "EU", "to": "Unknown", "cost": 0.1},
+]
+
+
+def distance(cost: float) -> float:
+    return -math.log1p(-cost / 100)
+
+
+def brute_force_distances(edges: dict) -> np.ndarray:
+    """Cheapest of all simple paths between each pair of markets"""
+    distances = np.full((len(MARKETS), len(MARKETS)), np.inf)
+    np.fill_diagonal(distances, 0.0)
+    for from_idx, to_idx in itertools.permutations(range(len(MARKETS)), 2):
+        others = [idx for idx in range(len(MARKETS)) if idx not in (from_idx, to_idx)]
+        for length in range(len(others) + 1):
+            for via in itertools.permutations(others, length):
+                path = (from_idx, *via, to_idx)
+                hops = [edges.get(hop, np.inf) for hop in zip(path, path[1:])]
+                distances[from_idx, to_idx] = min(distances[from_idx, to_idx], sum(hops))
+    return distances
+
+
+def get_edges(asset: str) -> dict:
+    edges = {}
+    for route in sorted(ROUTES, key=lambda route: "assets" in route):
+        if "assets" in route and asset not in route["assets"]:
+            continue
+        if route["to"] not in MARKETS:
+            continue
+        from_idx, to_idx = MARKETS.index(route["from"]), MARKETS.index(route["to"])
+        edges[(from_idx, to_idx)] = distance(route["cost"])
+        if route.get("both_ways", True):
+            edges[(to_idx, from_idx)] = distance(route["cost"])
+    return edges
+
+
+@pytest.mark.parametrize("asset", ["Oil", "Gold"])
+def test_paths_match_brute_force(asset):
+    transfer_costs = TransferCosts(MARKETS, default_cost=None, routes=ROUTES)
+    distances, _ = transfer_costs.get_paths(asset)
+    np.testing.assert_allclose(distances, brute_force_distances(get_edges(asset)))
+
+
+def test_routes_follow_cheapest_paths():
+    transfer_costs = TransferCosts(MARKETS, default_cost=None, routes=ROUTES)
+    _, next_hops = transfer_costs.get_paths("Oil")
+    # two 1% hops are cheaper than the direct 5% route
+    assert transfer_costs.get_route(next_hops, 0, 2) == ["US", "UK", "EU"]
+    # the direct route is one way only
+    assert transfer_costs.get_route(next_hops, 2, 0) == ["EU", "UK", "US"]
+
+    distances, next_hops = transfer_costs.get_paths("Gold")
+    assert transfer_costs.get_route(next_hops, 0, 2) == ["US", "EU"]
+    assert distances[0, 2] == pytest.approx(distance(0.5))
+    assert np.isinf(distances[0, 3]) and np.isinf(distances[3, 0])
+
+
+def test_assets_with_the_same_routes_share_paths():
+    transfer_costs = TransferCosts(MARKETS, default_cost=None, routes=ROUTES)
+    assert transfer_costs.get_paths("Oil")[0] is transfer_costs.get_paths("Corn")[0]
+    assert transfer_costs.get_paths("Oil")[0] is not transfer_costs.get_paths("Gold")[0]
+
+
+def test_default_cost_applies_to_routes_not_configured():
+    transfer_costs = TransferCosts(MARKETS, default_cost=2.0, routes=ROUTES)
+    distances, _ = transfer_costs.get_paths("Oil")
+    assert distances[0, 3] == pytest.approx(distance(2.0))
+    assert distances[0, 2] == pytest.approx(2 * distance(1.0))
+
+
+def test_costs_outside_of_percent_range_are_rejected():
+    with pytest.raises(ValueError):
+        TransferCosts(MARKETS, routes=[{"from": "US", "to": "UK", "cost": 100}])
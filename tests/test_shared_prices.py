@@ -0,0 +1,116 @@
+"""Sequence lock of generator's shared prices: readers never return a record
+mixing fields of different updates."""
+import multiprocessing
+import secrets
+
+import numpy as np
+import pytest
+
+from benchmarks._loader import load_generator_module
+
+
+shared_prices_module = load_generator_module("core.shared_prices")
+SharedPrices = shared_prices_module.SharedPrices
+
+
+@pytest.fixture
+def shared_prices():
+    shared_prices = SharedPrices.create(f"test_prices_{secrets.token_hex(4)}",
+                                        assets=["Copper", "Oil"], markets=["US", "UK"])
+    shared_prices.records[["price", "spread", "version", "generated_at"]] = (1.0, 1.0, 1, 1.0)
+    shared_prices.publish()
+    yield shared_prices
+    shared_prices.segment.close()
+    shared_prices.unlink()
+
+
+def write(shared_prices, records, pair_id: int, value: float, finish: bool = True) -> None:
+    """Writes `value` to all fields of the pair, as the price engine does"""
+    pairs_ids = np.array([pair_id])
+    shared_prices.begin_write(pairs_ids)
+    records[pair_id] = (shared_prices.seqs[pair_id], value, value, int(value), value)
+    if finish:
+        shared_prices.end_write(pairs_ids)
+
+
+class WrittenWhileRead:
+    """Stands in for records of shared prices: the first copy of a record
+    taken by a reader is followed by a write of the pair, so the copy is
+    torn or outdated by the time reader checks the sequence"""
+
+    def __init__(self, shared_prices, write_next):
+        self.records = shared_prices.records
+        self.write_next = write_next
+
+    def __getitem__(self, pair_id):
+        record = self.records[pair_id].copy()
+        if self.write_next is not None:
+            write_next, self.write_next = self.write_next, None
+            write_next()
+        return record
+
+
+def test_read_retries_record_written_meanwhile(shared_prices):
+    records = shared_prices.records
+    shared_prices.records = WrittenWhileRead(
+        shared_prices, lambda: write(shared_prices, records, 1, 2.0))
+
+    assert shared_prices.read(1) == (2.0, 2.0, 2, 2.0)
+
+
+def test_read_waits_for_write_in_progress(shared_prices):
+    write(shared_prices, shared_prices.records, 1, 2.0, finish=False)
+    shared_prices.records = WrittenWhileRead(
+        shared_prices, lambda: shared_prices.end_write(np.array([1])))
+
+    assert shared_prices.read(1) == (2.0, 2.0, 2, 2.0)
+
+
+def test_read_fails_if_writer_stopped_mid_update(shared_prices):
+    write(shared_prices, shared_prices.records, 1, 2.0, finish=False)
+
+    with pytest.raises(shared_prices_module.SharedPricesError):
+        shared_prices.read(1, timeout_s=0.01)
+
+
+def test_read_many_rereads_only_torn_records(shared_prices):
+    records = shared_prices.records
+    shared_prices.records = WrittenWhileRead(
+        shared_prices, lambda: write(shared_prices, records, 2, 3.0))
+    # `read_many` copies records of all pairs at once, the first copy is torn
+    records_copy = shared_prices.read_many(np.arange(4))
+
+    assert records_copy["price"].tolist() == [1.0, 1.0, 3.0, 1.0]
+    assert records_copy["version"].tolist() == [1, 1, 3, 1]
+
+
+def write_continuously(shared_prices, pairs_ids, stop) -> None:
+    value = 1.0
+    while not stop.is_set():
+        value += 1
+        shared_prices.begin_write(pairs_ids)
+        for pair_id in pairs_ids:
+            shared_prices.records[pair_id] = (shared_prices.seqs[pair_id], value, value,
+                                              int(value), value)
+        shared_prices.end_write(pairs_ids)
+
+
+def test_reads_are_consistent_while_another_process_writes(shared_prices):
+    context = multiprocessing.get_context("fork")
+    stop = context.Event()
+    pairs_ids = np.arange(shared_prices.pairs_count)
+    writer = context.Process(target=write_continuously,
+                             args=(shared_prices, pairs_ids, stop), daemon=True)
+    writer.start()
+    try:
+        reads = 0
+        while reads < 20000:
+            price, spread, version, generated_at = shared_prices.read(reads % len(pairs_ids))
+            assert price == spread == version == generated_at
+            records = shared_prices.read_many(pairs_ids)
+            assert (records["price"] == records["spread"]).all()
+            assert (records["price"] == records["version"]).all()
+            reads += 1
+    finally:
+        stop.set()
+        writer.join(timeout=5)
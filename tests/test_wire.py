@@ -0,0 +1,87 @@
+"""Quotes encoded by the generator, as JSON or binary, decode to the same
+quotes in the analyzer."""
+import struct
+
+import numpy as np
+import pytest
+
+from benchmarks._loader import load_analyzer_module, load_generator_module
+from benchmarks._universe import write_price_config
+
+
+wire = load_analyzer_module("utils.wire")
+generator_wire = load_generator_module("utils.wire")
+AssetsManager = load_generator_module("core.assets_manager").AssetsManager
+QuotesCache = load_generator_module("core.quotes_cache").QuotesCache
+
+
+@pytest.fixture(scope="module")
+def assets_manager(tmp_path_factory):
+    config_dir = tmp_path_factory.mktemp("price_config")
+    return AssetsManager(write_price_config(str(config_dir), assets_count=5, markets_count=3))
+
+
+def encode_binary(assets_manager, pairs_ids, records=None) -> bytes:
+    if records is None:
+        records = assets_manager.get_prices_records(pairs_ids)
+    return generator_wire.encode_quotes(assets_manager.assets, assets_manager.markets,
+                                        pairs_ids, records)
+
+
+def get_expected(assets_manager, pairs_ids) -> list:
+    return [assets_manager.get_asset_price(pair_id).model_dump(exclude={"id"})
+            for pair_id in pairs_ids]
+
+
+def dump(quotes) -> list:
+    return [quote.model_dump() for quote in quotes]
+
+
+@pytest.mark.parametrize("pairs_ids", [[0], [14, 3, 7], list(range(15))])
+def test_json_and_binary_quotes_decode_to_generator_prices(assets_manager, pairs_ids):
+    quotes_cache = QuotesCache(assets_manager)
+    expected = get_expected(assets_manager, pairs_ids)
+
+    assert dump(wire.decode_json_quotes(quotes_cache.get_many(pairs_ids))) == expected
+    assert dump(wire.decode_quotes(encode_binary(assets_manager, pairs_ids))) == expected
+
+
+def test_binary_quotes_list_only_names_of_included_pairs(assets_manager):
+    content = encode_binary(assets_manager, [4])
+    _, assets_count, markets_count, quotes_count, _ = wire.HEADER.unpack_from(content)
+
+    assert (assets_count, markets_count, quotes_count) == (1, 1, 1)
+    assert len(content) < len(encode_binary(assets_manager, list(range(15))))
+
+
+def test_missing_stamps_decode_to_none(assets_manager):
+    records = assets_manager.get_prices_records([0, 1])
+    records["version"] = [-1, 5]
+    records["generated_at"] = [100.0, np.nan]
+    first, second = wire.decode_quotes(encode_binary(assets_manager, [0, 1], records))
+
+    assert (first.version, first.generated_at) == (None, 100.0)
+    assert (second.version, second.generated_at) == (5, None)
+
+
+@pytest.mark.parametrize("corrupt, error", [
+    (lambda content: content[:wire.HEADER.size - 1], "truncated"),
+    (lambda content: b"QTS0" + content[4:], "Unknown binary quotes format"),
+    (lambda content: content[:-1], "does not match their header"),
+    (lambda content: content + b"\0" * wire.QUOTE.size, "does not match their header"),
+])
+def test_malformed_binary_quotes_are_rejected(assets_manager, corrupt, error):
+    with pytest.raises(ValueError, match=error):
+        wire.decode_quotes(corrupt(encode_binary(assets_manager, [0, 4])))
+
+
+def test_binary_quotes_with_unknown_names_are_rejected():
+    names = b"Oil\0US"
+    content = (wire.HEADER.pack(wire.MAGIC, 1, 1, 1, len(names)) + names
+               + wire.QUOTE.pack(1, 0, 100.0, 1.0, 1, 1.0))
+
+    with pytest.raises(ValueError, match="unknown names"):
+        wire.decode_quotes(content)
+    with pytest.raises(ValueError, match="Number of names"):
+        wire.decode_quotes(struct.pack("<4sIIII", wire.MAGIC, 2, 1, 1, len(names))
+                           + content[wire.HEADER.size:])